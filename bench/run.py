@@ -0,0 +1,278 @@
+"""
+Benchmarks for python-gdsii hot paths.
+
+Generates synthetic libraries and times loading, saving, raw record
+iteration, boolean operations, circle generation and 2-opt element
+ordering. Results are reported as time, throughput and peak Python
+memory, and can be stored as a baseline and compared against it later::
+
+    python -m bench.run --save-baseline
+    python -m bench.run --scale 10 --compare
+
+Timings depend on the machine, so the baseline is not part of the
+source tree. ``--compare`` without a baseline stores the results as the
+baseline for later runs, which is what ``make bench`` does on its first
+run.
+
+Exit status is 1 if any benchmark is slower than the baseline by more
+than the allowed tolerance.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from gdsii import record, tags
+from gdsii.elements import ARef, Boundary, Path, RaithCircle, SRef
+from gdsii.library import Library
+from gdsii.record import Record
+from gdsii.structure import Structure
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# number of elements of each kind at --scale 1
+SIZES = {
+    'boundaries': 20000,
+    'paths': 10000,
+    'circles': 10000,
+    'srefs': 2000,
+    'depth': 6,
+    'polygons': 400,
+    'circle_calls': 2000,
+    'two_opt_points': 20000,
+}
+
+def make_library(boundaries, paths, circles, srefs, depth):
+    """
+    Return a synthetic library. The leaf cell holds `boundaries`,
+    `paths` and `circles` elements, and `depth` levels of cells above
+    it reference the level below through SREFs with magnification and
+    rotation (REAL8 heavy) and AREFs.
+    """
+    lib = Library(5, b'BENCH.DB', 1e-9, 0.001)
+
+    leaf = Structure(b'leaf')
+    for i in range(boundaries):
+        x, y = (i % 1000) * 100, (i // 1000) * 100
+        leaf.append(Boundary(i % 64, 0, [(x, y), (x + 50, y), (x + 50, y + 50),
+            (x, y + 50), (x, y)]))
+    for i in range(paths):
+        x, y = (i % 1000) * 100, (i // 1000) * 100 + 50
+        path = Path(64 + i % 16, 0, [(x, y), (x + 30, y), (x + 30, y + 30), (x + 60, y + 40)])
+        path.path_type = 0
+        path.width = 10
+        leaf.append(path)
+    for i in range(circles):
+        x, y = (i % 1000) * 100, (i // 1000) * 100
+        leaf.append(RaithCircle(80, 1000, (x, y), 20))
+    lib.append(leaf)
+
+    child = leaf
+    for level in range(depth):
+        cell = Structure(('level%d' % level).encode())
+        for i in range(srefs // max(depth, 1)):
+            sref = SRef(child.name, [(i * 1000, level * 1000)])
+            sref.strans = 0
+            sref.mag = 1.0 + i * 1e-3
+            sref.angle = (i * 7.5) % 360.0
+            cell.append(sref)
+        cell.append(ARef(child.name, 10, 10, [(0, 0), (100000, 0), (0, 100000)]))
+        lib.append(cell)
+        child = cell
+    return lib
+
+def save_bytes(lib):
+    stream = io.BytesIO()
+    lib.save(stream)
+    return stream.getvalue()
+
+def make_polygons(count):
+    from gdsii import utils
+    polys = []
+    for i in range(count):
+        polys.append(utils.rect(100, 60) + utils.v((i % 20) * 70, (i // 20) * 50))
+    return polys
+
+class Benchmark(object):
+    """A named benchmark: `setup` returns the argument for `run`."""
+    def __init__(self, name, setup, run, units):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.units = units
+
+def benchmarks(sizes):
+    state = {}
+
+    def library():
+        if 'lib' not in state:
+            state['lib'] = make_library(sizes['boundaries'], sizes['paths'],
+                    sizes['circles'], sizes['srefs'], sizes['depth'])
+        return state['lib']
+
+    def data():
+        if 'data' not in state:
+            state['data'] = save_bytes(library())
+        return state['data']
+
+    def count_elements(lib):
+        return sum(len(struc) for struc in lib)
+
+    def run_iterate(buf):
+        count = 0
+        for rec in Record.iterate(io.BytesIO(buf)):
+            count += 1
+        return count
+
+    def run_reader(buf):
+        gen = record.Reader(io.BytesIO(buf))
+        count = 1
+        while gen.advance() != tags.ENDLIB:
+            count += 1
+        return count
+
+    def run_booleans(polys):
+        from gdsii import utils
+        half = len(polys) // 2
+        shifted = [p + utils.v(35, 25) for p in polys[half:]]
+        out = utils.unions(polys[:half], shifted)
+        out += utils.differences(polys[:half], shifted)
+        out += utils.xors(polys[:half], shifted)
+        return len(polys)
+
+    def run_circles(count):
+        from gdsii import utils
+        for i in range(count):
+            utils.circle(10 + i % 100)
+        return count
+
+    def make_points():
+        import numpy
+        from gdsii import ordering
+        points = numpy.random.RandomState(1).rand(sizes['two_opt_points'], 2)
+        return points, ordering.spatial_order(points)
+
+    def run_two_opt(arg):
+        from gdsii import ordering
+        points, order = arg
+        ordering.two_opt(points, order, window=32)
+        return len(points)
+
+    return [
+        Benchmark('save', library, lambda lib: (save_bytes(lib), count_elements(lib))[1], 'elements'),
+        Benchmark('load', data, lambda buf: count_elements(Library.load(io.BytesIO(buf))), 'elements'),
+        Benchmark('iterate', data, run_iterate, 'records'),
+        Benchmark('reader', data, run_reader, 'records'),
+        Benchmark('booleans', lambda: make_polygons(sizes['polygons']), run_booleans, 'polygons'),
+        Benchmark('circle', lambda: sizes['circle_calls'], run_circles, 'circles'),
+        Benchmark('two_opt', make_points, run_two_opt, 'points'),
+    ]
+
+def measure(bench, repeat):
+    """Return dict with best time, throughput and peak traced memory."""
+    arg = bench.setup()
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        count = bench.run(arg)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    # memory is measured in a separate run, tracing slows everything down
+    tracemalloc.start()
+    bench.run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'time': best,
+        'count': count,
+        'throughput': count / best if best else float('inf'),
+        'units': bench.units,
+        'peak_memory': peak,
+    }
+
+def compare(results, baseline, tolerance):
+    """Print comparison with `baseline`, return names of regressed benchmarks."""
+    regressed = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        if base['count'] != result['count']:
+            print('%-10s baseline has different size, not compared' % name)
+            continue
+        ratio = result['time'] / base['time']
+        mem_ratio = result['peak_memory'] / float(max(base['peak_memory'], 1))
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print('%-10s time x%.2f  memory x%.2f%s' % (name, ratio, mem_ratio, flag))
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--scale', type=float, default=1.0,
+            help='multiply all sizes by this factor')
+    parser.add_argument('--repeat', type=int, default=5,
+            help='number of timed runs, best is reported')
+    parser.add_argument('--only', action='append', default=[],
+            help='run only the named benchmark (can be repeated)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+            help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true',
+            help='store results as the new baseline')
+    parser.add_argument('--compare', action='store_true',
+            help='compare results with the baseline, or save them if there is none')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+            help='allowed slowdown before reporting a regression (default: %(default)s)')
+    for key in sorted(SIZES):
+        parser.add_argument('--' + key.replace('_', '-'), type=int, default=None,
+                help='override size (default: %d at scale 1)' % SIZES[key])
+    args = parser.parse_args(argv)
+
+    sizes = {}
+    for key, value in SIZES.items():
+        override = getattr(args, key)
+        if override is not None:
+            sizes[key] = override
+        elif key == 'depth':
+            sizes[key] = value
+        else:
+            sizes[key] = max(1, int(value * args.scale))
+
+    print('python %s, speedups: %s' % (platform.python_version(),
+        'yes' if record._speedups is not None else 'no'))
+    results = {}
+    for bench in benchmarks(sizes):
+        if args.only and bench.name not in args.only:
+            continue
+        result = measure(bench, args.repeat)
+        results[bench.name] = result
+        print('%-10s %9.3f s  %12.0f %s/s  peak %8.1f MiB' % (bench.name,
+            result['time'], result['throughput'], result['units'],
+            result['peak_memory'] / 2.0**20))
+
+    status = 0
+    save = args.save_baseline
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print('no baseline at %s, saving results as baseline' % args.baseline)
+            save = True
+        else:
+            with open(args.baseline) as stream:
+                baseline = json.load(stream)
+            if compare(results, baseline, args.tolerance):
+                status = 1
+    if save:
+        with open(args.baseline, 'w') as stream:
+            json.dump({'sizes': sizes, 'results': results}, stream, indent=2, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
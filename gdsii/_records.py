@@ -15,13 +15,36 @@
 #   You should have received a copy of the GNU Lesser General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
-from . import record, tags
+from . import exceptions, record, tags
+import array
+import sys
+
+_LITTLE_ENDIAN = sys.byteorder == 'little'
 
 class AbstractRecord(object):
+    # tag of the first record handled by this object
+    gds_record = None
+    # if true the record can be absent
+    optional = False
+    # if set, called to get a value for the variable when record is absent
+    default = None
+
     def __init__(self, variable):
         self.variable = variable
 
     def read(self, instance, gen):
+        if gen.tag == self.gds_record:
+            self.decode(instance, gen)
+        elif self.default is not None:
+            setattr(instance, self.variable, self.default())
+        elif not self.optional:
+            gen.check_tag(self.gds_record)
+
+    def decode(self, instance, gen):
+        """
+        Called when `gen` is positioned at :attr:`gds_record`.
+        Should advance `gen` past all records handled by this object.
+        """
         raise NotImplementedError
 
     def save(self, instance, stream):
@@ -40,30 +63,18 @@ class SimpleRecord(AbstractRecord):
         AbstractRecord.__init__(self, variable)
         self.gds_record = gds_record
 
-    def read(self, instance, gen):
-        rec = gen.current
-        rec.check_tag(self.gds_record)
-        rec.check_size(1)
-        setattr(instance, self.variable, rec.data[0])
-        gen.read_next()
+    def decode(self, instance, gen):
+        data = gen.data
+        if len(data) != 1:
+            raise exceptions.DataSizeError(gen.tag)
+        setattr(instance, self.variable, data[0])
+        gen.advance()
 
     def save(self, instance, stream):
         record.Record(self.gds_record, (getattr(instance, self.variable),)).save(stream)
 
 class SimpleOptionalRecord(SimpleRecord):
-    def optional_read(self, instance, unused_gen, rec):
-        """
-        Called when optional tag is found. `rec` contains that tag.
-        `gen` is advanced to next record befor calling this function.
-        """
-        rec.check_size(1)
-        setattr(instance, self.variable, rec.data[0])
-
-    def read(self, instance, gen):
-        rec = gen.current
-        if rec.tag == self.gds_record:
-            gen.read_next()
-            self.optional_read(instance, gen, rec)
+    optional = True
 
     def save(self, instance, stream):
         data = getattr(instance, self.variable, None)
@@ -72,8 +83,9 @@ class SimpleOptionalRecord(SimpleRecord):
 
 class OptionalWholeRecord(SimpleOptionalRecord):
     """Class for records that need to store all data (not data[0])."""
-    def optional_read(self, instance, unused_gen, rec):
-        setattr(instance, self.variable, rec.data)
+    def decode(self, instance, gen):
+        setattr(instance, self.variable, gen.data)
+        gen.advance()
 
     def save(self, instance, stream):
         data = getattr(instance, self.variable, None)
@@ -81,16 +93,19 @@ class OptionalWholeRecord(SimpleOptionalRecord):
             record.Record(self.gds_record, data).save(stream)
 
 class PropertiesRecord(AbstractRecord):
-    def read(self, instance, gen):
-        rec = gen.current
+    gds_record = tags.PROPATTR
+    optional = True
+    default = list
+
+    def decode(self, instance, gen):
         props = []
-        while rec.tag == tags.PROPATTR:
-            rec.check_size(1)
-            propattr = rec.data[0]
-            rec = gen.read_next()
-            rec.check_tag(tags.PROPVALUE)
-            props.append((propattr, rec.data))
-            rec = gen.read_next()
+        while gen.tag == tags.PROPATTR:
+            gen.check_size(1)
+            propattr = gen.data[0]
+            gen.advance()
+            gen.check_tag(tags.PROPVALUE)
+            props.append((propattr, gen.data))
+            gen.advance()
         setattr(instance, self.variable, props)
 
     def save(self, instance, stream):
@@ -101,39 +116,56 @@ class PropertiesRecord(AbstractRecord):
                 record.Record(tags.PROPVALUE, propvalue).save(stream)
 
 class XYRecord(SimpleRecord):
-    def read(self, instance, gen):
-        rec = gen.current
-        rec.check_tag(self.gds_record)
-        setattr(instance, self.variable, rec.points)
-        gen.read_next()
+    def decode(self, instance, gen):
+        setattr(instance, self.variable, gen.points)
+        gen.advance()
 
     def save(self, instance, stream):
         pts = getattr(instance, self.variable)
         record.Record(self.gds_record, points=pts).save(stream)
 
+class PackedXYRecord(SimpleRecord):
+    """
+    XY record stored as a flat :class:`array.array` of 32-bit integers,
+    which is saved with a single byte copy.
+    """
+    def decode(self, instance, gen):
+        data = array.array('i', gen.data)
+        if not data or len(data) % 2:
+            raise exceptions.DataSizeError(gen.tag)
+        setattr(instance, self.variable, data)
+        gen.advance()
+
+    def save(self, instance, stream):
+        data = getattr(instance, self.variable)
+        if _LITTLE_ENDIAN:
+            data = array.array('i', data)
+            data.byteswap()
+        packed = data.tobytes()
+        stream.write(record._RECORD_HEADER_FMT.pack(len(packed) + 4, self.gds_record))
+        stream.write(packed)
+
 class StringRecord(SimpleRecord):
-    def read(self, instance, gen):
-        rec = gen.current
-        rec.check_tag(self.gds_record)
-        setattr(instance, self.variable, rec.data)
-        gen.read_next()
+    def decode(self, instance, gen):
+        setattr(instance, self.variable, gen.data)
+        gen.advance()
 
     def save(self, instance, stream):
         record.Record(self.gds_record, getattr(instance, self.variable)).save(stream)
 
 class ColRowRecord(AbstractRecord, SecondVar):
+    gds_record = tags.COLROW
+
     def __init__(self, variable1, variable2):
         AbstractRecord.__init__(self, variable1)
         SecondVar.__init__(self, variable2)
 
-    def read(self, instance, gen):
-        rec = gen.current
-        rec.check_tag(tags.COLROW)
-        rec.check_size(2)
-        cols, rows = rec.data
+    def decode(self, instance, gen):
+        gen.check_size(2)
+        cols, rows = gen.data
         setattr(instance, self.variable, cols)
         setattr(instance, self.variable2, rows)
-        gen.read_next()
+        gen.advance()
 
     def save(self, instance, stream):
         col = getattr(instance, self.variable)
@@ -145,13 +177,11 @@ class TimestampsRecord(SimpleRecord, SecondVar):
         SimpleRecord.__init__(self, variable1, gds_record)
         SecondVar.__init__(self, variable2)
 
-    def read(self, instance, gen):
-        rec = gen.current
-        rec.check_tag(self.gds_record)
-        mod_time, acc_time = rec.times
+    def decode(self, instance, gen):
+        mod_time, acc_time = gen.times
         setattr(instance, self.variable, mod_time)
         setattr(instance, self.variable2, acc_time)
-        gen.read_next()
+        gen.advance()
 
     def save(self, instance, stream):
         mod_time = getattr(instance, self.variable)
@@ -162,8 +192,9 @@ class STransRecord(OptionalWholeRecord):
     mag = SimpleOptionalRecord('mag', tags.MAG)
     angle = SimpleOptionalRecord('angle', tags.ANGLE)
 
-    def optional_read(self, instance, gen, rec):
-        setattr(instance, self.variable, rec.data)
+    def decode(self, instance, gen):
+        setattr(instance, self.variable, gen.data)
+        gen.advance()
         self.mag.read(instance, gen)
         self.angle.read(instance, gen)
 
@@ -175,8 +206,9 @@ class STransRecord(OptionalWholeRecord):
             self.angle.save(instance, stream)
 
 class ACLRecord(SimpleOptionalRecord):
-    def optional_read(self, instance, unused_gen, rec):
-        setattr(instance, self.variable, rec.acls)
+    def decode(self, instance, gen):
+        setattr(instance, self.variable, gen.acls)
+        gen.advance()
 
     def save(self, instance, stream):
         data = getattr(instance, self.variable, None)
@@ -188,17 +220,16 @@ class FormatRecord(SimpleOptionalRecord, SecondVar):
         SimpleOptionalRecord.__init__(self, variable1, gds_record)
         SecondVar.__init__(self, variable2)
 
-    def optional_read(self, instance, gen, rec):
-        SimpleOptionalRecord.optional_read(self, instance, gen, rec)
-        cur_rec = gen.curent
-        if cur_rec.tag == tags.MASK:
+    def decode(self, instance, gen):
+        SimpleOptionalRecord.decode(self, instance, gen)
+        if gen.tag == tags.MASK:
             masks = []
-            while cur_rec.tag == tags.MASK:
-                masks.append(cur_rec.data)
-                cur_rec = gen.read_next()
-            cur_rec.check_tag(tags.ENDMASKS)
+            while gen.tag == tags.MASK:
+                masks.append(gen.data)
+                gen.advance()
+            gen.check_tag(tags.ENDMASKS)
             setattr(instance, self.variable2, masks)
-            gen.read_next()
+            gen.advance()
 
     def save(self, instance, stream):
         fmt = getattr(instance, self.variable, None)
@@ -215,16 +246,74 @@ class UnitsRecord(SimpleRecord, SecondVar):
         SimpleRecord.__init__(self, variable1, gds_record)
         SecondVar.__init__(self, variable2)
 
-    def read(self, instance, gen):
-        rec = gen.current
-        rec.check_tag(self.gds_record)
-        rec.check_size(2)
-        unit1, unit2 = rec.data
+    def decode(self, instance, gen):
+        gen.check_size(2)
+        unit1, unit2 = gen.data
         setattr(instance, self.variable, unit1)
         setattr(instance, self.variable2, unit2)
-        gen.read_next()
+        gen.advance()
 
     def save(self, instance, stream):
         unit1 = getattr(instance, self.variable)
         unit2 = getattr(instance, self.variable2)
         record.Record(self.gds_record, (unit1, unit2)).save(stream)
+
+class DecoderTable(object):
+    """
+    State table for reading the records described by a sequence of
+    record objects in a single pass. Records are dispatched by tag, so
+    absent optional records cost nothing.
+    """
+    __slots__ = ('objs', 'by_tag', 'next_required', 'defaults')
+
+    def __init__(self, objs):
+        self.objs = tuple(objs)
+        count = len(self.objs)
+        self.by_tag = {}
+        for index, obj in enumerate(self.objs):
+            if obj.gds_record in self.by_tag:
+                raise ValueError('duplicate tag in record sequence: %s' % obj)
+            self.by_tag[obj.gds_record] = (index, obj.decode)
+        # next_required[i] is index of the first required object at or after i
+        self.next_required = [count] * (count + 1)
+        for index in range(count - 1, -1, -1):
+            if self.objs[index].optional:
+                self.next_required[index] = self.next_required[index + 1]
+            else:
+                self.next_required[index] = index
+        self.defaults = tuple((index, obj.variable, obj.default)
+                for (index, obj) in enumerate(self.objs) if obj.default is not None)
+
+    def read(self, instance, gen, end_tag):
+        """
+        Read records into `instance` until `end_tag` is found.
+        `gen` should be positioned at the first record, and is left
+        positioned at `end_tag`.
+        """
+        by_tag = self.by_tag
+        next_required = self.next_required
+        pos = 0
+        tag = gen.tag
+        while tag != end_tag:
+            try:
+                index, decode = by_tag[tag]
+            except KeyError:
+                index = -1
+            if index < pos or next_required[pos] < index:
+                self._missing(pos, end_tag, tag)
+            decode(instance, gen)
+            pos = index + 1
+            tag = gen.tag
+        if next_required[pos] != len(self.objs):
+            self._missing(pos, end_tag, tag)
+        for (index, variable, default) in self.defaults:
+            if index >= pos:
+                setattr(instance, variable, default())
+
+    def _missing(self, pos, end_tag, tag):
+        required = self.next_required[pos]
+        if required < len(self.objs):
+            wanted = self.objs[required].gds_record
+        else:
+            wanted = end_tag
+        raise exceptions.MissingRecord('Wanted: %s, got: %s' % (wanted, record._tag_name(tag)))
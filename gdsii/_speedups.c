@@ -0,0 +1,611 @@
+/*
+ * Optional C implementation of the record codecs from gdsii.record.
+ * Every function here must behave exactly like its pure Python
+ * counterpart, including the exceptions raised.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+#include <math.h>
+
+/* GDSII data types, see gdsii.types */
+#define NODATA 0
+#define BITARRAY 1
+#define INT2 2
+#define INT4 3
+#define REAL8 5
+#define ASCII 6
+
+#define ENDSTR 0x0700
+#define ENDLIB 0x0400
+
+static PyObject *FormatError;
+static PyObject *IncorrectDataSize;
+static PyObject *UnsupportedTagType;
+static PyObject *StructError;
+
+static uint16_t
+get_u16(const unsigned char *p)
+{
+    return (uint16_t)((p[0] << 8) | p[1]);
+}
+
+static uint32_t
+get_u32(const unsigned char *p)
+{
+    return ((uint32_t)p[0] << 24) | ((uint32_t)p[1] << 16) |
+        ((uint32_t)p[2] << 8) | (uint32_t)p[3];
+}
+
+static uint64_t
+get_u64(const unsigned char *p)
+{
+    return ((uint64_t)get_u32(p) << 32) | (uint64_t)get_u32(p + 4);
+}
+
+static void
+put_u16(unsigned char *p, uint16_t v)
+{
+    p[0] = (unsigned char)(v >> 8);
+    p[1] = (unsigned char)v;
+}
+
+static void
+put_u32(unsigned char *p, uint32_t v)
+{
+    p[0] = (unsigned char)(v >> 24);
+    p[1] = (unsigned char)(v >> 16);
+    p[2] = (unsigned char)(v >> 8);
+    p[3] = (unsigned char)v;
+}
+
+static void
+put_u64(unsigned char *p, uint64_t v)
+{
+    put_u32(p, (uint32_t)(v >> 32));
+    put_u32(p + 4, (uint32_t)v);
+}
+
+static PyObject *
+unsupported_tag_type(long tag_type)
+{
+    PyObject *arg = PyLong_FromLong(tag_type);
+    if (arg != NULL) {
+        PyErr_SetObject(UnsupportedTagType, arg);
+        Py_DECREF(arg);
+    }
+    return NULL;
+}
+
+/*
+ * Parsing
+ */
+
+static PyObject *
+parse_bitarray(const unsigned char *p, Py_ssize_t len)
+{
+    if (len != 2) {
+        PyErr_SetString(IncorrectDataSize, "BITARRAY");
+        return NULL;
+    }
+    return PyLong_FromLong(get_u16(p));
+}
+
+static PyObject *
+parse_int2(const unsigned char *p, Py_ssize_t len)
+{
+    Py_ssize_t i, n;
+    PyObject *result;
+
+    if (!len || (len % 2)) {
+        PyErr_SetString(IncorrectDataSize, "INT2");
+        return NULL;
+    }
+    n = len / 2;
+    result = PyTuple_New(n);
+    if (result == NULL)
+        return NULL;
+    for (i = 0; i < n; i++) {
+        PyObject *item = PyLong_FromLong((int16_t)get_u16(p + 2 * i));
+        if (item == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(result, i, item);
+    }
+    return result;
+}
+
+static PyObject *
+parse_int4(const unsigned char *p, Py_ssize_t len)
+{
+    Py_ssize_t i, n;
+    PyObject *result;
+
+    if (!len || (len % 4)) {
+        PyErr_SetString(IncorrectDataSize, "INT4");
+        return NULL;
+    }
+    n = len / 4;
+    result = PyTuple_New(n);
+    if (result == NULL)
+        return NULL;
+    for (i = 0; i < n; i++) {
+        PyObject *item = PyLong_FromLong((int32_t)get_u32(p + 4 * i));
+        if (item == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(result, i, item);
+    }
+    return result;
+}
+
+/* same as gdsii.record._int_to_real() */
+static double
+int_to_real(uint64_t num)
+{
+    int sgn = (num & 0x8000000000000000ULL) ? -1 : 1;
+    uint64_t mant = num & 0x00ffffffffffffffULL;
+    int exp = (int)((num >> 56) & 0x7f);
+    return ldexp(sgn * (double)mant, 4 * (exp - 64) - 56);
+}
+
+static PyObject *
+parse_real8(const unsigned char *p, Py_ssize_t len)
+{
+    Py_ssize_t i, n;
+    PyObject *result;
+
+    if (!len || (len % 8)) {
+        PyErr_SetString(IncorrectDataSize, "REAL8");
+        return NULL;
+    }
+    n = len / 8;
+    result = PyTuple_New(n);
+    if (result == NULL)
+        return NULL;
+    for (i = 0; i < n; i++) {
+        PyObject *item = PyFloat_FromDouble(int_to_real(get_u64(p + 8 * i)));
+        if (item == NULL) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(result, i, item);
+    }
+    return result;
+}
+
+static PyObject *
+parse_ascii(const unsigned char *p, Py_ssize_t len)
+{
+    if (!len) {
+        PyErr_SetString(IncorrectDataSize, "ASCII");
+        return NULL;
+    }
+    if (p[len - 1] == '\0')
+        len--;
+    return PyBytes_FromStringAndSize((const char *)p, len);
+}
+
+static PyObject *
+parse_data(int tag_type, const unsigned char *p, Py_ssize_t len)
+{
+    switch (tag_type) {
+    case NODATA:
+        Py_RETURN_NONE;
+    case BITARRAY:
+        return parse_bitarray(p, len);
+    case INT2:
+        return parse_int2(p, len);
+    case INT4:
+        return parse_int4(p, len);
+    case REAL8:
+        return parse_real8(p, len);
+    case ASCII:
+        return parse_ascii(p, len);
+    }
+    return unsupported_tag_type(tag_type);
+}
+
+#define DEFINE_PARSE_WRAPPER(name)                                  \
+static PyObject *                                                   \
+py_##name(PyObject *self, PyObject *args)                           \
+{                                                                   \
+    Py_buffer buf;                                                  \
+    PyObject *result;                                               \
+    if (!PyArg_ParseTuple(args, "y*", &buf))                        \
+        return NULL;                                                \
+    result = name((const unsigned char *)buf.buf, buf.len);         \
+    PyBuffer_Release(&buf);                                         \
+    return result;                                                  \
+}
+
+DEFINE_PARSE_WRAPPER(parse_bitarray)
+DEFINE_PARSE_WRAPPER(parse_int2)
+DEFINE_PARSE_WRAPPER(parse_int4)
+DEFINE_PARSE_WRAPPER(parse_real8)
+DEFINE_PARSE_WRAPPER(parse_ascii)
+
+/*
+ * Packing
+ */
+
+/* Convert item like int() does and check range. Returns -1 on error. */
+static int
+item_to_long(PyObject *item, long min, long max, const char *fmt, long *out)
+{
+    PyObject *num;
+    long value;
+    int overflow;
+
+    if (PyLong_Check(item)) {
+        Py_INCREF(item);
+        num = item;
+    }
+    else {
+        num = PyNumber_Long(item);
+        if (num == NULL)
+            return -1;
+    }
+    value = PyLong_AsLongAndOverflow(num, &overflow);
+    Py_DECREF(num);
+    if (value == -1 && PyErr_Occurred())
+        return -1;
+    if (overflow || value < min || value > max) {
+        PyErr_Format(StructError, "'%s' format requires %ld <= number <= %ld",
+                fmt, min, max);
+        return -1;
+    }
+    *out = value;
+    return 0;
+}
+
+static PyObject *
+pack_ints(PyObject *data, int size, long min, long max, const char *fmt)
+{
+    PyObject *seq, *result;
+    Py_ssize_t i, n;
+    unsigned char *p;
+
+    seq = PySequence_Fast(data, "argument must be a sequence");
+    if (seq == NULL)
+        return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+    result = PyBytes_FromStringAndSize(NULL, n * size);
+    if (result == NULL) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+    p = (unsigned char *)PyBytes_AS_STRING(result);
+    for (i = 0; i < n; i++) {
+        long value;
+        if (item_to_long(PySequence_Fast_GET_ITEM(seq, i), min, max, fmt, &value) < 0) {
+            Py_DECREF(seq);
+            Py_DECREF(result);
+            return NULL;
+        }
+        if (size == 2)
+            put_u16(p + 2 * i, (uint16_t)(int16_t)value);
+        else
+            put_u32(p + 4 * i, (uint32_t)(int32_t)value);
+    }
+    Py_DECREF(seq);
+    return result;
+}
+
+static PyObject *
+py_pack_int2(PyObject *self, PyObject *data)
+{
+    return pack_ints(data, 2, -32768L, 32767L, "h");
+}
+
+static PyObject *
+py_pack_int4(PyObject *self, PyObject *data)
+{
+    return pack_ints(data, 4, -2147483647L - 1, 2147483647L, "l");
+}
+
+/* same as gdsii.record._real_to_int(), returns -1 on error */
+static int
+real_to_int(double fnum, uint64_t *out)
+{
+    uint64_t ieee, sign, ieee_mant, ieee_mant_full, ieee_mant_comp;
+    long ieee_exp, unb_ieee_exp, exp16, rest, exp16_biased;
+
+    memcpy(&ieee, &fnum, sizeof(ieee));
+    sign = ieee & 0x8000000000000000ULL;
+    ieee_exp = (long)((ieee >> 52) & 0x7ff);
+    ieee_mant = ieee & 0xfffffffffffffULL;
+
+    if (ieee_exp == 0) {
+        *out = 0;
+        return 0;
+    }
+
+    unb_ieee_exp = ieee_exp - 1023;
+    ieee_mant_full = (ieee_mant + 0x10000000000000ULL) << 3;
+
+    /* floor division, as divmod() in Python */
+    exp16 = (unb_ieee_exp + 1) / 4;
+    rest = (unb_ieee_exp + 1) % 4;
+    if (rest < 0) {
+        rest += 4;
+        exp16 -= 1;
+    }
+    if (rest) {
+        rest = 4 - rest;
+        exp16 += 1;
+    }
+    ieee_mant_comp = ieee_mant_full >> rest;
+
+    exp16_biased = exp16 + 64;
+
+    if (exp16_biased < -14) {
+        *out = 0;
+        return 0;
+    }
+    else if (exp16_biased < 0) {
+        /* the Python implementation shifts by a negative count here */
+        PyErr_SetString(PyExc_ValueError, "negative shift count");
+        return -1;
+    }
+    else if (exp16_biased > 0x7f) {
+        PyErr_SetString(FormatError, "number is to big for REAL8");
+        return -1;
+    }
+
+    *out = sign | ((uint64_t)exp16_biased << 56) | ieee_mant_comp;
+    return 0;
+}
+
+static PyObject *
+py_pack_real8(PyObject *self, PyObject *data)
+{
+    PyObject *seq, *result;
+    Py_ssize_t i, n;
+    unsigned char *p;
+
+    seq = PySequence_Fast(data, "argument must be a sequence");
+    if (seq == NULL)
+        return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+    result = PyBytes_FromStringAndSize(NULL, n * 8);
+    if (result == NULL) {
+        Py_DECREF(seq);
+        return NULL;
+    }
+    p = (unsigned char *)PyBytes_AS_STRING(result);
+    for (i = 0; i < n; i++) {
+        uint64_t value;
+        double fnum = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(seq, i));
+        if ((fnum == -1.0 && PyErr_Occurred()) || real_to_int(fnum, &value) < 0) {
+            Py_DECREF(seq);
+            Py_DECREF(result);
+            return NULL;
+        }
+        put_u64(p + 8 * i, value);
+    }
+    Py_DECREF(seq);
+    return result;
+}
+
+/*
+ * Record headers
+ */
+
+/* Check record header at p, store record size. Returns -1 on error. */
+static int
+check_header(const unsigned char *p, Py_ssize_t *size)
+{
+    Py_ssize_t data_size = get_u16(p);
+    if (data_size < 4) {
+        PyErr_SetString(IncorrectDataSize, "data size is too small");
+        return -1;
+    }
+    if (data_size % 2) {
+        PyErr_SetString(IncorrectDataSize, "data size is odd");
+        return -1;
+    }
+    *size = data_size;
+    return 0;
+}
+
+static PyObject *
+py_read_record(PyObject *self, PyObject *args)
+{
+    Py_buffer buf;
+    Py_ssize_t pos, size;
+    const unsigned char *p;
+    PyObject *data, *result = NULL;
+    int tag;
+
+    if (!PyArg_ParseTuple(args, "y*n", &buf, &pos))
+        return NULL;
+    if (pos < 0 || buf.len - pos < 4) {
+        PyBuffer_Release(&buf);
+        Py_RETURN_NONE;
+    }
+    p = (const unsigned char *)buf.buf + pos;
+    if (check_header(p, &size) < 0)
+        goto done;
+    if (size > buf.len - pos) {
+        Py_INCREF(Py_None);
+        result = Py_None;
+        goto done;
+    }
+    tag = get_u16(p + 2);
+    data = parse_data(tag & 0xff, p + 4, size - 4);
+    if (data == NULL)
+        goto done;
+    result = Py_BuildValue("(iNn)", tag, data, pos + size);
+done:
+    PyBuffer_Release(&buf);
+    return result;
+}
+
+/* Append (value, count, tag) for counted values, in order of first
+ * appearance, and reset the counts. */
+static int
+flush_counts(PyObject *found, Py_ssize_t *counts, uint16_t *values,
+        Py_ssize_t *nvalues, long tag)
+{
+    Py_ssize_t i;
+    for (i = 0; i < *nvalues; i++) {
+        uint16_t value = values[i];
+        PyObject *entry = Py_BuildValue("(nnl)", (Py_ssize_t)(int16_t)value,
+                counts[value], tag);
+        counts[value] = 0;
+        if (entry == NULL || PyList_Append(found, entry) < 0) {
+            Py_XDECREF(entry);
+            for (i++; i < *nvalues; i++)
+                counts[values[i]] = 0;
+            *nvalues = 0;
+            return -1;
+        }
+        Py_DECREF(entry);
+    }
+    *nvalues = 0;
+    return 0;
+}
+
+static PyObject *
+py_scan(PyObject *self, PyObject *args)
+{
+    Py_buffer buf;
+    Py_ssize_t pos, size, nvalues = 0;
+    PyObject *wanted, *iter, *item, *count_obj = Py_None, *found = NULL, *result = NULL;
+    unsigned char bitmap[8192];
+    const unsigned char *base;
+    long count_tag = -1;
+    Py_ssize_t *counts = NULL;
+    uint16_t *values = NULL;
+
+    if (!PyArg_ParseTuple(args, "y*On|O", &buf, &wanted, &pos, &count_obj))
+        return NULL;
+
+    memset(bitmap, 0, sizeof(bitmap));
+    iter = PyObject_GetIter(wanted);
+    if (iter == NULL)
+        goto done;
+    while ((item = PyIter_Next(iter)) != NULL) {
+        long tag = PyLong_AsLong(item);
+        Py_DECREF(item);
+        if (tag == -1 && PyErr_Occurred())
+            break;
+        if (tag >= 0 && tag <= 0xffff)
+            bitmap[tag >> 3] |= (unsigned char)(1 << (tag & 7));
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred())
+        goto done;
+    if (count_obj != Py_None) {
+        count_tag = PyLong_AsLong(count_obj);
+        if (count_tag == -1 && PyErr_Occurred())
+            goto done;
+        /* one counter per INT2 value, and the values in order of appearance */
+        counts = PyMem_Calloc(0x10000, sizeof(Py_ssize_t));
+        values = PyMem_Malloc(0x10000 * sizeof(uint16_t));
+        if (counts == NULL || values == NULL) {
+            PyErr_NoMemory();
+            goto done;
+        }
+    }
+
+    found = PyList_New(0);
+    if (found == NULL)
+        goto done;
+    base = (const unsigned char *)buf.buf;
+    while (pos >= 0 && buf.len - pos >= 4) {
+        int tag;
+        if (check_header(base + pos, &size) < 0)
+            goto done;
+        if (size > buf.len - pos)
+            break;
+        tag = get_u16(base + pos + 2);
+        if (tag == count_tag) {
+            uint16_t value;
+            if (size < 6) {
+                PyErr_SetString(IncorrectDataSize, "data size is too small");
+                goto done;
+            }
+            value = get_u16(base + pos + 4);
+            if (counts[value]++ == 0)
+                values[nvalues++] = value;
+        }
+        else {
+            if (tag == ENDSTR && nvalues &&
+                    flush_counts(found, counts, values, &nvalues, count_tag) < 0)
+                goto done;
+            if (bitmap[tag >> 3] & (1 << (tag & 7))) {
+                PyObject *entry = Py_BuildValue("(nni)", pos, size, tag);
+                if (entry == NULL || PyList_Append(found, entry) < 0) {
+                    Py_XDECREF(entry);
+                    goto done;
+                }
+                Py_DECREF(entry);
+            }
+        }
+        pos += size;
+        if (tag == ENDLIB)
+            break;
+    }
+    result = Py_BuildValue("(On)", found, pos);
+done:
+    PyMem_Free(counts);
+    PyMem_Free(values);
+    Py_XDECREF(found);
+    PyBuffer_Release(&buf);
+    return result;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"parse_bitarray", py_parse_bitarray, METH_VARARGS, "Parse BITARRAY data."},
+    {"parse_int2", py_parse_int2, METH_VARARGS, "Parse INT2 data."},
+    {"parse_int4", py_parse_int4, METH_VARARGS, "Parse INT4 data."},
+    {"parse_real8", py_parse_real8, METH_VARARGS, "Parse REAL8 data."},
+    {"parse_ascii", py_parse_ascii, METH_VARARGS, "Parse ASCII data."},
+    {"pack_int2", py_pack_int2, METH_O, "Pack INT2 data."},
+    {"pack_int4", py_pack_int4, METH_O, "Pack INT4 data."},
+    {"pack_real8", py_pack_real8, METH_O, "Pack REAL8 data."},
+    {"read_record", py_read_record, METH_VARARGS,
+        "read_record(buffer, pos) -> (tag, data, end) or None if incomplete."},
+    {"scan", py_scan, METH_VARARGS,
+        "scan(buffer, wanted_tags, pos[, count_tag]) -> ([(offset, size, tag), ...], end)."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "gdsii._speedups",
+    "C implementation of GDSII record codecs.",
+    -1,
+    speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    PyObject *exceptions, *struct_module;
+
+    exceptions = PyImport_ImportModule("gdsii.exceptions");
+    if (exceptions == NULL)
+        return NULL;
+    FormatError = PyObject_GetAttrString(exceptions, "FormatError");
+    IncorrectDataSize = PyObject_GetAttrString(exceptions, "IncorrectDataSize");
+    UnsupportedTagType = PyObject_GetAttrString(exceptions, "UnsupportedTagType");
+    Py_DECREF(exceptions);
+    if (FormatError == NULL || IncorrectDataSize == NULL || UnsupportedTagType == NULL)
+        return NULL;
+
+    struct_module = PyImport_ImportModule("struct");
+    if (struct_module == NULL)
+        return NULL;
+    StructError = PyObject_GetAttrString(struct_module, "error");
+    Py_DECREF(struct_module);
+    if (StructError == NULL)
+        return NULL;
+
+    return PyModule_Create(&speedups_module);
+}
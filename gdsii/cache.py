@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.cache` --- on-disk memoization of generated cells
+=============================================================
+
+:class:`Cache` stores results of functions that generate structures or
+polygons in a directory, keyed on the function name and its arguments,
+so that scripts rebuilding many cells only recompute the cells whose
+parameters changed::
+
+    cache = Cache('.gdscache', max_size=2 * 1024**3)
+
+    @cache.memoize
+    def ring_cell(name, r0, r1):
+        ...
+        return struc
+
+    union = cache.memoize(utils.union)
+
+Arguments can be ``None``, numbers, strings, bytes, lists, tuples and
+dictionaries of these, numpy arrays, elements and structures (keyed by
+name and :func:`gdsii.contenthash.local_hash`). Results can be
+structures or lists of structures, stored as GDSII records, and numpy
+arrays or lists and tuples of arrays, stored as ``.npz`` files. Lists of
+arrays with the same dtype and trailing shape, like polygons returned by
+:mod:`gdsii.utils` boolean functions, are stored as one packed array
+with offsets. Structures are returned as they would be loaded from a
+GDSII file, e.g. :class:`gdsii.elements.RaithCircleArray` elements come
+back as :class:`gdsii.elements.RaithCircle` elements.
+
+Values captured by closures and default arguments are keyed like
+arguments, so they must be of these types too. Lambda functions cannot
+be memoized, their names do not tell them apart.
+
+The cache does not know which code a function runs, so pass a new
+`version` to :meth:`Cache.memoize` after changing it, or call
+:meth:`Cache.clear`. When the total size of stored results exceeds
+`max_size`, least recently used results are removed. Requires numpy.
+"""
+from __future__ import absolute_import
+from . import contenthash, elements, exceptions, record, structure, tags
+import functools
+import hashlib
+import os
+import tempfile
+import zipfile
+import numpy
+
+__all__ = ('Cache',)
+
+_DIGEST_SIZE = 20
+_STRUCTURE_SUFFIX = '.gds'
+_STRUCTURES_SUFFIX = '.list.gds'
+_NPZ_SUFFIX = '.npz'
+
+def _feed(hash, value):
+    """Add canonical encoding of `value` to `hash`."""
+    if isinstance(value, (numpy.ndarray, numpy.generic)):
+        value = numpy.ascontiguousarray(value)
+        if value.dtype.hasobject:
+            raise TypeError('cannot use object arrays as cache key')
+        hash.update(b'ndarray%s%r:' % (value.dtype.str.encode(), value.shape))
+        hash.update(value.tobytes())
+    elif value is None or isinstance(value, (bool, int, float, complex)):
+        hash.update(b'%s:%r;' % (type(value).__name__.encode(), value))
+    elif isinstance(value, bytes):
+        hash.update(b'b%d:' % len(value))
+        hash.update(value)
+    elif isinstance(value, str):
+        _feed(hash, value.encode('utf-8'))
+        hash.update(b's')
+    elif isinstance(value, (list, tuple)):
+        hash.update(b'%s%d[' % (type(value).__name__.encode(), len(value)))
+        for item in value:
+            _feed(hash, item)
+        hash.update(b']')
+    elif isinstance(value, dict):
+        items = []
+        for (key, item) in value.items():
+            key_hash = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+            _feed(key_hash, key)
+            items.append((key_hash.digest(), item))
+        items.sort(key=lambda pair: pair[0])
+        hash.update(b'dict%d{' % len(items))
+        for (key, item) in items:
+            hash.update(key)
+            _feed(hash, item)
+        hash.update(b'}')
+    elif isinstance(value, structure.Structure):
+        hash.update(b'Structure')
+        _feed(hash, value.name)
+        hash.update(contenthash.local_hash(value))
+    elif isinstance(value, (elements._Base, elements.RaithCircleArray)):
+        hash.update(b'element')
+        writer = contenthash._HashWriter(hash)
+        value._save(writer)
+        writer.flush()
+    else:
+        raise TypeError('cannot use %s as cache key' % type(value).__name__)
+
+def _feed_function(hash, func):
+    """
+    Add name of `func` to `hash`, with arguments of partials and values
+    captured by closures and default arguments, which can change the
+    result of functions with the same name.
+    """
+    if isinstance(func, functools.partial):
+        hash.update(b'partial')
+        _feed_function(hash, func.func)
+        _feed(hash, (func.args, func.keywords or {}))
+        return
+    name = getattr(func, '__qualname__', getattr(func, '__name__', repr(func)))
+    if name.rpartition('.')[2] == '<lambda>':
+        raise TypeError('cannot use lambda functions as cache key, their names are not unique')
+    _feed(hash, '%s.%s' % (getattr(func, '__module__', None), name))
+    try:
+        cells = tuple(cell.cell_contents for cell in getattr(func, '__closure__', None) or ())
+    except ValueError:
+        raise TypeError('cannot use %s as cache key, a closure variable is not set' % name)
+    _feed(hash, (cells, getattr(func, '__defaults__', None) or (),
+            getattr(func, '__kwdefaults__', None) or {}))
+
+def _save_structures(strucs, stream):
+    for struc in strucs:
+        struc._save(stream)
+    record.Record(tags.ENDLIB).save(stream)
+
+def _load_structures(stream):
+    gen = record.Reader(stream)
+    result = []
+    while gen.advance() == tags.BGNSTR:
+        result.append(structure.Structure._load(gen))
+    return result
+
+def _is_packable(arrays):
+    """Check that `arrays` can be concatenated into one array and split again."""
+    if not arrays:
+        return False
+    first = arrays[0]
+    return all(isinstance(a, numpy.ndarray) and a.ndim >= 1 and a.dtype == first.dtype and
+            a.shape[1:] == first.shape[1:] and not a.dtype.hasobject for a in arrays)
+
+def _save_arrays(value, stream):
+    if isinstance(value, numpy.ndarray):
+        numpy.savez(stream, kind=numpy.array('array'), item_0=value)
+    elif _is_packable(value):
+        offsets = numpy.cumsum([0] + [len(a) for a in value])
+        numpy.savez(stream, kind=numpy.array('packed ' + type(value).__name__),
+                packed=numpy.concatenate(value), offsets=offsets)
+    else:
+        items = dict(('item_%d' % i, a) for (i, a) in enumerate(value))
+        numpy.savez(stream, kind=numpy.array(type(value).__name__), **items)
+
+def _load_arrays(stream):
+    with numpy.load(stream, allow_pickle=False) as data:
+        kind = str(data['kind'])
+        if kind == 'array':
+            return data['item_0']
+        if kind.startswith('packed '):
+            packed = data['packed']
+            offsets = data['offsets']
+            result = [packed[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            kind = kind[len('packed '):]
+        else:
+            result = [data['item_%d' % i] for i in range(len(data.files) - 1)]
+    return tuple(result) if kind == 'tuple' else result
+
+def _storage(value):
+    """Return file suffix and save function for `value`."""
+    if isinstance(value, structure.Structure):
+        return _STRUCTURE_SUFFIX, lambda stream: _save_structures([value], stream)
+    if isinstance(value, numpy.ndarray):
+        if not value.dtype.hasobject:
+            return _NPZ_SUFFIX, lambda stream: _save_arrays(value, stream)
+    elif isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, structure.Structure) for item in value):
+            if isinstance(value, list):
+                return _STRUCTURES_SUFFIX, lambda stream: _save_structures(value, stream)
+        elif all(isinstance(item, numpy.ndarray) and not item.dtype.hasobject for item in value):
+            return _NPZ_SUFFIX, lambda stream: _save_arrays(value, stream)
+    raise TypeError('cannot cache result of type %s' % type(value).__name__)
+
+# errors loading truncated or damaged results
+_CORRUPT = (exceptions.FormatError, EOFError, IndexError, KeyError, ValueError,
+        zipfile.BadZipFile)
+
+_FORMATS = (
+    (_STRUCTURE_SUFFIX, lambda stream: _load_structures(stream)[0]),
+    (_STRUCTURES_SUFFIX, _load_structures),
+    (_NPZ_SUFFIX, _load_arrays),
+)
+
+class Cache(object):
+    """
+    Directory of stored function results with LRU eviction.
+
+    :param directory: path of the cache directory, created if missing
+    :param max_size: maximum total size of stored results in bytes
+    """
+    def __init__(self, directory, max_size=1024**3):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._size = sum(size for (unused, unused, size) in self._entries())
+
+    def _entries(self):
+        """Return list of ``(last_use_time, path, size)`` of stored results."""
+        result = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((_STRUCTURE_SUFFIX, _NPZ_SUFFIX)):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                result.append((st.st_mtime, entry.path, st.st_size))
+        return result
+
+    @property
+    def size(self):
+        """Total size of stored results in bytes, as known to this instance."""
+        return self._size
+
+    def key(self, func, args=(), kwargs=None, version=None):
+        """
+        Return key of calling `func` with `args` and `kwargs`.
+
+        Values captured by closures of `func` and its default arguments
+        are part of the key like arguments.
+
+        :raises TypeError: if an argument or captured value cannot be
+            used as key, or `func` is a lambda function
+        """
+        hash = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+        _feed_function(hash, func)
+        _feed(hash, (version, tuple(args), kwargs or {}))
+        return hash.hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        """
+        Return stored result for `key`. A stored result that cannot be
+        read is removed.
+
+        :raises KeyError: if there is no readable result for `key`
+        """
+        for (suffix, load) in _FORMATS:
+            path = self._path(key, suffix)
+            try:
+                stream = open(path, 'rb')
+            except (IOError, OSError):
+                continue
+            try:
+                with stream:
+                    value = load(stream)
+            except _CORRUPT:
+                # truncated or damaged, e.g. by a crash: compute again
+                self._remove(path)
+                continue
+            try:
+                # modification time marks recent use for eviction
+                os.utime(path, None)
+            except OSError:
+                pass
+            return value
+        raise KeyError(key)
+
+    def set(self, key, value):
+        """
+        Store `value` for `key`, then remove least recently used results
+        if the cache is too big.
+
+        :raises TypeError: if `value` cannot be stored
+        """
+        suffix, save = _storage(value)
+        fd, temp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                save(stream)
+            size = os.path.getsize(temp)
+            path = self._path(key, suffix)
+            try:
+                # size of a result being replaced
+                size -= os.stat(path).st_size
+            except OSError:
+                pass
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        self._size += size
+        if self._size > self.max_size:
+            self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except OSError:
+            return
+        self._size -= size
+
+    def _evict(self):
+        entries = self._entries()
+        entries.sort()
+        total = sum(size for (unused, unused, size) in entries)
+        for (unused, path, size) in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """Remove all stored results."""
+        for (unused, path, unused) in self._entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self._size = 0
+
+    def call(self, func, *args, **kwargs):
+        """Return ``func(*args, **kwargs)``, stored or computed and stored."""
+        return self._call(func, None, args, kwargs)
+
+    def _call(self, func, version, args, kwargs):
+        key = self.key(func, args, kwargs, version)
+        try:
+            value = self.get(key)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = func(*args, **kwargs)
+        self.set(key, value)
+        return value
+
+    def memoize(self, func=None, version=None):
+        """
+        Decorator that makes `func` return stored results. Can be used
+        as ``@cache.memoize`` or ``@cache.memoize(version=2)``.
+        """
+        if func is None:
+            return lambda func: self.memoize(func, version)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self._call(func, version, args, kwargs)
+        return wrapper
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.contenthash` --- content hashes of structures
+=========================================================
+
+Content hashes identify structures by what they contain. The local hash
+of a structure covers its encoded elements and STRCLASS, but not its
+name or timestamps. The content hash combines the local hash with names
+and content hashes of referenced structures, like a Merkle tree, so it
+changes when anything placed by the structure changes. Usually used
+through :meth:`gdsii.library.Library.content_hash`::
+
+    if old_lib.content_hash(b'TOP') != new_lib.content_hash(b'TOP'):
+        regenerate()
+
+Hashes are 32 byte BLAKE2b digests. They are stable between runs and
+platforms as long as the GDSII encoding of elements does not change.
+"""
+from __future__ import absolute_import
+from . import record, tags
+import hashlib
+
+__all__ = ('local_hash', 'content_hashes')
+
+_DIGEST_SIZE = 32
+# size of encoded data collected before passing it to the hash function
+_BUFFER_SIZE = 1024 * 1024
+
+class _HashWriter(object):
+    """Stream that hashes data written into it."""
+    __slots__ = ('hash', 'buf')
+
+    def __init__(self, hash):
+        self.hash = hash
+        self.buf = bytearray()
+
+    def write(self, data):
+        self.buf += data
+        if len(self.buf) >= _BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.hash.update(self.buf)
+        del self.buf[:]
+
+def local_hash(struc):
+    """
+    Return hash of elements and STRCLASS of `struc`, encoded as they
+    would be saved, ignoring the name and timestamps. The result is
+    cached on the structure until it is modified.
+    """
+    cached = struc._local_hash
+    if cached is not None:
+        return cached
+    hash = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+    writer = _HashWriter(hash)
+    strclass = getattr(struc, 'strclass', None)
+    if strclass is not None:
+        record.Record(tags.STRCLASS, strclass).save(writer)
+    for elem in struc:
+        elem._save(writer)
+    writer.flush()
+    result = hash.digest()
+    struc._cache('_local_hash', result)
+    return result
+
+def content_hashes(hierarchy):
+    """
+    Return dictionary mapping structure names to content hashes.
+
+    :param hierarchy: :class:`gdsii.hierarchy.Hierarchy` of the structures
+    :raises ValueError: if references are recursive
+    """
+    hashes = {}
+    for name in hierarchy.topological_order():
+        hash = hashlib.blake2b(local_hash(hierarchy.structures[name]),
+                digest_size=_DIGEST_SIZE)
+        for child in sorted(hierarchy.children(name)):
+            hash.update(b'%d:%s' % (len(child), child))
+            # missing structures only contribute their names
+            hash.update(hashes.get(child, b''))
+        hashes[name] = hash.digest()
+    return hashes
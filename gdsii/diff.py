@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.diff` --- structural differences between libraries
+===============================================================
+
+This module compares two libraries structure by structure. Structures
+are matched by name; structures present in only one library are matched
+by content to detect renames. Structures with equal local hashes (see
+:mod:`gdsii.contenthash`) are skipped without looking at their elements.
+Elements of the remaining structures are compared as multisets of
+element hashes, so the order of elements does not matter. Example::
+
+    result = diff_libraries(Library.load(old), Library.load(new))
+    for name, changes in result.changed.items():
+        print(name, changes.layers())
+
+An element hash covers all attributes of the element. Vertices of
+boundaries are rotated to start at the smallest vertex and ordered in
+the smaller direction first, so equal polygons written with a different
+start point or orientation compare equal. Circles of
+:class:`gdsii.elements.RaithCircleArray` are compared one by one and
+equal to :class:`gdsii.elements.RaithCircle` elements with the same
+encoding.
+"""
+from __future__ import absolute_import
+from . import contenthash, elements
+from .hierarchy import _key
+import collections
+import hashlib
+import io
+
+__all__ = ('StructureDiff', 'LibraryDiff', 'diff_structures', 'diff_libraries')
+
+_DIGEST_SIZE = 16
+
+def _boundary_data(elem):
+    """
+    Return bytes identifying boundary `elem` with vertices in canonical
+    order, cheaper to compute than the encoded element.
+    """
+    # the integers that are saved, numpy and float coordinates included
+    points = [(int(x), int(y)) for (x, y) in elem.xy]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if points:
+        start = points.index(min(points))
+        forward = points[start:] + points[:start]
+        backward = forward[:1] + forward[:0:-1]
+        points = min(forward, backward)
+    # no properties are saved the same way as an empty list
+    return repr((int(elem.layer), int(elem.data_type), elem.elflags, elem.plex,
+            elem.properties or None, points)).encode()
+
+def _element_keys(elems):
+    """
+    Return list of ``(hash, element, index)`` tuples. `index` is the row
+    of a circle in a :class:`gdsii.elements.RaithCircleArray` `element`,
+    ``None`` for other elements.
+    """
+    result = []
+    buf = io.BytesIO()
+    blake2b = hashlib.blake2b
+    for elem in elems:
+        cls = elem.__class__
+        if cls is elements.RaithCircleArray:
+            size = elem._chunk_size
+            for start in range(0, len(elem), size):
+                stop = min(start + size, len(elem))
+                data = elem._encode(start, stop).tobytes()
+                step = len(data) // (stop - start)
+                for i in range(stop - start):
+                    result.append((blake2b(data[i * step:(i + 1) * step],
+                            digest_size=_DIGEST_SIZE).digest(), elem, start + i))
+            continue
+        if cls is elements.Boundary:
+            data = b'B' + _boundary_data(elem)
+        else:
+            buf.seek(0)
+            buf.truncate()
+            elem._save(buf)
+            data = buf.getvalue()
+        result.append((blake2b(data, digest_size=_DIGEST_SIZE).digest(), elem, None))
+    return result
+
+def _unmatched(keys, other):
+    """Return elements of `keys` not matched by an element of `other`."""
+    counts = collections.Counter(key for (key, unused, unused) in other)
+    result = []
+    for (key, elem, index) in keys:
+        if counts[key]:
+            counts[key] -= 1
+        else:
+            result.append(elem if index is None else elem[index])
+    return result
+
+class StructureDiff(object):
+    """
+    Differences between the elements of two structures.
+
+    Instance attributes:
+        `name`
+            Name of the structure in the new library.
+        `removed`
+            List of elements found only in the old structure.
+        `added`
+            List of elements found only in the new structure.
+
+    Circles of :class:`gdsii.elements.RaithCircleArray` are reported as
+    :class:`gdsii.elements.RaithCircle` elements. A structure diff is
+    true if any element was added or removed.
+    """
+    def __init__(self, name, removed, added):
+        self.name = name
+        self.removed = removed
+        self.added = added
+
+    def __bool__(self):
+        return bool(self.removed or self.added)
+    __nonzero__ = __bool__
+
+    def layers(self):
+        """
+        Return dictionary mapping layers to ``(removed, added)`` element
+        counts. Elements without a layer (references) are counted under
+        ``None``.
+        """
+        result = {}
+        for (i, elems) in enumerate((self.removed, self.added)):
+            for elem in elems:
+                counts = result.setdefault(getattr(elem, 'layer', None), [0, 0])
+                counts[i] += 1
+        return dict((layer, tuple(counts)) for (layer, counts) in result.items())
+
+    def __repr__(self):
+        return '<StructureDiff %r: -%d +%d>' % (self.name, len(self.removed), len(self.added))
+
+def diff_structures(old, new):
+    """
+    Compare elements of structures `old` and `new` regardless of their
+    order and return :class:`StructureDiff` named after `new`.
+    """
+    old_keys = _element_keys(old)
+    new_keys = _element_keys(new)
+    return StructureDiff(_key(new.name), _unmatched(old_keys, new_keys),
+            _unmatched(new_keys, old_keys))
+
+class LibraryDiff(object):
+    """
+    Differences between two libraries.
+
+    Instance attributes:
+        `removed`
+            List of names of structures found only in the old library.
+        `added`
+            List of names of structures found only in the new library.
+        `renamed`
+            List of ``(old_name, new_name)`` pairs of structures with the
+            same content but different names.
+        `changed`
+            Dictionary mapping names to :class:`StructureDiff` of
+            structures with different elements.
+        `reordered`
+            List of names of structures with the same elements in a
+            different order (or with a different STRCLASS only).
+        `unchanged`
+            List of names of structures with the same encoded content.
+
+    Names are :class:`bytes`. A library diff is true if there are any
+    differences except reordering.
+    """
+    def __init__(self):
+        self.removed = []
+        self.added = []
+        self.renamed = []
+        self.changed = {}
+        self.reordered = []
+        self.unchanged = []
+
+    def __bool__(self):
+        return bool(self.removed or self.added or self.renamed or self.changed)
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<LibraryDiff: -%d +%d renamed %d changed %d>' % (len(self.removed),
+                len(self.added), len(self.renamed), len(self.changed))
+
+def _structures(strucs):
+    """Return ordered dictionary mapping names to structures, first one wins."""
+    result = collections.OrderedDict()
+    for struc in strucs:
+        result.setdefault(_key(struc.name), struc)
+    return result
+
+def diff_libraries(old, new):
+    """
+    Compare structures of libraries (or any iterables of structures)
+    `old` and `new` and return :class:`LibraryDiff`.
+    """
+    old_strucs = _structures(old)
+    new_strucs = _structures(new)
+    result = LibraryDiff()
+    for (name, struc) in new_strucs.items():
+        old_struc = old_strucs.get(name)
+        if old_struc is None:
+            continue
+        if contenthash.local_hash(old_struc) == contenthash.local_hash(struc):
+            result.unchanged.append(name)
+            continue
+        changes = diff_structures(old_struc, struc)
+        if changes:
+            result.changed[name] = changes
+        else:
+            result.reordered.append(name)
+
+    # structures found in one library only, renamed if content is the same
+    removed = {}
+    for (name, struc) in old_strucs.items():
+        if name not in new_strucs:
+            removed.setdefault(contenthash.local_hash(struc), []).append(name)
+    for (name, struc) in new_strucs.items():
+        if name in old_strucs:
+            continue
+        candidates = removed.get(contenthash.local_hash(struc))
+        if candidates:
+            result.renamed.append((candidates.pop(0), name))
+        else:
+            result.added.append(name)
+    renamed = set(old_name for (old_name, unused) in result.renamed)
+    result.removed = [name for name in old_strucs
+            if name not in new_strucs and name not in renamed]
+    return result
@@ -62,7 +62,12 @@ Additional definitions:
 """
 from __future__ import absolute_import
 from . import exceptions, record, tags, _records
-2
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 __all__ = (
     'Boundary',
     'Path',
@@ -72,6 +77,8 @@ __all__ = (
     'Node',
     'Box',
     'RaithCircle',
+    'RaithFBMS',
+    'RaithCircleArray',
 )
 
 _ELFLAGS = _records.OptionalWholeRecord('elflags', tags.ELFLAGS)
@@ -92,6 +99,7 @@ _STRING = _records.StringRecord('string', tags.STRING)
 _NODETYPE = _records.SimpleRecord('node_type', tags.NODETYPE)
 _BOXTYPE = _records.SimpleRecord('box_type', tags.BOXTYPE)
 _PROPERTIES = _records.PropertiesRecord('properties')
+_RAITHXY = _records.PackedXYRecord('_xy', tags.XY)
 
 class _Base(object):
     """Base class for all GDSII elements."""
@@ -99,6 +107,7 @@ class _Base(object):
     # dummy descriptors to silence pyckecker, should be set in derived classes
     _gds_tag = None
     _gds_objs = None
+    _gds_table = None
     __slots__ = ()
 
     def __init__(self):
@@ -117,7 +126,7 @@ class _Base(object):
         :param gen: :class:`pygdsii.record.Record` generator
         :returns: new element of class defined by `gen`
         """
-        element_class = cls._tag_to_class_map[gen.current.tag]
+        element_class = cls._tag_to_class_map.get(gen.tag)
         if not element_class:
             raise exceptions.FormatError('unexpected element tag')
         # do not call __init__() during reading from file
@@ -130,11 +139,9 @@ class _Base(object):
         """Read element using `gen` generator."""
         self = cls.__new__(cls)
         self._init_optional()
-        gen.read_next()
-        for obj in self._gds_objs:
-            obj.read(self, gen)
-        gen.current.check_tag(tags.ENDEL)
-        gen.read_next()
+        gen.advance()
+        cls._gds_table.read(self, gen, tags.ENDEL)
+        gen.advance()
         return self
 
     def _save(self, stream):
@@ -387,12 +394,33 @@ class Box(_Base):
         self.properties = None
 
 
+def _make_xy_property(i, doc):
+    def getter(self):
+        return (self._xy[2*i], self._xy[2*i+1])
+    def setter(self, value):
+        self._xy[2*i:2*i+2] = array.array('i', (int(value[0]), int(value[1])))
+    return property(getter, setter, doc=doc)
+
+def _make_flag_property(bit, doc):
+    def getter(self):
+        return self._xy[7] & bit > 0
+    def setter(self, value):
+        if value:
+            self._xy[7] |= bit
+        else:
+            self._xy[7] &= ~bit
+    return property(getter, setter, doc=doc)
+
 class RaithCircle(_Base):
     """
     Class for a circle element used with Raith EBL software. Adds
     `center`, `radii` and `arc` properties which should be 2 item list-like
     objects,  and `ellipse`, `filled` and `arced` boolean properties.
 
+    The four XY points are stored in a flat 32-bit integer array:
+    center, radii, start and stop angle (radians * 10^6), and number of
+    vertices and flags.
+
     GDS syntax:
         .. productionlist::
             path: PATH
@@ -405,22 +433,21 @@ class RaithCircle(_Base):
 
     """
     _gds_tag = tags.RAITHCIRCLE
-    _gds_objs = (_LAYER, _DATATYPE, _WIDTH,
-            _XY, _PROPERTIES)
-    __slots__ = ('layer', 'data_type', 'xy', 'width', 'properties')
+    _gds_objs = (_LAYER, _DATATYPE, _WIDTH, _RAITHXY, _PROPERTIES)
+    __slots__ = ('layer', 'data_type', '_xy', 'width', 'properties')
 
     def __init__(self, layer, data_type, center, radius, verts=64,
                     ellipse=False, filled=True, arced=False, arc=(0, 6283185), width=0):
         _Base.__init__(self)
         self.layer = layer
         self.data_type = data_type
-        self.xy = [list(center), (radius, 0), (0, 6283185), [verts, 0]]
+        self._xy = array.array('i', (int(center[0]), int(center[1]), int(radius), 0,
+            int(arc[0]), int(arc[1]), int(verts), 0))
 
         self.ellipse = ellipse
         self.filled = filled
         self.arced = arced
 
-        self.arc = arc
         self.width = width
 
 
@@ -428,54 +455,55 @@ class RaithCircle(_Base):
         self.width = 100
         self.properties = None
 
-
-    def _make_getxy(i):
-        def getter(self):
-            return self.xy[i]
-        return getter
-
-    def _make_setxy(i):
-        def setter(self, value):
-            self.xy[i] = value
-        return setter
+    @property
+    def xy(self):
+        """The four XY points as a list of tuples."""
+        xy = self._xy
+        return [(xy[0], xy[1]), (xy[2], xy[3]), (xy[4], xy[5]), (xy[6], xy[7])]
+
+    @xy.setter
+    def xy(self, points):
+        xy = array.array('i')
+        for point in points:
+            xy.append(int(point[0]))
+            xy.append(int(point[1]))
+        if len(xy) != 8:
+            raise ValueError('RaithCircle needs 4 XY points')
+        self._xy = xy
 
     # first xy coord is center of circle
-    center = property(_make_getxy(0), _make_setxy(0))
+    center = _make_xy_property(0, 'Center of the circle.')
     # second is radius in x and y directions
-    radii = property(_make_getxy(1), _make_setxy(1))
+    radii = _make_xy_property(1, 'Radius in x and y directions.')
     # third is start and stop angle in radians * 10^6
-    arc = property(_make_getxy(2), _make_setxy(2))
+    arc = _make_xy_property(2, 'Start and stop angle in radians * 10^6.')
 
     # fourth holds number of vertices in x coord
     @property
     def verts(self):
-        return self.xy[3][0]
+        """Number of vertices."""
+        return self._xy[6]
 
     @verts.setter
-    def set_verts(self, value):
-        self.xy[3][0] = value
-
+    def verts(self, value):
+        self._xy[6] = int(value)
 
     # and flags in y coord, where bits signal:
     #  1:  if true uses y-radius to make ellipse
     #  2:  if true ignores width and fills circle
     #  4:  if true use arc coords for start and end of arc
-    def _make_getflag(bit):
-        def getter(self):
-            return self.xy[3][1] & bit > 0
-        return getter
-
-    def _make_setflag(bit):
-        def setter(self, value):
-            if value:
-                self.xy[3][1] |= bit
-            else:
-                self.xy[3][1] &= ~bit
-        return setter
-
-    ellipse = property(_make_getflag(1), _make_setflag(1))
-    filled = property(_make_getflag(2), _make_setflag(2))
-    arced = property(_make_getflag(4), _make_setflag(4))
+    @property
+    def flags(self):
+        """Flags bitmask, see :attr:`ellipse`, :attr:`filled`, :attr:`arced`."""
+        return self._xy[7]
+
+    @flags.setter
+    def flags(self, value):
+        self._xy[7] = int(value)
+
+    ellipse = _make_flag_property(1, 'Use y radius to make an ellipse.')
+    filled = _make_flag_property(2, 'Ignore width and fill the circle.')
+    arced = _make_flag_property(4, 'Use :attr:`arc` for start and end of arc.')
 
 class RaithFBMS(_Base):
     """
@@ -509,6 +537,128 @@ class RaithFBMS(_Base):
 
 
 
+# on-disk layout of a RaithCircle element with WIDTH and without properties
+_RAITH_CIRCLE_DTYPE = [
+    ('el_hdr', '>u2', 2),
+    ('layer_hdr', '>u2', 2), ('layer', '>i2'),
+    ('data_type_hdr', '>u2', 2), ('data_type', '>i2'),
+    ('width_hdr', '>u2', 2), ('width', '>i4'),
+    ('xy_hdr', '>u2', 2), ('xy', '>i4', 8),
+    ('endel_hdr', '>u2', 2),
+]
+_RAITH_CIRCLE_HEADERS = (
+    ('el_hdr', (4, tags.RAITHCIRCLE)),
+    ('layer_hdr', (6, tags.LAYER)),
+    ('data_type_hdr', (6, tags.DATATYPE)),
+    ('width_hdr', (8, tags.WIDTH)),
+    ('xy_hdr', (36, tags.XY)),
+    ('endel_hdr', (4, tags.ENDEL)),
+)
+
+class RaithCircleArray(object):
+    """
+    Dense container for many :class:`RaithCircle` elements, stored as
+    numpy arrays with one row per circle. It can be added to a structure
+    like an element and is saved as ordinary :const:`RAITHCIRCLE`
+    elements (without properties), encoded in bulk. Indexing and
+    iteration return :class:`RaithCircle` instances.
+
+    All arguments are broadcast to the number of circles given by
+    `centers`, a (n, 2) array. `radii` can be (n,) or, for ellipses,
+    (n, 2). Requires numpy.
+
+    Instance attributes are the (n,) or (n, 2) arrays :attr:`layers`,
+    :attr:`data_types`, :attr:`widths` and :attr:`xy`, a (n, 8) int32
+    array with the four XY points of each circle; :attr:`centers`,
+    :attr:`radii`, :attr:`arcs`, :attr:`verts` and :attr:`flags` are
+    views into it.
+    """
+    # number of circles encoded at once when saving
+    _chunk_size = 65536
+
+    def __init__(self, layer, data_type, centers, radii, verts=64,
+            ellipse=False, filled=True, arced=False, arc=(0, 6283185), width=0):
+        if numpy is None:
+            raise ImportError('RaithCircleArray requires numpy')
+        centers = numpy.asarray(centers).reshape(-1, 2)
+        count = len(centers)
+        self.xy = numpy.zeros((count, 8), dtype=numpy.int32)
+        self.xy[:, 0:2] = numpy.rint(centers)
+        radii = numpy.asarray(radii)
+        if radii.ndim < 2:
+            self.xy[:, 2] = numpy.rint(radii)
+        else:
+            self.xy[:, 2:4] = numpy.rint(radii)
+        self.xy[:, 4:6] = numpy.rint(numpy.asarray(arc)).reshape(-1, 2)
+        self.xy[:, 6] = verts
+        self.xy[:, 7] = (numpy.where(ellipse, 1, 0) | numpy.where(filled, 2, 0) |
+                numpy.where(arced, 4, 0))
+        self.layers = numpy.empty(count, dtype=numpy.int16)
+        self.layers[:] = layer
+        self.data_types = numpy.empty(count, dtype=numpy.int16)
+        self.data_types[:] = data_type
+        self.widths = numpy.empty(count, dtype=numpy.int32)
+        self.widths[:] = numpy.rint(width)
+
+    @classmethod
+    def from_circles(cls, circles):
+        """Create a new array from :class:`RaithCircle` elements."""
+        circles = list(circles)
+        self = cls(0, 0, numpy.zeros((len(circles), 2)), 0)
+        for (i, circle) in enumerate(circles):
+            self.xy[i] = circle._xy
+            self.layers[i] = circle.layer
+            self.data_types[i] = circle.data_type
+            self.widths[i] = circle.width or 0
+        return self
+
+    centers = property(lambda self: self.xy[:, 0:2], doc='Centers, (n, 2) view.')
+    radii = property(lambda self: self.xy[:, 2:4], doc='Radii, (n, 2) view.')
+    arcs = property(lambda self: self.xy[:, 4:6],
+            doc='Start and stop angles in radians * 10^6, (n, 2) view.')
+    verts = property(lambda self: self.xy[:, 6], doc='Number of vertices, (n,) view.')
+    flags = property(lambda self: self.xy[:, 7], doc='Flags, (n,) view.')
+
+    def __len__(self):
+        return len(self.xy)
+
+    def __getitem__(self, i):
+        circle = RaithCircle.__new__(RaithCircle)
+        circle._init_optional()
+        circle.layer = int(self.layers[i])
+        circle.data_type = int(self.data_types[i])
+        circle.width = int(self.widths[i])
+        circle._xy = array.array('i', (int(v) for v in self.xy[i]))
+        return circle
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _encode(self, start, stop):
+        """Return structured array with encoded circles `start` to `stop`."""
+        recs = numpy.empty(stop - start, dtype=_RAITH_CIRCLE_DTYPE)
+        for (field, header) in _RAITH_CIRCLE_HEADERS:
+            recs[field] = header
+        recs['layer'] = self.layers[start:stop]
+        recs['data_type'] = self.data_types[start:stop]
+        recs['width'] = self.widths[start:stop]
+        recs['xy'] = self.xy[start:stop]
+        return recs
+
+    def _save(self, stream):
+        for start in range(0, len(self), self._chunk_size):
+            stop = min(start + self._chunk_size, len(self))
+            stream.write(self._encode(start, stop).tobytes())
+
+    def __repr__(self):
+        return '<RaithCircleArray: %d circles>' % len(self)
+
+
 _all_elements = (Boundary, Path, SRef, ARef, Text, Node, Box, RaithCircle, RaithFBMS)
 
 _Base._tag_to_class_map = (lambda: dict(((cls._gds_tag, cls) for cls in _all_elements)))()
+
+for _cls in _all_elements:
+    _cls._gds_table = _records.DecoderTable(_cls._gds_objs)
+del _cls
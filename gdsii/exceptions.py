@@ -21,7 +21,7 @@
 This module contains exception classes used in `python-gdsii`.
 """
 __all__ = ('FormatError', 'EndOfFileError', 'IncorrectDataSize',
-        'UnsupportedTagType', 'MissingRecord', 'DataSizeError')
+        'UnsupportedTagType', 'MissingRecord', 'DataSizeError', 'Cancelled')
 
 class FormatError(Exception):
     """Base class for all GDSII exceptions."""
@@ -40,3 +40,6 @@ class MissingRecord(FormatError):
 
 class DataSizeError(FormatError):
     """Raised when data size is incorrect for a given record."""
+
+class Cancelled(Exception):
+    """Raised when a long running operation is cancelled."""
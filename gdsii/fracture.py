@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.fracture` --- splitting of oversized boundaries
+===========================================================
+
+A GDSII record holds at most 65535 bytes, so an XY record holds at most
+:data:`MAX_POINTS` points, including the closing point of boundaries.
+This module finds elements over the limit and splits boundaries into
+pieces that fit. It is used by :meth:`gdsii.library.Library.save`, which
+checks all structures before writing and, with ``fracture=True``, saves
+fractured copies of structures with oversized boundaries::
+
+    lib.save(stream, fracture=True)
+
+Boundaries are cut into vertical slabs with borders at quantiles of the
+vertex x coordinates, so every slab gets about the same number of
+vertices. Slabs whose pieces are still too big, or would need holes, are
+split again across the longer side. Points where cuts cross edges are
+rounded to integer coordinates. Checking needs only the standard
+library, splitting requires numpy and pyclipper.
+"""
+from __future__ import absolute_import
+from . import elements, exceptions, structure
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('MAX_POINTS', 'oversized_elements', 'check_structures',
+        'fracture_polygon', 'fracture_structure')
+
+#: Maximum number of points in an XY record.
+MAX_POINTS = (0xFFFF - 4) // 8
+
+# limit for recursive splitting of slabs
+_MAX_DEPTH = 64
+
+def oversized_elements(struc, max_points=MAX_POINTS):
+    """Return indices of elements of `struc` with more than `max_points` XY points."""
+    result = []
+    for (i, elem) in enumerate(struc):
+        if elem.__class__ is elements.RaithCircleArray:
+            continue
+        xy = getattr(elem, 'xy', None)
+        if xy is not None and len(xy) > max_points:
+            result.append(i)
+    return result
+
+def check_structures(strucs, fracture=False, max_points=MAX_POINTS):
+    """
+    Check XY record sizes of all elements of structures `strucs`.
+
+    :param fracture: allow oversized boundaries, which
+        :func:`fracture_structure` can split
+    :returns: list of structures with oversized boundaries
+    :raises gdsii.exceptions.FormatError: for the first element that
+        cannot be saved
+    """
+    result = []
+    for struc in strucs:
+        indices = oversized_elements(struc, max_points)
+        for i in indices:
+            elem = struc[i]
+            if not fracture or elem.__class__ is not elements.Boundary:
+                raise exceptions.FormatError('XY of element %d (%s) of structure %r has %d points, '
+                        'limit is %d' % (i, elem.__class__.__name__, struc.name,
+                        len(elem.xy), max_points))
+        if indices:
+            result.append(struc)
+    return result
+
+def _clip(pyclipper, points, box):
+    """Return PolyTree of `points` intersected with `box` (x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = box
+    pc = pyclipper.Pyclipper()
+    pc.AddPath(points, pyclipper.PT_SUBJECT, True)
+    pc.AddPath([(x0, y0), (x1, y0), (x1, y1), (x0, y1)], pyclipper.PT_CLIP, True)
+    return pc.Execute2(pyclipper.CT_INTERSECTION, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+
+def _outers(tree):
+    """Yield outer contours of a PolyTree and whether they have holes."""
+    stack = list(tree.Childs)
+    while stack:
+        node = stack.pop()
+        yield node.Contour, bool(node.Childs)
+        for hole in node.Childs:
+            stack.extend(hole.Childs)
+
+def _cuts(coords, low, high, count):
+    """Return up to `count` - 1 integer cut positions strictly between `low` and `high`."""
+    inside = coords[(coords > low) & (coords < high)]
+    if not len(inside):
+        return numpy.unique(numpy.rint(numpy.linspace(low, high, count + 1)[1:-1]).astype(numpy.int64))
+    cuts = numpy.rint(numpy.quantile(inside, numpy.arange(1, count) / float(count))).astype(numpy.int64)
+    return numpy.unique(cuts[(cuts > low) & (cuts < high)])
+
+def fracture_polygon(points, max_points=MAX_POINTS):
+    """
+    Split polygon `points` (integer coordinates) into polygons without
+    holes with at most `max_points` points each, including the closing
+    point.
+
+    :returns: list of (k, 2) integer arrays, closed
+    :raises gdsii.exceptions.FormatError: if the polygon cannot be split
+    """
+    if numpy is None:
+        raise ImportError('fracture_polygon requires numpy')
+    import pyclipper
+    points = numpy.asarray(points, dtype=numpy.int64).reshape(-1, 2)
+    limit = max_points - 1
+    if limit < 4:
+        raise ValueError('max_points must be at least 5')
+    path = points.tolist()
+    low = points.min(axis=0) - 1
+    high = points.max(axis=0) + 1
+    # about half the limit per slab leaves room for points added by cuts
+    count = max(int(numpy.ceil(len(points) * 2. / limit)), 1)
+    xs = numpy.concatenate(([low[0]], _cuts(points[:, 0], low[0], high[0], count), [high[0]]))
+    pending = [((int(xs[i]), int(low[1]), int(xs[i + 1]), int(high[1])), 0)
+            for i in range(len(xs) - 1)]
+    result = []
+    while pending:
+        box, depth = pending.pop()
+        pieces = list(_outers(_clip(pyclipper, path, box)))
+        if all(len(contour) <= limit and not holes for (contour, holes) in pieces):
+            result.extend(numpy.array(contour + contour[:1], dtype=numpy.int64)
+                    for (contour, unused) in pieces if len(contour) >= 3)
+            continue
+        if depth >= _MAX_DEPTH:
+            raise exceptions.FormatError('cannot fracture polygon with %d points' % len(points))
+        # split across the longer side at the median vertex
+        x0, y0, x1, y1 = box
+        axis = 0 if x1 - x0 >= y1 - y0 else 1
+        coords = numpy.array([p[axis] for (contour, unused) in pieces for p in contour])
+        cut = _cuts(coords, box[axis], box[axis + 2], 2)
+        if not len(cut):
+            cut = [(box[axis] + box[axis + 2]) // 2]
+            if cut[0] in (box[axis], box[axis + 2]):
+                raise exceptions.FormatError('cannot fracture polygon with %d points' % len(points))
+        cut = int(cut[0])
+        if axis == 0:
+            pending.extend((((x0, y0, cut, y1), depth + 1), ((cut, y0, x1, y1), depth + 1)))
+        else:
+            pending.extend((((x0, y0, x1, cut), depth + 1), ((x0, cut, x1, y1), depth + 1)))
+    return result
+
+def fracture_structure(struc, max_points=MAX_POINTS):
+    """
+    Return copy of `struc` with boundaries over `max_points` points
+    replaced by pieces from :func:`fracture_polygon`, or `struc` itself
+    if there are none. Pieces keep layer, data type, flags and
+    properties. Other elements are shared with `struc`.
+    """
+    indices = oversized_elements(struc, max_points)
+    if not indices:
+        return struc
+    indices = set(indices)
+    result = structure.Structure(struc.name, struc.mod_time, struc.acc_time)
+    result.strclass = getattr(struc, 'strclass', None)
+    items = []
+    for (i, elem) in enumerate(struc):
+        if i not in indices:
+            items.append(elem)
+            continue
+        if elem.__class__ is not elements.Boundary:
+            raise exceptions.FormatError('cannot fracture %s' % elem.__class__.__name__)
+        for piece in fracture_polygon(elem.xy, max_points):
+            boundary = elements.Boundary(elem.layer, elem.data_type,
+                    [tuple(p) for p in piece.tolist()])
+            boundary.elflags = elem.elflags
+            boundary.plex = elem.plex
+            boundary.properties = elem.properties
+            items.append(boundary)
+    result.extend(items)
+    return result
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.grep` --- record level search in GDSII files
+========================================================
+
+This module answers questions like "which structures reference cell
+X", "where is text Y" and "which structures use layer N" without
+loading libraries. Files are memory mapped and scanned with
+:func:`gdsii.record.scan`; only STRNAME, SNAME, STRING and LAYER
+payloads (and XY of matching texts) are decoded. Several files are
+searched in parallel processes::
+
+    for match in grep(paths, references=[b'PAD'], texts=[b'ALIGN*'], layers=[63]):
+        print(match)
+
+Names and texts are matched as :mod:`fnmatch` patterns, given as
+:class:`bytes` or :class:`str`.
+"""
+from __future__ import absolute_import
+from . import exceptions, record, tags
+from .library import _map_stream
+import concurrent.futures
+import fnmatch
+import struct
+
+__all__ = ('Match', 'REFERENCE', 'TEXT', 'LAYER', 'grep_buffer', 'grep_file', 'grep')
+
+#: Kinds of matches.
+REFERENCE = 'reference'
+TEXT = 'text'
+LAYER = 'layer'
+
+class Match(object):
+    """
+    A search result.
+
+    Instance attributes:
+        `path`
+            File name, ``None`` for :func:`grep_buffer`.
+        `structure`
+            Name of the structure containing the match (:class:`bytes`).
+        `kind`
+            :data:`REFERENCE`, :data:`TEXT` or :data:`LAYER`.
+        `value`
+            Referenced structure name or text (:class:`bytes`), or layer
+            number.
+        `count`
+            Number of SREF and AREF elements or elements on the layer in
+            the structure, 1 for texts.
+        `position`
+            ``(x, y)`` of texts, ``None`` for other matches.
+    """
+    __slots__ = ('path', 'structure', 'kind', 'value', 'count', 'position')
+
+    def __init__(self, path, structure, kind, value, count=1, position=None):
+        self.path = path
+        self.structure = structure
+        self.kind = kind
+        self.value = value
+        self.count = count
+        self.position = position
+
+    def _key(self):
+        return (self.path, self.structure, self.kind, self.value, self.count, self.position)
+
+    def __eq__(self, other):
+        return isinstance(other, Match) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __getstate__(self):
+        return self._key()
+
+    def __setstate__(self, state):
+        (self.path, self.structure, self.kind, self.value, self.count, self.position) = state
+
+    def __repr__(self):
+        return '<Match %s %r in %r: %r>' % (self.kind, self.value, self.structure, self.path)
+
+def _patterns(values):
+    return [value.encode() if isinstance(value, str) else value for value in values]
+
+def _matcher(patterns):
+    """Return function checking names against `patterns`, cached per name."""
+    patterns = _patterns(patterns)
+    cache = {}
+    def match(name):
+        result = cache.get(name)
+        if result is None:
+            result = cache[name] = any(fnmatch.fnmatchcase(name, p) for p in patterns)
+        return result
+    return match
+
+def _text_position(buf, text_offset, string_offset):
+    """Return XY of the TEXT element at `text_offset` with STRING at `string_offset`."""
+    pos = text_offset
+    while pos < string_offset:
+        size, tag = struct.unpack_from('>HH', buf, pos)
+        if tag == tags.XY:
+            return struct.unpack_from('>ii', buf, pos + 4)
+        if size < 4:
+            break
+        pos += size
+    return None
+
+def grep_buffer(buf, references=(), texts=(), layers=(), start=0, path=None):
+    """
+    Search library file contents `buf` starting at `start`.
+
+    :param references: patterns of referenced structure names
+    :param texts: patterns of texts
+    :param layers: layer numbers
+    :param path: value of :attr:`Match.path`
+    :returns: list of :class:`Match` in file order, references and
+        layers reported at the end of each structure
+    :raises gdsii.exceptions.FormatError: if the data is corrupt or ends
+        before ENDLIB
+    """
+    wanted = set((tags.STRNAME, tags.ENDSTR, tags.ENDLIB))
+    if references:
+        wanted.add(tags.SNAME)
+        match_reference = _matcher(references)
+    if texts:
+        wanted.update((tags.TEXT, tags.STRING))
+        match_text = _matcher(texts)
+    count_tag = None
+    if layers:
+        # LAYER records are counted per structure while scanning
+        count_tag = tags.LAYER
+        layers = frozenset(layers)
+    found, end = record.scan(buf, frozenset(wanted), start, count_tag)
+    if not found or found[-1][2] != tags.ENDLIB:
+        raise exceptions.EndOfFileError('no ENDLIB record, data ends at offset %d' % end)
+    parse_ascii = record._parse_ascii
+    result = []
+    name = None
+    refs = {}
+    layer_counts = {}
+    text_offset = None
+    for (offset, size, tag) in found:
+        if tag == tags.LAYER:
+            # counted by the scan, the entry is (layer, count, LAYER)
+            layer, count = offset, size
+            if layer in layers:
+                layer_counts[layer] = count
+        elif tag == tags.SNAME:
+            ref = parse_ascii(bytes(buf[offset+4:offset+size]))
+            if match_reference(ref):
+                refs[ref] = refs.get(ref, 0) + 1
+        elif tag == tags.TEXT:
+            text_offset = offset
+        elif tag == tags.STRING:
+            text = parse_ascii(bytes(buf[offset+4:offset+size]))
+            if match_text(text):
+                position = None
+                if text_offset is not None:
+                    position = _text_position(buf, text_offset, offset)
+                result.append(Match(path, name, TEXT, text, 1, position))
+        elif tag == tags.STRNAME:
+            name = parse_ascii(bytes(buf[offset+4:offset+size]))
+        elif tag == tags.ENDSTR:
+            for (ref, count) in refs.items():
+                result.append(Match(path, name, REFERENCE, ref, count))
+            for layer in sorted(layer_counts):
+                result.append(Match(path, name, LAYER, layer, layer_counts[layer]))
+            refs = {}
+            layer_counts = {}
+            name = None
+    return result
+
+def grep_file(path, references=(), texts=(), layers=()):
+    """Search file `path`, see :func:`grep_buffer`."""
+    with open(path, 'rb') as stream:
+        buf, start, unused = _map_stream(stream)
+        try:
+            return grep_buffer(buf, references, texts, layers, start, path)
+        finally:
+            if hasattr(buf, 'close'):
+                buf.close()
+
+def _grep_file(args):
+    path, references, texts, layers, catch = args
+    try:
+        return grep_file(path, references, texts, layers)
+    except (EnvironmentError, exceptions.FormatError) as e:
+        if not catch:
+            raise
+        return e
+
+def grep(paths, references=(), texts=(), layers=(), workers=None, errors=None):
+    """
+    Search files `paths` in parallel and return list of :class:`Match`
+    ordered by file.
+
+    :param workers: maximum number of processes, files are searched in
+        this process if it is 1 or there is only one file
+    :param errors: optional list; files that cannot be read or are not
+        valid GDSII files are skipped and ``(path, exception)`` pairs
+        appended to it instead of raising the exception
+    :raises gdsii.exceptions.FormatError: for corrupt files
+    """
+    paths = list(paths)
+    args = [(path, list(references), list(texts), list(layers), errors is not None)
+            for path in paths]
+    if workers == 1 or len(paths) < 2:
+        results = map(_grep_file, args)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_grep_file, args))
+    matches = []
+    for (path, result) in zip(paths, results):
+        if isinstance(result, Exception):
+            errors.append((path, result))
+        else:
+            matches.extend(result)
+    return matches
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.hierarchy` --- structure reference graph
+====================================================
+
+This module contains :class:`Hierarchy`, the graph of references between
+structures of a library. It is usually obtained from
+:meth:`gdsii.library.Library.hierarchy`, which keeps it up to date as
+structures are added, removed, renamed or modified. Structure names are
+returned as :class:`bytes`, but can be given as :class:`str` too.
+"""
+from __future__ import absolute_import
+from . import elements
+
+__all__ = ('Hierarchy', 'structure_references')
+
+def _key(name):
+    return name.encode() if isinstance(name, str) else name
+
+def structure_references(struc):
+    """
+    Return dictionary mapping names of structures referenced by `struc`
+    to the number of instances (AREF counts cols x rows instances). The
+    result is cached on the structure until it is modified.
+    """
+    refs = struc._references
+    if refs is not None:
+        return refs
+    refs = {}
+    for elem in struc:
+        cls = elem.__class__
+        if cls is elements.SRef:
+            count = 1
+        elif cls is elements.ARef:
+            count = elem.cols * elem.rows
+        else:
+            continue
+        name = _key(elem.struct_name)
+        refs[name] = refs.get(name, 0) + count
+    struc._cache('_references', refs)
+    return refs
+
+class Hierarchy(object):
+    """
+    Reference graph of structures.
+
+    :param strucs: structures, e.g. a :class:`gdsii.library.Library`
+
+    Instance attributes:
+        `structures`
+            Dictionary mapping names to structures. If several
+            structures have the same name, the first one is used.
+        `missing`
+            Set of names that are referenced but not defined.
+    """
+    def __init__(self, strucs):
+        self.structures = {}
+        # names in library order, None if it must be obtained from
+        # _order_source, a function returning names of all structures
+        self._order = {}
+        self._order_source = None
+        self._children = {}
+        # parents of defined and missing structures
+        self._parents = {}
+        self.missing = set()
+        self._topological = None
+        # number of changes, for data derived from the graph
+        self._changes = 0
+        for struc in strucs:
+            name = _key(struc.name)
+            if name not in self.structures:
+                self.structures[name] = struc
+                self._order[name] = None
+                self._parents[name] = {}
+        for name in self._order:
+            self._link(name)
+
+    def _link(self, name):
+        children = structure_references(self.structures[name])
+        self._children[name] = children
+        for (child, count) in children.items():
+            parents = self._parents.get(child)
+            if parents is None:
+                parents = self._parents[child] = {}
+                self.missing.add(child)
+            parents[name] = count
+
+    def _unlink(self, name):
+        for child in self._children.pop(name, ()):
+            parents = self._parents[child]
+            del parents[name]
+            if not parents and child not in self.structures:
+                del self._parents[child]
+                self.missing.discard(child)
+
+    def _set(self, name, struc):
+        """
+        Make `struc` the structure named `name` and scan its references
+        again, or remove `name` if `struc` is ``None``. New names are
+        added at the end of the order.
+        """
+        self._changes += 1
+        self._topological = None
+        defined = name in self.structures
+        if defined:
+            self._unlink(name)
+        if struc is None:
+            if defined:
+                del self.structures[name]
+                if self._order is not None:
+                    del self._order[name]
+                if self._parents[name]:
+                    self.missing.add(name)
+                else:
+                    del self._parents[name]
+            return
+        if not defined:
+            if self._order is not None:
+                self._order[name] = None
+            self._parents.setdefault(name, {})
+            self.missing.discard(name)
+        self.structures[name] = struc
+        self._link(name)
+
+    def _names(self):
+        """Return names of structures in library order."""
+        if self._order is None:
+            self._order = dict.fromkeys(name for name in map(_key, self._order_source())
+                    if name in self.structures)
+        return self._order
+
+    def __contains__(self, name):
+        return _key(name) in self.structures
+
+    def children(self, name):
+        """
+        Return dictionary mapping names of structures referenced directly
+        by structure `name` to their instance counts.
+
+        :raises KeyError: if there is no structure `name`
+        """
+        return self._children[_key(name)]
+
+    def parents(self, name):
+        """
+        Return dictionary mapping names of structures directly referencing
+        structure `name` to the number of instances they place.
+
+        :raises KeyError: if there is no structure `name`
+        """
+        return self._parents[_key(name)]
+
+    def top_cells(self):
+        """Return names of structures that are not referenced, in library order."""
+        return [name for name in self._names() if not self._parents[name]]
+
+    def descendants(self, name):
+        """Return set of names of all structures referenced by `name`, directly or not."""
+        seen = set()
+        stack = [_key(name)]
+        while stack:
+            for child in self._children.get(stack.pop(), ()):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        return seen
+
+    def topological_order(self):
+        """
+        Return names of all structures ordered so that each structure
+        comes after every structure it references.
+
+        :raises ValueError: if references are recursive
+        """
+        if self._topological is not None:
+            return list(self._topological)
+        names = self._names()
+        # number of distinct defined children not yet placed in the order
+        pending = dict((name, sum(1 for child in self._children[name] if child in self.structures))
+                for name in names)
+        ready = [name for name in names if not pending[name]]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for parent in self._parents[name]:
+                pending[parent] -= 1
+                if not pending[parent]:
+                    ready.append(parent)
+        if len(order) != len(names):
+            raise ValueError('recursive references between structures')
+        self._topological = order
+        return list(order)
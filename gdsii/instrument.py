@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.instrument` --- load and save statistics
+====================================================
+
+This module contains :class:`IOStats`, an object that can be passed to
+:meth:`gdsii.library.Library.load` and :meth:`gdsii.library.Library.save`
+to find out which structures, element types and records dominate I/O
+time. When no stats object is given nothing is counted, so there is no
+overhead. Example::
+
+    stats = IOStats()
+    with open('file.gds', 'rb') as stream:
+        lib = Library.load(stream, stats=stats)
+    print(stats.report())
+"""
+from __future__ import absolute_import
+from . import record, structure
+import time
+import tracemalloc
+
+__all__ = ('IOStats',)
+
+class IOStats(object):
+    """
+    Counters collected while loading or saving a library.
+
+    :param callback: optional function called after each structure with
+        arguments ``(name, seconds, nbytes)``
+    :param track_allocations: if true, memory allocated while loading each
+        structure is recorded using :mod:`tracemalloc` (slow)
+
+    Instance attributes:
+        `records`, `record_bytes`
+            Number of records and their total size in bytes by tag
+            (loading only).
+        `elements`, `element_bytes`
+            Number of elements and their total size in bytes by element
+            class name.
+        `structure_times`, `structure_bytes`
+            Time in seconds and size in bytes by structure name.
+        `allocations`
+            Net memory in bytes allocated while loading each structure,
+            by structure name (only with `track_allocations`).
+    """
+    def __init__(self, callback=None, track_allocations=False):
+        self.callback = callback
+        self.track_allocations = track_allocations
+        self.records = {}
+        self.record_bytes = {}
+        self.elements = {}
+        self.element_bytes = {}
+        self.structure_times = {}
+        self.structure_bytes = {}
+        self.allocations = {}
+
+    def _reader(self, stream):
+        """Return a reader that counts records."""
+        return _CountingReader(stream, self)
+
+    def _load_structure(self, gen, source, tick, interval):
+        """Load a structure from a reader returned by :meth:`_reader`."""
+        start_offset = gen.offset
+        started_tracing = False
+        if self.track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        if self.track_allocations:
+            mem_start = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        struc = structure.Structure._load(gen, source, tick, interval, self._element_done)
+        if self.track_allocations:
+            self._add(self.allocations, struc.name,
+                    tracemalloc.get_traced_memory()[0] - mem_start)
+            if started_tracing:
+                tracemalloc.stop()
+        self._structure_done(struc.name, time.time() - start, gen.end_offset - start_offset)
+        return struc
+
+    def _counting_stream(self, stream):
+        """Return wrapper for `stream` that counts written bytes."""
+        return _CountingWriter(stream)
+
+    def _save_structure(self, struc, stream, tick, interval):
+        """Save `struc` into a stream returned by :meth:`_counting_stream`."""
+        start_offset = stream.written
+        start = time.time()
+        struc._save(stream, tick, interval, self._element_done)
+        self._structure_done(struc.name, time.time() - start, stream.written - start_offset)
+
+    def _element_done(self, elem, nbytes):
+        name = elem.__class__.__name__
+        elements = self.elements
+        elements[name] = elements.get(name, 0) + 1
+        element_bytes = self.element_bytes
+        element_bytes[name] = element_bytes.get(name, 0) + nbytes
+
+    def _structure_done(self, name, seconds, nbytes):
+        self._add(self.structure_times, name, seconds)
+        self._add(self.structure_bytes, name, nbytes)
+        if self.callback is not None:
+            self.callback(name, seconds, nbytes)
+
+    @staticmethod
+    def _add(counter, key, value):
+        counter[key] = counter.get(key, 0) + value
+
+    def report(self, top=10):
+        """Return a text summary with at most `top` lines per table."""
+        lines = []
+        def table(title, counts, sizes, key_name, unit):
+            if not counts:
+                return
+            lines.append(title)
+            for key in sorted(counts, key=lambda k: -counts[k])[:top]:
+                lines.append('  %-24s %14s %14d bytes' % (key_name(key),
+                    unit % counts[key], sizes.get(key, 0)))
+        table('Structures by time:', self.structure_times, self.structure_bytes,
+                _name, '%.3f s')
+        table('Elements:', self.elements, self.element_bytes, str, '%d')
+        table('Records:', self.records, self.record_bytes, record._tag_name, '%d')
+        if self.allocations:
+            lines.append('Allocations:')
+            for name in sorted(self.allocations, key=lambda k: -self.allocations[k])[:top]:
+                lines.append('  %-24s %14d bytes' % (_name(name),
+                    self.allocations[name]))
+        return '\n'.join(lines)
+
+def _name(name):
+    """Structure name as text."""
+    if isinstance(name, bytes):
+        return name.decode(errors='replace')
+    return name
+
+class _CountingReader(record.Reader):
+    """Reader that counts records and bytes per tag in :class:`IOStats`."""
+    __slots__ = ('stats',)
+
+    def __init__(self, stream, stats):
+        record.Reader.__init__(self, stream)
+        self.stats = stats
+
+    def advance(self):
+        tag = record.Reader.advance(self)
+        records = self.stats.records
+        records[tag] = records.get(tag, 0) + 1
+        record_bytes = self.stats.record_bytes
+        record_bytes[tag] = record_bytes.get(tag, 0) + self.end_offset - self.offset
+        return tag
+
+class _CountingWriter(object):
+    """Stream wrapper that counts bytes written."""
+    __slots__ = ('stream', 'written')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self.stream.write(data)
+
+    def tell(self):
+        return self.written
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.layerstats` --- per-layer shape statistics
+======================================================
+
+This module computes per-layer shape counts, vertex counts and areas of
+a structure including everything it references, without flattening the
+hierarchy. Statistics of each structure are computed once and combined
+through :const:`SREF` and :const:`AREF` instance counts, so the cost
+depends on the number of stored elements and references, not on the
+number of placed shapes. Usually used through
+:meth:`gdsii.library.Library.stats`.
+
+Areas are in database units squared. Paths and FBMS paths are counted
+as width times length (with path end extensions), circles as exact
+circle, ellipse, ring or pie areas. Magnification of references scales
+areas; other transformations do not change any statistic.
+
+Requires numpy.
+"""
+from __future__ import absolute_import
+from . import elements, utils
+import math
+import numpy
+
+__all__ = ('LayerStats', 'structure_stats', 'hierarchy_stats')
+
+# columns of per-layer statistics arrays
+_POLYGONS, _PATHS, _CIRCLES, _VERTICES, _AREA = range(5)
+_NCOLS = 5
+
+class LayerStats(object):
+    """
+    Statistics of one layer.
+
+    Instance attributes:
+        `polygons`
+            Number of :class:`~gdsii.elements.Boundary` and
+            :class:`~gdsii.elements.Box` elements.
+        `paths`
+            Number of :class:`~gdsii.elements.Path` and
+            :class:`~gdsii.elements.RaithFBMS` elements.
+        `circles`
+            Number of :class:`~gdsii.elements.RaithCircle` elements.
+        `vertices`
+            Total number of vertices (for circles, the number of vertices
+            they are drawn with).
+        `area`
+            Total area in database units squared.
+    """
+    __slots__ = ('polygons', 'paths', 'circles', 'vertices', 'area')
+
+    def __init__(self, polygons=0, paths=0, circles=0, vertices=0, area=0.0):
+        self.polygons = polygons
+        self.paths = paths
+        self.circles = circles
+        self.vertices = vertices
+        self.area = area
+
+    @classmethod
+    def _from_row(cls, row):
+        return cls(int(round(row[_POLYGONS])), int(round(row[_PATHS])),
+                int(round(row[_CIRCLES])), int(round(row[_VERTICES])), float(row[_AREA]))
+
+    def __eq__(self, other):
+        return isinstance(other, LayerStats) and all(getattr(self, name) == getattr(other, name)
+                for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<LayerStats: %d polygons, %d paths, %d circles, %d vertices, area %g>' % (
+                self.polygons, self.paths, self.circles, self.vertices, self.area)
+
+class _Accumulator(object):
+    """Collects per-layer statistics rows."""
+    def __init__(self):
+        self.rows = {}
+
+    def row(self, layer):
+        row = self.rows.get(layer)
+        if row is None:
+            row = self.rows[layer] = numpy.zeros(_NCOLS)
+        return row
+
+    def add_grouped(self, layers, column, values):
+        """Add `values` into `column` summed by `layers`."""
+        layers = numpy.asarray(layers)
+        if not len(layers):
+            return
+        keys, inverse = numpy.unique(layers, return_inverse=True)
+        sums = numpy.bincount(inverse, weights=values, minlength=len(keys))
+        for key, value in zip(keys.tolist(), sums.tolist()):
+            self.row(key)[column] += value
+
+def _closed_sizes(xys):
+    """Number of distinct vertices of polygons."""
+    return [len(xy) - 1 if len(xy) > 1 and tuple(xy[0]) == tuple(xy[-1]) else len(xy)
+            for xy in xys]
+
+def _path_area(path):
+    xy = numpy.asarray(path.xy, dtype=float).reshape(-1, 2)
+    width = abs(path.width or 0)
+    length = numpy.hypot(*numpy.diff(xy, axis=0).T).sum() if len(xy) > 1 else 0.
+    area = width * length
+    if path.path_type == 1:
+        area += math.pi * width * width / 4.
+    elif path.path_type == 2:
+        area += width * width
+    elif path.path_type == 4:
+        area += width * ((path.bgn_extn or 0) + (path.end_extn or 0))
+    return area
+
+def _fbms_stats(fbms):
+    """Return number of vertices and area of a :class:`RaithFBMS`."""
+    records = numpy.asarray(fbms.xy, dtype=float).reshape(-1, 4)
+    if len(records) < 2:
+        return 0, 0.
+    # first record is a header, then start point and one record per segment
+    points = records[1:, 1:3]
+    chord = numpy.hypot(*numpy.diff(points, axis=0).T)
+    sag = numpy.where(records[2:, 0] == 2, numpy.abs(records[2:, 3]), 0.)
+    curved = (sag > 0) & (chord > 0)
+    safe = numpy.where(curved, sag, 1.)
+    radius = (chord * chord / 4. + safe * safe) / (2. * safe)
+    arc = radius * 4. * numpy.arctan2(2. * safe, chord)
+    length = numpy.where(curved, arc, chord).sum()
+    return len(points), abs(fbms.width or 0) * length
+
+def _circle_areas(xy, widths):
+    """Areas of circles given by (n, 8) XY arrays and widths."""
+    xy = numpy.asarray(xy, dtype=float).reshape(-1, 8)
+    flags = xy[:, 7].astype(numpy.int64)
+    r1 = xy[:, 2]
+    r2 = numpy.where(flags & 1, xy[:, 3], r1)
+    fraction = numpy.where(flags & 4,
+            numpy.mod(xy[:, 5] - xy[:, 4], 2e6 * math.pi) / (2e6 * math.pi), 1.)
+    half = numpy.abs(numpy.asarray(widths, dtype=float)) / 2.
+    ring = (r1 + half) * (r2 + half) - numpy.maximum(r1 - half, 0) * numpy.maximum(r2 - half, 0)
+    return math.pi * fraction * numpy.where(flags & 2, r1 * r2, ring)
+
+def _as_stats(rows):
+    return dict((layer, LayerStats._from_row(row)) for layer, row in sorted(rows.items()))
+
+def structure_stats(struc, refresh=False):
+    """
+    Return statistics of elements stored directly in `struc`, ignoring
+    references, as a dictionary mapping layers to :class:`LayerStats`.
+    The result is cached on the structure; pass `refresh` to recompute
+    it after elements have been modified.
+    """
+    return _as_stats(_structure_rows(struc, refresh))
+
+def _structure_rows(struc, refresh):
+    """Per-layer statistics arrays of `struc`, cached on it."""
+    cached = getattr(struc, '_layer_stats', None)
+    if cached is not None and not refresh:
+        return cached
+
+    acc = _Accumulator()
+    polygons = []
+    circle_layers = []
+    circle_xy = []
+    circle_widths = []
+    circle_arrays = []
+    for elem in struc:
+        cls = elem.__class__
+        if cls is elements.Boundary or cls is elements.Box:
+            polygons.append(elem)
+        elif cls is elements.Path:
+            row = acc.row(elem.layer)
+            row[_PATHS] += 1
+            row[_VERTICES] += len(elem.xy)
+            row[_AREA] += _path_area(elem)
+        elif cls is elements.RaithCircle:
+            circle_layers.append(elem.layer)
+            circle_xy.append(elem._xy)
+            circle_widths.append(elem.width or 0)
+        elif cls is elements.RaithCircleArray:
+            circle_arrays.append(elem)
+        elif cls is elements.RaithFBMS:
+            vertices, area = _fbms_stats(elem)
+            row = acc.row(elem.layer)
+            row[_PATHS] += 1
+            row[_VERTICES] += vertices
+            row[_AREA] += area
+
+    if polygons:
+        xys = [elem.xy for elem in polygons]
+        layers = [elem.layer for elem in polygons]
+        acc.add_grouped(layers, _POLYGONS, numpy.ones(len(layers)))
+        acc.add_grouped(layers, _VERTICES, _closed_sizes(xys))
+        acc.add_grouped(layers, _AREA, numpy.abs(utils.polygon_areas(*utils.pack_polygons(xys))))
+
+    circles = [(circles.layers, circles.xy, circles.widths) for circles in circle_arrays]
+    if circle_layers:
+        circles.append((circle_layers, numpy.array(circle_xy).reshape(-1, 8), circle_widths))
+    for layers, xy, widths in circles:
+        acc.add_grouped(layers, _CIRCLES, numpy.ones(len(layers)))
+        acc.add_grouped(layers, _VERTICES, xy[:, 6].astype(float))
+        acc.add_grouped(layers, _AREA, _circle_areas(xy, widths))
+
+    struc._cache('_layer_stats', acc.rows)
+    return acc.rows
+
+def _references(struc):
+    """
+    Return dictionary mapping referenced structure names to pairs of
+    instance count and area scale (sum of magnification squared).
+    """
+    refs = {}
+    for elem in struc:
+        cls = elem.__class__
+        if cls is elements.SRef:
+            count = 1
+        elif cls is elements.ARef:
+            count = elem.cols * elem.rows
+        else:
+            continue
+        mag = elem.mag if elem.mag is not None else 1.0
+        pair = refs.get(elem.struct_name)
+        if pair is None:
+            refs[elem.struct_name] = [count, count * mag * mag]
+        else:
+            pair[0] += count
+            pair[1] += count * mag * mag
+    return refs
+
+def _key(name):
+    return name.encode() if isinstance(name, str) else name
+
+def hierarchy_stats(strucs, top, refresh=False):
+    """
+    Return statistics for structure `top` and everything it references
+    as a dictionary mapping layers to :class:`LayerStats`.
+
+    :param strucs: structures to resolve references in, e.g. a
+        :class:`gdsii.library.Library`
+    :param top: name of the top structure
+    :param refresh: recompute cached per-structure statistics
+    :raises KeyError: if there is no structure named `top`
+    :raises ValueError: if references are recursive
+    References to structures not in `strucs` are ignored.
+    """
+    if hasattr(strucs, 'hierarchy'):
+        by_name = strucs.hierarchy().structures
+    else:
+        by_name = {}
+        for struc in strucs:
+            by_name.setdefault(_key(struc.name), struc)
+    top = _key(top)
+    if top not in by_name:
+        raise KeyError(top)
+
+    # totals by name, computed children first with an explicit stack
+    totals = {}
+    refs = {}
+    active = set()
+    stack = [top]
+    while stack:
+        name = stack[-1]
+        if name in totals:
+            stack.pop()
+            continue
+        if name not in refs:
+            refs[name] = dict((_key(child), pair) for child, pair in
+                    _references(by_name[name]).items() if _key(child) in by_name)
+            active.add(name)
+        pending = [child for child in refs[name] if child not in totals]
+        for child in pending:
+            if child in active:
+                raise ValueError('recursive reference to structure %r' % child)
+        if pending:
+            stack.extend(pending)
+            continue
+
+        own = _structure_rows(by_name[name], refresh)
+        total = dict((layer, row.copy()) for layer, row in own.items())
+        for child, (count, area_scale) in refs[name].items():
+            for layer, row in totals[child].items():
+                scaled = row * count
+                scaled[_AREA] = row[_AREA] * area_scale
+                if layer in total:
+                    total[layer] += scaled
+                else:
+                    total[layer] = scaled
+        totals[name] = total
+        active.discard(name)
+        stack.pop()
+
+    return _as_stats(totals[top])
@@ -24,7 +24,15 @@ This module contains class that represents a GDSII library.
 """
 from __future__ import absolute_import
 from . import exceptions, record, structure, tags, _records
+from .progress import _interval, _stream_size, _tell
 from datetime import datetime
+import asyncio
+import concurrent.futures
+import functools
+import io
+import mmap
+import os
+import threading
 
 _HEADER = _records.SimpleRecord('version', tags.HEADER)
 _BGNLIB = _records.TimestampsRecord('mod_time', 'acc_time', tags.BGNLIB)
@@ -66,6 +74,24 @@ class Library(list):
     _gds_objs = (_HEADER, _BGNLIB, _LIBDIRSIZE, _SRFNAME, _LIBSECUR, _LIBNAME, _REFLIBS,
             _FONTS, _ATTRTABLE, _GENERATIONS, _FORMAT, _UNITS)
 
+    # file the library was loaded from
+    _source = None
+
+    # name index mapping names to lists of structures with that name in
+    # library order, and reference graph. Once built, they are updated by
+    # list methods and by structures, which know the libraries they are
+    # in. _stale holds names whose graph entries must be updated, in
+    # the order they were added to the library (as dictionary keys),
+    # _duplicates the number of names used by several structures and
+    # _reordered tells if the lists of those names must be sorted again.
+    _names = None
+    _graph = None
+    _stale = None
+    _duplicates = 0
+    _reordered = False
+    # content hashes with the graph and its change counter they were computed for
+    _hashes = None
+
     def __init__(self, version, name, physical_unit, logical_unit, mod_time=None,
             acc_time=None):
         """
@@ -94,46 +120,700 @@ class Library(list):
         self.masks = None
 
     @classmethod
-    def load(cls, stream):
+    def load(cls, stream, stats=None, progress=None):
         """
         Load a GDS library from a file.
 
         :param stream: a :class:`file` or file-like object opened for reading in binary mode.
+        :param stats: optional :class:`gdsii.instrument.IOStats` instance to
+            collect statistics into.
+        :param progress: optional function called with arguments
+            ``(bytes_done, bytes_total, structures_done)``, see
+            :mod:`gdsii.progress`. It can raise
+            :exc:`gdsii.exceptions.Cancelled` to stop loading.
         :returns: a new library.
         """
         self = cls.__new__(cls)
         list.__init__(self)
         self._init_optional()
 
-        gen = record.Reader(stream)
+        if stats is None:
+            gen = record.Reader(stream)
+        else:
+            gen = stats._reader(stream)
+        source = self._source = _Source(stream)
+        tick = interval = None
+        if progress is not None:
+            total = _stream_size(stream, source.base)
+            tick = lambda: progress(gen.end_offset, total, len(self))
+            interval = _interval(progress)
 
-        gen.read_next()
+        gen.advance()
         for obj in self._gds_objs:
             obj.read(self, gen)
 
         # read structures starting with BGNSTR or ENDLIB
-        rec = gen.current
+        tag = gen.tag
         while True:
-            if rec.tag == tags.BGNSTR:
-                self.append(structure.Structure._load(gen))
-                rec = gen.read_next()
-            elif rec.tag == tags.ENDLIB:
+            if tag == tags.BGNSTR:
+                if stats is None:
+                    struc = structure.Structure._load(gen, source, tick, interval)
+                else:
+                    struc = stats._load_structure(gen, source, tick, interval)
+                list.append(self, struc)
+                if tick is not None:
+                    tick()
+                tag = gen.advance()
+            elif tag == tags.ENDLIB:
                 break
             else:
-                raise exceptions.FormatError('unexpected tag where BGNSTR or ENDLIB are expected: %d', rec.tag)
+                raise exceptions.FormatError('unexpected tag where BGNSTR or ENDLIB are expected: %d' % tag)
         return self
 
-    def save(self, stream):
+    def save(self, stream, stats=None, source=None, progress=None, fracture=False,
+            verify=False):
         """
-        Save the library into a file.
+        Save the library into a file. XY record sizes of all elements are
+        checked before anything is written.
 
         :param stream: a :class:`file` or file-like object opened for writing in binary mode.
+        :param stats: optional :class:`gdsii.instrument.IOStats` instance to
+            collect statistics into.
+        :param source: the file this library was loaded from, opened for
+            reading in binary mode. Structures that were not modified
+            since loading are copied from it byte for byte (using
+            :func:`os.copy_file_range` or :func:`os.sendfile` when
+            possible) instead of being encoded again.
+        :param progress: optional function called with arguments
+            ``(bytes_done, None, structures_done)``, see
+            :mod:`gdsii.progress`. It can raise
+            :exc:`gdsii.exceptions.Cancelled` to stop saving, leaving
+            `stream` incomplete.
+        :param fracture: save boundaries with too many points for one XY
+            record as several boundaries, see :mod:`gdsii.fracture`.
+            The library itself is not changed.
+        :param verify: with `source`, encode structures changed since
+            loading even if :meth:`gdsii.structure.Structure.touch` was
+            not called. The first verified save encodes every unmodified
+            structure and compares it with its bytes in `source`, which
+            finds any change; later ones only find elements or XY lists
+            replaced since then, other in-place changes to elements,
+            like a new layer number, are not detected.
+        :raises ValueError: if `source` is not the unchanged file the
+            library was loaded from, or if it is the file being written.
+        :raises gdsii.exceptions.FormatError: if an element has too many
+            points and cannot be fractured.
         """
+        from . import fracture as _fracture
+        if source is not None:
+            self._check_source(source, stream)
+            if verify:
+                for struc in self:
+                    location = struc._source
+                    if location is None or location[0] is not self._source:
+                        continue
+                    if len(location) == 3:
+                        # first check: compare with the bytes in the file,
+                        # then remember element and XY identities
+                        if _encoded(struc) != _read_range(source,
+                                self._source.base + location[1], location[2] - location[1]):
+                            struc.touch()
+                        else:
+                            struc._cache('_source', location + (structure._signature(struc),))
+                    elif location[3] != structure._signature(struc):
+                        struc.touch()
+        copy_from = self._source if source is not None else None
+        encoded = [struc for struc in self if copy_from is None or struc._source is None
+                or struc._source[0] is not copy_from]
+        replacements = dict((id(struc), _fracture.fracture_structure(struc))
+                for struc in _fracture.check_structures(encoded, fracture))
+        if stats is not None:
+            stream = stats._counting_stream(stream)
         for obj in self._gds_objs:
             obj.save(self, stream)
-        for struc in self:
-            struc._save(stream)
+        # byte range of adjacent unmodified structures waiting to be copied
+        pending = None
+        tick = interval = None
+        if progress is not None:
+            # called within structures, `count` structures are done
+            tick = lambda: progress(_tell(stream), None, count)
+            interval = _interval(progress)
+        for (count, struc) in enumerate(self):
+            location = struc._source
+            if copy_from is not None and location is not None and location[0] is copy_from:
+                start, end = location[1:3]
+                if stats is not None:
+                    stats._structure_done(struc.name, 0.0, end - start)
+                if pending is not None and pending[1] == start:
+                    pending[1] = end
+                else:
+                    self._copy_structures(source, stream, pending)
+                    pending = [start, end]
+            else:
+                self._copy_structures(source, stream, pending)
+                pending = None
+                struc = replacements.get(id(struc), struc)
+                if stats is None:
+                    struc._save(stream, tick, interval)
+                else:
+                    stats._save_structure(struc, stream, tick, interval)
+            if progress is not None:
+                done = _tell(stream)
+                if done is not None and pending is not None:
+                    done += pending[1] - pending[0]
+                progress(done, None, count + 1)
+        self._copy_structures(source, stream, pending)
         record.Record(tags.ENDLIB).save(stream)
 
+    @classmethod
+    async def aload(cls, path, executor=None, progress=None):
+        """
+        Coroutine that loads a library from file `path` without blocking
+        the event loop. The file is read and parsed in `executor`, or in
+        the default executor of the loop if ``None``; many loads can share
+        one executor.
+
+        `progress` is called in the event loop with the same arguments as
+        for :meth:`load`. If the awaiting task is cancelled, loading stops
+        at the next structure boundary. With a
+        :class:`concurrent.futures.ProcessPoolExecutor` the library is
+        returned pickled, progress is not reported and loading cannot be
+        stopped once started.
+        """
+        return await _run_in_executor(executor, progress, _load_path, cls, path)
+
+    async def asave(self, path, executor=None, progress=None, source=None, fracture=False,
+            verify=False):
+        """
+        Coroutine that saves the library into file `path` in `executor`,
+        see :meth:`aload`. `source` is the name of the file the library
+        was loaded from; it, `fracture` and `verify` are used as in
+        :meth:`save`. If the awaiting task is
+        cancelled, saving stops at the next structure boundary and the
+        partially written file is removed.
+        """
+        return await _run_in_executor(executor, progress, _save_path, self, path, source,
+                fracture, verify)
+
+    def _copy_structures(self, source, stream, byte_range):
+        if byte_range is not None:
+            start, end = byte_range
+            _copy_range(source, stream, self._source.base + start, end - start)
+
+    def _check_source(self, source, stream):
+        """Raise :exc:`ValueError` if structures cannot be copied from `source`."""
+        if self._source is None:
+            raise ValueError('library was not loaded from a file')
+        key = _file_key(source)
+        if self._source.key is not None and key != self._source.key:
+            raise ValueError('source is not the unchanged file the library was loaded from')
+        out_key = _file_key(stream)
+        if key is not None and out_key is not None and key[:2] == out_key[:2]:
+            raise ValueError('cannot save into the file the library was loaded from')
+
+    @classmethod
+    def extract(cls, stream, top_names, out_stream):
+        """
+        Copy structures `top_names` with all structures they reference,
+        directly or not, from library file `stream` into a new library
+        file `out_stream`, without loading the library. Only record
+        headers and structure names are read, and structures are copied
+        byte for byte together with the library header.
+
+        :param stream: a :class:`file` or file-like object opened for reading in binary mode.
+        :param top_names: names of structures to extract.
+        :param out_stream: a :class:`file` or file-like object opened for writing in binary mode.
+        :returns: names of extracted structures in file order.
+        :raises KeyError: if one of `top_names` is not in the library.
+        """
+        buf, start, kernel_copy = _map_stream(stream)
+        try:
+            header_end, strucs = _scan_structures(buf, start)
+            by_name = {}
+            for struc in strucs:
+                by_name.setdefault(struc[0], struc)
+            wanted = set()
+            stack = [_key(name) for name in top_names]
+            for name in stack:
+                if name not in by_name:
+                    raise KeyError(name)
+            while stack:
+                name = stack.pop()
+                if name in wanted or name not in by_name:
+                    continue
+                wanted.add(name)
+                stack.extend(by_name[name][3])
+
+            ranges = [(start, header_end)]
+            names = []
+            for (name, begin, end, refs) in strucs:
+                if name in wanted and by_name[name][1] == begin:
+                    names.append(name)
+                    if ranges[-1][1] == begin:
+                        ranges[-1] = (ranges[-1][0], end)
+                    else:
+                        ranges.append((begin, end))
+            for (begin, end) in ranges:
+                if kernel_copy:
+                    _copy_range(stream, out_stream, begin, end - begin)
+                else:
+                    out_stream.write(buf[begin:end])
+            record.Record(tags.ENDLIB).save(out_stream)
+            return names
+        finally:
+            if isinstance(buf, memoryview):
+                buf.release()
+            elif isinstance(buf, mmap.mmap):
+                buf.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_names', '_graph', '_stale', '_duplicates', '_reordered', '_hashes'):
+            state.pop(name, None)
+        return state
+
+    def _index(self):
+        """Return the name index, building it or sorting its lists if needed."""
+        names = self._names
+        if names is None:
+            names = self._names = {}
+            for struc in self:
+                strucs = names.setdefault(_key(struc.name), [])
+                strucs.append(struc)
+                if len(strucs) == 2:
+                    self._duplicates += 1
+                struc._add_owner(self)
+            self._stale = {}
+        elif self._reordered:
+            self._reordered = False
+            for strucs in names.values():
+                del strucs[:]
+            for struc in self:
+                names[_key(struc.name)].append(struc)
+            if self._graph is not None:
+                for (name, strucs) in names.items():
+                    if self._graph.structures.get(name) is not strucs[0]:
+                        self._stale[name] = None
+        return names
+
+    def _update(self, removed, added, reordered):
+        """
+        Update the name index after structures `removed` and `added` were
+        removed from and added to the library. `reordered` tells if the
+        order of remaining structures changed or structures were added
+        elsewhere than at the end.
+        """
+        for struc in removed:
+            if struc._remove_owner(self):
+                # still in the library, the removed occurrence is not known
+                self._reordered = True
+            self._unindex(struc, _key(struc.name))
+        for struc in added:
+            struc._add_owner(self)
+            self._reindex(struc, _key(struc.name))
+        if reordered:
+            self._order_changed()
+
+    def _unindex(self, struc, name):
+        strucs = self._names[name]
+        for (i, other) in enumerate(strucs):
+            if other is struc:
+                break
+        del strucs[i]
+        if not strucs:
+            del self._names[name]
+        elif len(strucs) == 1:
+            self._duplicates -= 1
+        # with _reordered set the first structure is not known yet
+        if (i == 0 or self._reordered) and self._graph is not None:
+            self._stale[name] = None
+            if strucs:
+                # the name is now at the position of the next structure
+                self._graph._order = None
+
+    def _reindex(self, struc, name):
+        strucs = self._names.get(name)
+        if strucs is None:
+            self._names[name] = [struc]
+            graph = self._graph
+            if graph is not None:
+                # new names are added to the graph in this order
+                self._stale.pop(name, None)
+                self._stale[name] = None
+                if name in graph.structures:
+                    # removed and added again, now at the end
+                    graph._order = None
+        else:
+            strucs.append(struc)
+            if len(strucs) == 2:
+                self._duplicates += 1
+
+    def _order_changed(self):
+        if self._duplicates:
+            self._reordered = True
+        if self._graph is not None:
+            self._graph._order = None
+
+    def _structure_renamed(self, struc, old_name):
+        """Move `struc` from name `old_name` to its new name in the index."""
+        old_name = _key(old_name)
+        name = _key(struc.name)
+        for i in range(struc._owners[id(self)][1]):
+            self._unindex(struc, old_name)
+            self._reindex(struc, name)
+        self._order_changed()
+
+    def _structure_changed(self, struc):
+        """Mark graph entry of `struc` for update after it was modified."""
+        if self._graph is not None:
+            self._stale[_key(struc.name)] = None
+
+    def structure(self, name):
+        """
+        Return structure named `name` (:class:`bytes` or :class:`str`)
+        using an index that is updated when structures are added,
+        removed or renamed. If several structures have the same name, the
+        first one is returned.
+
+        :raises KeyError: if there is no such structure.
+        """
+        return self._index()[_key(name)][0]
+
+    def hierarchy(self):
+        """
+        Return :class:`gdsii.hierarchy.Hierarchy` with references between
+        structures of the library. It is kept up to date as structures
+        are added, removed, renamed or modified; only the references of
+        changed structures are scanned again.
+        """
+        from . import hierarchy
+        names = self._index()
+        graph = self._graph
+        if graph is None:
+            graph = self._graph = hierarchy.Hierarchy(strucs[0] for strucs in names.values())
+            graph._order_source = self._structure_names
+            self._stale.clear()
+        elif self._stale:
+            for name in self._stale:
+                strucs = names.get(name)
+                graph._set(name, strucs[0] if strucs else None)
+            self._stale.clear()
+        return graph
+
+    def _structure_names(self):
+        return [struc.name for struc in self]
+
+    def content_hash(self, name):
+        """
+        Return content hash of structure `name` (:class:`bytes`), which
+        covers its elements and everything it references but not names
+        of structures or timestamps, see :mod:`gdsii.contenthash`. Hashes
+        of all structures are computed at once and cached until the
+        library changes; unmodified structures are not encoded again.
+
+        :raises KeyError: if there is no such structure.
+        :raises ValueError: if references are recursive.
+        """
+        from . import contenthash
+        graph = self.hierarchy()
+        if self._hashes is None or self._hashes[:2] != (graph, graph._changes):
+            self._hashes = (graph, graph._changes, contenthash.content_hashes(graph))
+        return self._hashes[2][_key(name)]
+
+    def stats(self, top, refresh=False):
+        """
+        Return per-layer statistics of structure `top` with everything it
+        references, counting every placed instance but without flattening
+        the hierarchy. See :mod:`gdsii.layerstats`.
+
+        :param top: name of the top structure.
+        :param refresh: recompute statistics cached on structures, needed
+            after their elements were modified.
+        :returns: dictionary mapping layers to :class:`gdsii.layerstats.LayerStats`.
+        """
+        from . import layerstats
+        return layerstats.hierarchy_stats(self, top, refresh)
+
     def __repr__(self):
         return '<Library: %s>' % self.name.decode()
+
+def _key(name):
+    return name.encode() if isinstance(name, str) else name
+
+# List methods updating the name index with removed and added structures.
+
+def _append(self, struc):
+    list.append(self, struc)
+    if self._names is not None:
+        struc._add_owner(self)
+        self._reindex(struc, _key(struc.name))
+
+def _extend(self, strucs):
+    count = len(self)
+    list.extend(self, strucs)
+    if self._names is not None:
+        self._update((), self[count:], False)
+
+def _iadd(self, strucs):
+    _extend(self, strucs)
+    return self
+
+def _insert(self, index, struc):
+    at_end = index >= len(self)
+    list.insert(self, index, struc)
+    if self._names is not None:
+        self._update((), (struc,), not at_end)
+
+def _remove(self, value):
+    index = list.index(self, value)
+    struc = self[index]
+    list.__delitem__(self, index)
+    if self._names is not None:
+        self._update((struc,), (), False)
+
+def _pop(self, index=-1):
+    struc = list.pop(self, index)
+    if self._names is not None:
+        self._update((struc,), (), False)
+    return struc
+
+def _clear(self):
+    removed = list(self)
+    list.clear(self)
+    if self._names is not None:
+        self._update(removed, (), False)
+
+def _setitem(self, index, value):
+    if isinstance(index, slice):
+        value = list(value)
+        removed = list.__getitem__(self, index)
+        at_end = False
+    else:
+        removed = (self[index],)
+        value_list = (value,)
+        at_end = index == -1 or index == len(self) - 1
+    list.__setitem__(self, index, value)
+    if self._names is not None:
+        self._update(removed, value if isinstance(index, slice) else value_list, not at_end)
+
+def _delitem(self, index):
+    removed = list.__getitem__(self, index)
+    if not isinstance(index, slice):
+        removed = (removed,)
+    list.__delitem__(self, index)
+    if self._names is not None:
+        self._update(removed, (), False)
+
+def _imul(self, count):
+    removed = list(self) if count <= 0 else ()
+    added = list(self) * (count - 1) if count > 1 else ()
+    list.__imul__(self, count)
+    if self._names is not None:
+        self._update(removed, added, False)
+    return self
+
+def _sort(self, *args, **kwargs):
+    list.sort(self, *args, **kwargs)
+    if self._names is not None:
+        self._update((), (), True)
+
+def _reverse(self):
+    list.reverse(self)
+    if self._names is not None:
+        self._update((), (), True)
+
+for (_name, _func) in (('append', _append), ('extend', _extend), ('__iadd__', _iadd),
+        ('insert', _insert), ('remove', _remove), ('pop', _pop), ('clear', _clear),
+        ('__setitem__', _setitem), ('__delitem__', _delitem), ('__imul__', _imul),
+        ('sort', _sort), ('reverse', _reverse)):
+    _func.__name__ = _name
+    _func.__doc__ = getattr(list, _name).__doc__
+    setattr(Library, _name, _func)
+del _name, _func
+
+def _map_stream(stream):
+    """
+    Return tuple ``(buf, start, kernel_copy)``: buffer with contents of
+    `stream`, offset of the current position in it, and whether byte
+    ranges can be copied from `stream` with :func:`_copy_range`. Files
+    are memory mapped.
+    """
+    try:
+        start = stream.tell()
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        return buf, start, True
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        return stream.getbuffer(), stream.tell(), False
+    except AttributeError:
+        return stream.read(), 0, False
+
+# records needed to find structures and their references
+_DIRECTORY_TAGS = frozenset((tags.BGNSTR, tags.STRNAME, tags.SNAME, tags.ENDSTR, tags.ENDLIB))
+
+def _scan_structures(buf, start):
+    """
+    Find structures in library file contents `buf` starting at `start`
+    using :func:`gdsii.record.scan`. Returns tuple ``(header_end,
+    strucs)``, where `header_end` is offset of the first structure or
+    ENDLIB and `strucs` is a list of tuples ``(name, start, end, refs)``
+    with offsets of structures and sets of referenced names.
+    """
+    found, unused = record.scan(buf, _DIRECTORY_TAGS, start)
+    header_end = None
+    strucs = []
+    current = None
+    for (offset, size, tag) in found:
+        if tag == tags.BGNSTR:
+            if current is not None:
+                raise exceptions.FormatError('BGNSTR inside of a structure')
+            if header_end is None:
+                header_end = offset
+            current = [None, offset, None, set()]
+        elif tag == tags.ENDLIB:
+            if current is not None:
+                raise exceptions.FormatError('ENDLIB inside of a structure')
+            if header_end is None:
+                header_end = offset
+            return header_end, strucs
+        elif current is None:
+            raise exceptions.FormatError('%s outside of a structure' % record._tag_name(tag))
+        else:
+            if tag == tags.ENDSTR:
+                current[2] = offset + size
+                strucs.append(tuple(current))
+                current = None
+            else:
+                name = record._parse_ascii(bytes(buf[offset+4:offset+size]))
+                if tag == tags.STRNAME:
+                    current[0] = name
+                else:
+                    current[3].add(name)
+    raise exceptions.EndOfFileError
+
+def _file_key(stream):
+    """
+    Return tuple identifying the file open as `stream` and its state,
+    or ``None`` if it is not a file.
+    """
+    try:
+        st = os.fstat(stream.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def _load_path(cls, path, progress=None):
+    with open(path, 'rb') as stream:
+        return cls.load(stream, progress=progress)
+
+def _save_path(lib, path, source=None, fracture=False, verify=False, progress=None):
+    src = None
+    try:
+        if source is not None:
+            if os.path.exists(path) and os.path.samefile(path, source):
+                raise ValueError('cannot save into the file the library was loaded from')
+            src = open(source, 'rb')
+        with open(path, 'wb') as stream:
+            try:
+                lib.save(stream, source=src, progress=progress, fracture=fracture,
+                        verify=verify)
+            except exceptions.Cancelled:
+                stream.close()
+                os.remove(path)
+                raise
+    finally:
+        if src is not None:
+            src.close()
+
+async def _run_in_executor(executor, progress, func, *args):
+    """
+    Run `func` in `executor` passing it a progress function that
+    forwards calls to `progress` in the event loop and raises
+    :exc:`exceptions.Cancelled` after the awaiting task is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        return await loop.run_in_executor(executor, func, *args)
+    cancelled = threading.Event()
+    def report(*state):
+        if cancelled.is_set():
+            raise exceptions.Cancelled
+        if progress is not None:
+            loop.call_soon_threadsafe(progress, *state)
+    future = loop.run_in_executor(executor, functools.partial(func, *args, progress=report))
+    try:
+        return await future
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+class _Source(object):
+    """File a library was loaded from, with offset where reading started."""
+    __slots__ = ('base', 'key')
+
+    def __init__(self, stream):
+        try:
+            self.base = stream.tell()
+        except (AttributeError, OSError, ValueError):
+            self.base = 0
+        self.key = _file_key(stream)
+
+# functions copying bytes between file descriptors, called with
+# arguments (src_fd, dst_fd, offset, count) and returning bytes copied
+_FD_COPIES = []
+if hasattr(os, 'copy_file_range'):
+    _FD_COPIES.append(lambda src, dst, offset, count:
+            os.copy_file_range(src, dst, count, offset))
+if hasattr(os, 'sendfile'):
+    _FD_COPIES.append(lambda src, dst, offset, count:
+            os.sendfile(dst, src, offset, count))
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+def _read_range(src, offset, count):
+    """Return `count` bytes from `offset` in `src`."""
+    src.seek(offset)
+    return src.read(count)
+
+def _encoded(struc):
+    """Return `struc` as saved, or ``None`` if it cannot be saved."""
+    stream = io.BytesIO()
+    try:
+        struc._save(stream)
+    except exceptions.FormatError:
+        return None
+    return stream.getvalue()
+
+def _copy_range(src, dst, offset, count):
+    """
+    Copy `count` bytes from `offset` in `src` to the current position of
+    `dst`, in the kernel if both are regular files.
+    """
+    done = 0
+    try:
+        fds = (src.fileno(), dst.fileno()) if dst.seekable() else None
+    except (AttributeError, OSError, ValueError):
+        fds = None
+    if fds is not None:
+        dst.flush()
+        for copy in _FD_COPIES:
+            try:
+                while done < count:
+                    copied = copy(fds[0], fds[1], offset + done, count - done)
+                    if not copied:
+                        break
+                    done += copied
+            except OSError:
+                continue
+            break
+        # bring position of buffered `dst` in sync with its descriptor
+        dst.seek(os.lseek(fds[1], 0, os.SEEK_CUR))
+    if done < count:
+        src.seek(offset + done)
+        while done < count:
+            chunk = src.read(min(_COPY_CHUNK_SIZE, count - done))
+            if not chunk:
+                raise exceptions.EndOfFileError
+            dst.write(chunk)
+            done += len(chunk)
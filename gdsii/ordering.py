@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.ordering` --- element ordering for exposure
+=======================================================
+
+Raith writers expose elements in the order they are stored in a
+structure, so ordering elements along a space filling curve reduces beam
+and stage travel. This module computes one position per element,
+sorts positions by Hilbert or Morton keys, optionally grouped into write
+fields and refined with a windowed 2-opt heuristic, and builds
+reordered structures. Example::
+
+    struc = lib[0]
+    lib[0] = reorder(struc, field_size=100000, window=16)
+
+Requires numpy.
+"""
+from __future__ import absolute_import
+from . import elements, structure
+import numpy
+
+__all__ = ('element_positions', 'morton_keys', 'hilbert_keys', 'spatial_order',
+        'two_opt', 'travel_length', 'reorder')
+
+def element_positions(elems):
+    """
+    Return (n, 2) array with one position per element: the bounding box
+    center for boundaries, boxes, paths and FBMS paths, the center for
+    circles, the mean center for :class:`gdsii.elements.RaithCircleArray`
+    and the first point of XY for other elements.
+    """
+    xys = []
+    for elem in elems:
+        cls = elem.__class__
+        if cls is elements.RaithCircle:
+            xys.append([elem.center])
+        elif cls is elements.RaithCircleArray:
+            xys.append([tuple(elem.centers.mean(axis=0))] if len(elem) else [(0, 0)])
+        elif cls is elements.RaithFBMS:
+            xys.append(numpy.asarray(elem.xy).reshape(-1, 4)[1:, 1:3].tolist() or [(0, 0)])
+        elif cls in (elements.Boundary, elements.Box, elements.Path):
+            xys.append(elem.xy)
+        else:
+            xys.append(elem.xy[:1])
+    sizes = numpy.array([len(xy) for xy in xys], dtype=numpy.int64)
+    points = numpy.array([tuple(p) for xy in xys for p in xy], dtype=float).reshape(-1, 2)
+    if not len(xys):
+        return points
+    starts = numpy.cumsum(sizes) - sizes
+    low = numpy.minimum.reduceat(points, starts, axis=0)
+    high = numpy.maximum.reduceat(points, starts, axis=0)
+    return (low + high) / 2.
+
+def _grid(points, bits):
+    """Scale points to integer grid coordinates in [0, 2**bits)."""
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    if not len(points):
+        return numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.int64)
+    low = points.min(axis=0)
+    span = max((points.max(axis=0) - low).max(), 1e-300)
+    scaled = numpy.floor((points - low) / span * ((1 << bits) - 1) + 0.5).astype(numpy.int64)
+    return scaled[:, 0], scaled[:, 1]
+
+def _spread(v):
+    """Insert a zero bit after every bit of 32-bit integers."""
+    v = v & 0xffffffff
+    v = (v | (v << 16)) & 0x0000ffff0000ffff
+    v = (v | (v << 8)) & 0x00ff00ff00ff00ff
+    v = (v | (v << 4)) & 0x0f0f0f0f0f0f0f0f
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+def morton_keys(points, bits=16):
+    """Morton (Z-order) keys of (n, 2) points, `bits` per coordinate (at most 31)."""
+    x, y = _grid(points, bits)
+    return _spread(x) | (_spread(y) << 1)
+
+def hilbert_keys(points, bits=16):
+    """Hilbert curve keys of (n, 2) points, `bits` per coordinate (at most 31)."""
+    x, y = _grid(points, bits)
+    n = 1 << bits
+    keys = numpy.zeros(len(x), dtype=numpy.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        flip = ~ry & rx
+        x = numpy.where(flip, n - 1 - x, x)
+        y = numpy.where(flip, n - 1 - y, y)
+        x, y = numpy.where(ry, x, y), numpy.where(ry, y, x)
+        s >>= 1
+    return keys
+
+def spatial_order(points, curve='hilbert', bits=16, field_size=None):
+    """
+    Return permutation that sorts (n, 2) `points` along a space filling
+    curve, `curve` is ``'hilbert'`` or ``'morton'``.
+
+    If `field_size` is given, points are first grouped into square write
+    fields of this size, visited row by row in alternating direction,
+    and sorted along the curve within each field.
+    """
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    if curve == 'hilbert':
+        keys = hilbert_keys(points, bits)
+    elif curve == 'morton':
+        keys = morton_keys(points, bits)
+    else:
+        raise ValueError('unknown curve: %r' % curve)
+    if field_size is None:
+        return numpy.argsort(keys, kind='stable')
+    fx = numpy.floor(points[:, 0] / field_size).astype(numpy.int64)
+    fy = numpy.floor(points[:, 1] / field_size).astype(numpy.int64)
+    fx = numpy.where(fy % 2, -fx, fx)
+    return numpy.lexsort((keys, fx, fy))
+
+def travel_length(points, order=None):
+    """Total distance visiting `points` in `order` (default: as given)."""
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    if order is not None:
+        points = points[order]
+    d = numpy.diff(points, axis=0)
+    return numpy.hypot(d[:, 0], d[:, 1]).sum()
+
+def two_opt(points, order=None, window=32, passes=1):
+    """
+    Improve an open visiting `order` of `points` with a 2-opt heuristic
+    that only considers reversing runs of up to `window` elements.
+
+    Each pass sweeps the run lengths from 2 to `window`. For one run
+    length the gains of reversing the run after every position are
+    computed at once, and non-overlapping improving reversals are
+    applied together, so a pass takes O(n * window) vectorized work.
+    Passes stop early when nothing improves.
+
+    :returns: improved order as a new array
+    """
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    n = len(points)
+    order = numpy.arange(n) if order is None else numpy.array(order, dtype=numpy.int64)
+    if n < 3:
+        return order
+    ordered = points[order]
+    for unused in range(passes):
+        improved = False
+        for k in range(2, min(window, n - 1) + 1):
+            # reverse positions i + 1 .. j with j = i + k, edges past the
+            # end of the open path have zero length
+            x = ordered[:, 0]
+            y = ordered[:, 1]
+            edges = numpy.append(numpy.hypot(numpy.diff(x), numpy.diff(y)), 0.)
+            ab = edges[:n - k]
+            cd = edges[k:]
+            ac = numpy.hypot(x[k:] - x[:n - k], y[k:] - y[:n - k])
+            bd = numpy.append(numpy.hypot(x[k + 1:] - x[1:n - k], y[k + 1:] - y[1:n - k]), 0.)
+            candidates = numpy.flatnonzero(ab + cd - ac - bd > 1e-9)
+            if not len(candidates):
+                continue
+            # moves closer than k + 1 share an edge, keep the first of them
+            selected = []
+            last = -n
+            for start in candidates.tolist():
+                if start > last + k:
+                    selected.append(start)
+                    last = start
+            run = numpy.array(selected)[:, None] + 1 + numpy.arange(k)
+            perm = numpy.arange(n)
+            perm[run] = run[:, ::-1]
+            order = order[perm]
+            ordered = ordered[perm]
+            improved = True
+        if not improved:
+            break
+    return order
+
+def _reorder_circles(circles, curve, bits, field_size):
+    """Return copy of a :class:`RaithCircleArray` with rows in spatial order."""
+    order = spatial_order(circles.centers, curve, bits, field_size)
+    result = elements.RaithCircleArray.__new__(elements.RaithCircleArray)
+    result.xy = circles.xy[order]
+    result.layers = circles.layers[order]
+    result.data_types = circles.data_types[order]
+    result.widths = circles.widths[order]
+    return result
+
+def reorder(struc, curve='hilbert', bits=16, field_size=None, window=0, passes=1):
+    """
+    Return a new :class:`gdsii.structure.Structure` with the same name,
+    times and elements as `struc`, with elements sorted by
+    :func:`spatial_order` and, if `window` is not zero, refined by
+    :func:`two_opt`. Rows of :class:`gdsii.elements.RaithCircleArray`
+    elements are sorted too. Element objects are shared with `struc`,
+    except for circle arrays.
+    """
+    items = [_reorder_circles(elem, curve, bits, field_size)
+            if isinstance(elem, elements.RaithCircleArray) else elem for elem in struc]
+    points = element_positions(items)
+    order = spatial_order(points, curve, bits, field_size)
+    if window:
+        order = two_opt(points, order, window, passes)
+    result = structure.Structure(struc.name, struc.mod_time, struc.acc_time)
+    result.strclass = getattr(struc, 'strclass', None)
+    result.extend(items[i] for i in order)
+    return result
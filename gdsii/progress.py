@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.progress` --- progress reporting and cancellation
+=============================================================
+
+Long running operations (:meth:`gdsii.library.Library.load`,
+:meth:`gdsii.library.Library.save`, :meth:`gdsii.record.Record.iterate`
+and the asyncio variants of the first two) accept a `progress` argument.
+It is a function called with arguments ``(bytes_done, bytes_total,
+structures_done)`` after each structure and after every `interval`
+records or elements within a structure. The interval is taken from the
+`interval` attribute of the function if present, otherwise it is
+:data:`DEFAULT_INTERVAL`. Byte counts are ``None`` if they cannot be
+determined for the stream.
+
+The function can stop the operation by raising
+:exc:`gdsii.exceptions.Cancelled`. :class:`Progress` does that after
+:meth:`Progress.cancel` is called, possibly from another thread::
+
+    progress = Progress()
+    worker = threading.Thread(target=lambda: Library.load(stream, progress=progress))
+    worker.start()
+    ...
+    print(progress.fraction)
+    progress.cancel()
+"""
+from __future__ import absolute_import
+from . import exceptions
+import os
+import threading
+
+__all__ = ('DEFAULT_INTERVAL', 'Progress')
+
+#: Default number of records or elements between progress calls.
+DEFAULT_INTERVAL = 10000
+
+class Progress(object):
+    """
+    Progress function that stores the last reported state and supports
+    cancellation.
+
+    :param callback: optional function called with the same arguments
+    :param interval: number of records or elements between calls
+
+    Instance attributes `bytes_done`, `bytes_total` and
+    `structures_done` hold the last reported values.
+    """
+    def __init__(self, callback=None, interval=DEFAULT_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.bytes_done = None
+        self.bytes_total = None
+        self.structures_done = 0
+        self._cancel = threading.Event()
+
+    def __call__(self, bytes_done, bytes_total, structures_done):
+        self.bytes_done = bytes_done
+        self.bytes_total = bytes_total
+        self.structures_done = structures_done
+        if self._cancel.is_set():
+            raise exceptions.Cancelled
+        if self.callback is not None:
+            self.callback(bytes_done, bytes_total, structures_done)
+
+    def cancel(self):
+        """Make the operation stop with :exc:`gdsii.exceptions.Cancelled` at the next call."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        """``True`` after :meth:`cancel` was called."""
+        return self._cancel.is_set()
+
+    @property
+    def fraction(self):
+        """Fraction of bytes done, or ``None`` if not known."""
+        if self.bytes_done is None or not self.bytes_total:
+            return None
+        return self.bytes_done / float(self.bytes_total)
+
+def _interval(progress):
+    """Number of records or elements between calls of `progress`."""
+    return getattr(progress, 'interval', DEFAULT_INTERVAL)
+
+def _tell(stream):
+    """Return position in `stream` or ``None``."""
+    try:
+        return stream.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def _stream_size(stream, base):
+    """Return number of bytes in `stream` after `base` or ``None``."""
+    try:
+        return os.fstat(stream.fileno()).st_size - base
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        return len(stream.getbuffer()) - base
+    except (AttributeError, ValueError):
+        return None
@@ -24,16 +24,77 @@ This module contains classes for low-level GDSII I/O.
 """
 from __future__ import absolute_import
 from . import exceptions, tags, types
+from .progress import _interval, _stream_size, _tell
+from collections import OrderedDict
 from datetime import datetime
 import math
+import os
 import struct
 
+# C implementation of codecs is optional, set GDSII_NO_SPEEDUPS to disable it
+_speedups = None
+if not os.environ.get('GDSII_NO_SPEEDUPS'):
+    try:
+        from . import _speedups
+    except ImportError:
+        pass
+
 __all__ = [
     'Record',
     'Reader'
 ]
 
 _RECORD_HEADER_FMT = struct.Struct('>HH')
+_READ_CHUNK_SIZE = 256 * 1024
+_BITARRAY_FMT = struct.Struct('>H')
+_NATIVE_DOUBLE_FMT = struct.Struct('=d')
+_NATIVE_QWORD_FMT = struct.Struct('=Q')
+
+# Dedicated codecs for the record layouts found in nearly every element:
+# LAYER, DATATYPE, WIDTH, COLROW, timestamps, MAG/ANGLE, UNITS and a
+# 5-point (closed rectangle) XY. These are never evicted.
+_FIXED_CODECS = dict((key, struct.Struct('>%d%s' % (key[1], key[0]))) for key in (
+    ('h', 1),   # LAYER, DATATYPE, PATHTYPE, ...
+    ('h', 2),   # COLROW
+    ('h', 12),  # BGNLIB, BGNSTR
+    ('l', 1),   # WIDTH, BGNEXTN, ENDEXTN
+    ('l', 2),   # single point XY (SREF, TEXT)
+    ('l', 6),   # AREF XY
+    ('l', 10),  # box-shaped BOUNDARY XY
+    ('Q', 1),   # MAG, ANGLE
+    ('Q', 2),   # UNITS
+))
+
+# maximum number of variable-size codecs kept in _codec_cache
+_CODEC_CACHE_SIZE = 256
+
+_codec_cache = OrderedDict()
+
+def _get_codec(fmt, count):
+    """
+    Return a :class:`struct.Struct` for `count` big-endian values of
+    format character `fmt`. Common layouts come from :data:`_FIXED_CODECS`,
+    others are kept in a bounded LRU cache.
+
+        >>> _get_codec('h', 1) is _FIXED_CODECS[('h', 1)]
+        True
+        >>> _get_codec('l', 7) is _get_codec('l', 7)
+        True
+        >>> _get_codec('l', 7).format in ('>7l', b'>7l')
+        True
+    """
+    key = (fmt, count)
+    codec = _FIXED_CODECS.get(key)
+    if codec is not None:
+        return codec
+    try:
+        codec = _codec_cache.pop(key)
+    except KeyError:
+        codec = struct.Struct('>%d%s' % (count, fmt))
+        if len(_codec_cache) >= _CODEC_CACHE_SIZE:
+            _codec_cache.popitem(last=False)
+    _codec_cache[key] = codec
+    return codec
 
 def _parse_nodata(data):
     """Parse :const:`NODATA` data type. Does nothing."""
@@ -55,7 +116,7 @@ def _parse_bitarray(data):
     """
     if len(data) != 2:
         raise exceptions.IncorrectDataSize('BITARRAY')
-    (val,) = struct.unpack('>H', data)
+    (val,) = _BITARRAY_FMT.unpack(data)
     return val
 
 def _parse_int2(data):
@@ -76,7 +137,7 @@ def _parse_int2(data):
     data_len = len(data)
     if not data_len or (data_len % 2):
         raise exceptions.IncorrectDataSize('INT2')
-    return struct.unpack('>%dh' % (data_len//2), data)
+    return _get_codec('h', data_len//2).unpack(data)
 
 def _parse_int4(data):
     """
@@ -96,7 +157,7 @@ def _parse_int4(data):
     data_len = len(data)
     if not data_len or (data_len % 4):
         raise exceptions.IncorrectDataSize('INT4')
-    return struct.unpack('>%dl' % (data_len//4), data)
+    return _get_codec('l', data_len//4).unpack(data)
 
 def _int_to_real(num):
     """
@@ -139,7 +200,7 @@ def _parse_real8(data):
     data_len = len(data)
     if not data_len or (data_len % 8):
         raise exceptions.IncorrectDataSize('REAL8')
-    ints = struct.unpack('>%dQ' % (data_len//8), data)
+    ints = _get_codec('Q', data_len//8).unpack(data)
     return tuple(_int_to_real(n) for n in ints)
 
 def _parse_ascii(data):
@@ -193,7 +254,7 @@ def _pack_bitarray(data):
         >>> len(packed)
         2
     """
-    return struct.pack('>H', data)
+    return _BITARRAY_FMT.pack(data)
 
 def _pack_int2(data):
     """
@@ -206,9 +267,15 @@ def _pack_int2(data):
         True
         >>> len(packed)
         6
+        >>> _pack_int2([1.0, 2.7]) == struct.pack('>2h', 1, 2)
+        True
     """
-    size = len(data)
-    return struct.pack('>{0}h'.format(size), *[int(d) for d in data])
+    codec = _get_codec('h', len(data))
+    try:
+        return codec.pack(*data)
+    except struct.error:
+        # non-integer values, e.g. floats produced by numpy geometry
+        return codec.pack(*[int(d) for d in data])
 
 def _pack_int4(data):
     """
@@ -221,9 +288,15 @@ def _pack_int4(data):
         True
         >>> len(packed)
         12
+        >>> _pack_int4([1.0, -2.5]) == struct.pack('>2l', 1, -2)
+        True
     """
-    size = len(data)
-    return struct.pack('>{0}l'.format(size), *[int(d) for d in data])
+    codec = _get_codec('l', len(data))
+    try:
+        return codec.pack(*data)
+    except struct.error:
+        # non-integer values, e.g. floats produced by numpy geometry
+        return codec.pack(*[int(d) for d in data])
 
 def _real_to_int(fnum):
     """
@@ -239,7 +312,7 @@ def _real_to_int(fnum):
         1e-09
     """
     # first convert number to IEEE double and split it in parts
-    (ieee,) = struct.unpack('=Q', struct.pack('=d', fnum))
+    (ieee,) = _NATIVE_QWORD_FMT.unpack(_NATIVE_DOUBLE_FMT.pack(fnum))
     sign = ieee & 0x8000000000000000
     ieee_exp = (ieee >> 52) & 0x7ff
     ieee_mant = ieee & 0xfffffffffffff
@@ -287,8 +360,7 @@ def _pack_real8(data):
         >>> list(map(str, _parse_real8(packed)))
         ['0.0', '1.0', '-1.0', '0.5', '1e-09']
     """
-    size = len(data)
-    return struct.pack('>{0}Q'.format(size), *[_real_to_int(num) for num in data])
+    return _get_codec('Q', len(data)).pack(*[_real_to_int(num) for num in data])
 
 def _pack_ascii(data):
     r"""
@@ -298,8 +370,11 @@ def _pack_ascii(data):
         True
         >>> _pack_ascii(b'abc') == b'abc\0'
         True
+        >>> _pack_ascii(u'abc') == b'abc\0'
+        True
     """
-    data = data.encode('ascii')
+    if not isinstance(data, bytes):
+        data = data.encode('ascii')
     size = len(data)
     if size % 2:
         return data + b'\0'
@@ -314,6 +389,42 @@ _PACK_FUNCS = {
     types.ASCII: _pack_ascii
 }
 
+def _tag_name(tag):
+    """Tag name, if known, otherwise tag ID formatted as hex number."""
+    if tag in tags.REV_DICT:
+        return tags.REV_DICT[tag]
+    return '0x%04x' % tag
+
+def _to_points(tag, data):
+    """Convert flat XY data to list of points, see :attr:`Record.points`."""
+    data_size = len(data)
+    if not data_size or (data_size % 2):
+        raise exceptions.DataSizeError(tag)
+    return list(zip(data[::2], data[1::2]))
+
+def _to_times(tag, data):
+    """Convert timestamp data to datetimes, see :attr:`Record.times`."""
+    if len(data) != 12:
+        raise exceptions.DataSizeError(tag)
+
+    try:
+        mod_time = datetime(data[0]+1900, *data[1:6])
+    except ValueError:
+        mod_time = datetime(1900, 1, 1, 0, 0, 0)
+
+    try:
+        acc_time = datetime(data[6]+1900, *data[7:12])
+    except ValueError:
+        acc_time = datetime(1900, 1, 1, 0, 0, 0)
+
+    return mod_time, acc_time
+
+def _to_acls(tag, data):
+    """Convert LIBSECUR data to list of ACLs, see :attr:`Record.acls`."""
+    if len(data) % 3:
+        raise exceptions.DataSizeError(tag)
+    return list(zip(data[::3], data[1::3], data[2::3]))
+
 class Record(object):
     """
     Class for representing a GDSII record with attached data.
@@ -389,7 +500,7 @@ class Record(object):
             MissingRecord: Wanted: 3586, got: STRNAME
         """
         if self.tag != tag:
-            raise exceptions.MissingRecord('Wanted: %s, got: %s'%(tag, self.tag_name))
+            raise exceptions.MissingRecord('Wanted: %s, got: %s'%(tag, _tag_name(self.tag)))
 
     def check_size(self, size):
         """
@@ -463,9 +574,7 @@ class Record(object):
     @property
     def tag_name(self):
         """Tag name, if known, otherwise tag ID formatted as hex number."""
-        if self.tag in tags.REV_DICT:
-            return tags.REV_DICT[self.tag]
-        return '0x%04x' % self.tag
+        return _tag_name(self.tag)
 
     @property
     def tag_type(self):
@@ -501,10 +610,7 @@ class Record(object):
                 ...
             DataSizeError: 4099
         """
-        data_size = len(self.data)
-        if not data_size or (data_size % 2):
-            raise exceptions.DataSizeError(self.tag)
-        return [(self.data[i], self.data[i+1]) for i in range(0, data_size, 2)]
+        return _to_points(self.tag, self.data)
 
     @property
     def times(self):
@@ -529,20 +635,7 @@ class Record(object):
             >>> print(r.times[1].isoformat())
             1900-01-01T00:00:00
         """
-        if len(self.data) != 12:
-            raise exceptions.DataSizeError(self.tag)
-
-        try:
-            mod_time = datetime(self.data[0]+1900, *self.data[1:6])
-        except ValueError:
-            mod_time = datetime(1900, 1, 1, 0, 0, 0)
-
-        try:
-            acc_time = datetime(self.data[6]+1900, *self.data[7:12])
-        except ValueError:
-            acc_time = datetime(1900, 1, 1, 0, 0, 0)
-
-        return mod_time, acc_time
+        return _to_times(self.tag, self.data)
 
     @property
     def acls(self):
@@ -559,18 +652,23 @@ class Record(object):
                 ...
             DataSizeError: 15106
         """
-        if len(self.data) % 3:
-            raise exceptions.DataSizeError(self.tag)
-        return list(zip(self.data[::3], self.data[1::3], self.data[2::3]))
+        return _to_acls(self.tag, self.data)
 
     @classmethod
-    def iterate(cls, stream):
+    def iterate(cls, stream, progress=None):
         """
         Generator function for iterating over all records in a GDSII file.
         Yields :class:`Record` objects.
 
         :param stream: GDS file opened for reading in binary mode
+        :param progress: optional function called with arguments
+            ``(bytes_done, bytes_total, structures_done)`` every few
+            records, see :mod:`gdsii.progress`
         """
+        if progress is not None:
+            for rec in _iterate_with_progress(cls, stream, progress):
+                yield rec
+            return
         last = False
         while not last:
             rec = cls.read(stream)
@@ -578,17 +676,289 @@ class Record(object):
                 last = True
             yield rec
 
+def _iterate_with_progress(cls, stream, progress):
+    """:meth:`Record.iterate` calling `progress` every few records."""
+    start = _tell(stream)
+    total = _stream_size(stream, start or 0)
+    interval = _interval(progress)
+    structures = 0
+    count = 0
+    last = False
+    while not last:
+        rec = cls.read(stream)
+        if rec.tag == tags.ENDSTR:
+            structures += 1
+        elif rec.tag == tags.ENDLIB:
+            last = True
+        count += 1
+        if count == interval or last:
+            pos = _tell(stream)
+            progress(None if pos is None or start is None else pos - start, total, structures)
+            count = 0
+        yield rec
+
+def _py_read_record(buf, pos):
+    """
+    Parse a record starting at offset `pos` in `buf`.
+    Returns tuple ``(tag, data, end)`` or ``None`` if `buf` does not
+    contain the whole record.
+
+        >>> _py_read_record(b'\\x00\\x06\\x0d\\x02\\x00\\x05', 0)
+        (3330, (5,), 6)
+        >>> _py_read_record(b'\\x00\\x06\\x0d\\x02\\x00', 0) is None
+        True
+        >>> _py_read_record(b'\\x00\\x03\\x0d\\x02', 0)
+        Traceback (most recent call last):
+            ...
+        IncorrectDataSize: data size is too small
+    """
+    if len(buf) - pos < 4:
+        return None
+    data_size, tag = _RECORD_HEADER_FMT.unpack_from(buf, pos)
+    if data_size < 4:
+        raise exceptions.IncorrectDataSize('data size is too small')
+    if data_size % 2:
+        raise exceptions.IncorrectDataSize('data size is odd')
+    end = pos + data_size
+    if end > len(buf):
+        return None
+    tag_type = tag & 0xff # same as tags.type_of_tag()
+    try:
+        parse_func = _PARSE_FUNCS[tag_type]
+    except KeyError:
+        raise exceptions.UnsupportedTagType(tag_type)
+    return tag, parse_func(buf[pos+4:end]), end
+
+def _py_scan(buf, wanted_tags, pos, count_tag=None):
+    """Pure Python implementation of :func:`scan`."""
+    found = []
+    counts = {}
+    buf_len = len(buf)
+    unpack_from = _RECORD_HEADER_FMT.unpack_from
+    unpack_value = _FIXED_CODECS[('h', 1)].unpack_from
+    while buf_len - pos >= 4:
+        data_size, tag = unpack_from(buf, pos)
+        if data_size < 4:
+            raise exceptions.IncorrectDataSize('data size is too small')
+        if data_size % 2:
+            raise exceptions.IncorrectDataSize('data size is odd')
+        if data_size > buf_len - pos:
+            break
+        if tag == count_tag:
+            if data_size < 6:
+                raise exceptions.IncorrectDataSize('data size is too small')
+            value = unpack_value(buf, pos + 4)[0]
+            counts[value] = counts.get(value, 0) + 1
+        else:
+            if tag == tags.ENDSTR and counts:
+                found.extend((value, count, count_tag) for (value, count) in counts.items())
+                counts = {}
+            if tag in wanted_tags:
+                found.append((pos, data_size, tag))
+        pos += data_size
+        if tag == tags.ENDLIB:
+            break
+    return found, pos
+
+def scan(buf, wanted_tags, start=0, count_tag=None):
+    """
+    Scan record headers in `buf` starting at offset `start` without
+    parsing record data. Scanning stops after :const:`ENDLIB` or at the
+    first incomplete record.
+
+    If `count_tag` is given, records with this tag and INT2 data, like
+    :const:`LAYER`, are counted by their first value instead of being
+    reported one by one. Before each :const:`ENDSTR` one tuple
+    ``(value, count, count_tag)`` is reported for every value found in
+    the structure, in order of first appearance.
+
+    :param buf: :class:`bytes`, :class:`mmap` or other buffer object
+    :param wanted_tags: container of tags to report
+    :param count_tag: tag of records to count per structure
+    :returns: tuple ``(records, end)``, where `records` is a list of
+        tuples ``(offset, size, tag)`` for records with wanted tags and
+        `end` is offset where scanning stopped
+    :raises: :exc:`IncorrectDataSize` on invalid record headers
+
+        >>> from io import BytesIO
+        >>> stream = BytesIO()
+        >>> for rec in (Record(tags.BGNSTR, [0] * 12), Record(tags.STRNAME, b'A'),
+        ...         Record(tags.LAYER, (5,)), Record(tags.LAYER, (5,)), Record(tags.ENDSTR)):
+        ...     rec.save(stream)
+        >>> scan(stream.getvalue(), frozenset([tags.STRNAME]))
+        ([(28, 6, 1542)], 50)
+        >>> scan(stream.getvalue(), frozenset([tags.ENDSTR]), 0, tags.LAYER)
+        ([(5, 2, 3330), (46, 4, 1792)], 50)
+    """
+    return _scan_impl(buf, wanted_tags, start, count_tag)
+
+_read_record = _py_read_record
+_scan_impl = _py_scan
+
 class Reader(object):
-    """Class for buffered reading of Records"""
-    __slots__  = ('current', 'stream')
+    """
+    Class for buffered reading of Records.
+
+    The stream is read in large chunks and the tag and parsed data of the
+    current record are stored in :attr:`tag` and :attr:`data` instead of
+    creating a new :class:`Record` for every record. Note that the stream
+    can be read past the last record returned by the reader.
+
+        >>> from io import BytesIO
+        >>> stream = BytesIO()
+        >>> Record(tags.LAYER, (5,)).save(stream)
+        >>> Record(tags.ENDEL).save(stream)
+        >>> gen = Reader(BytesIO(stream.getvalue()))
+        >>> gen.advance() == tags.LAYER
+        True
+        >>> gen.data
+        (5,)
+        >>> gen.peek_tag() == tags.ENDEL
+        True
+        >>> gen.advance() == tags.ENDEL
+        True
+        >>> gen.offset
+        6
+        >>> gen.end_offset
+        10
+        >>> gen.peek_tag() is None
+        True
+        >>> gen.advance()
+        Traceback (most recent call last):
+            ...
+        EndOfFileError
+    """
+    __slots__ = ('stream', 'tag', 'data', 'offset', '_buf', '_pos',
+            '_buf_offset', '_chunk_size')
 
-    def __init__(self, stream):
+    def __init__(self, stream, chunk_size=_READ_CHUNK_SIZE):
         self.stream = stream
+        self.tag = None
+        self.data = None
+        self.offset = None
+        self._buf = b''
+        self._pos = 0
+        self._buf_offset = 0
+        self._chunk_size = chunk_size
+
+    def _fill(self, size):
+        """
+        Make sure that at least `size` unread bytes are buffered.
+        Returns ``False`` if end of file is reached before that.
+        """
+        rest = self._buf[self._pos:]
+        self._buf_offset += self._pos
+        self._pos = 0
+        chunks = [rest]
+        have = len(rest)
+        while have < size:
+            chunk = self.stream.read(max(self._chunk_size, size - have))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            have += len(chunk)
+        self._buf = b''.join(chunks)
+        return have >= size
+
+    def advance(self):
+        """
+        Read next record into :attr:`tag` and :attr:`data`.
+
+        :returns: tag of the new current record
+        :raises: :exc:`UnsupportedTagType` if data cannot be parsed
+        :raises: :exc:`EndOfFileError` if end of file is reached
+        """
+        result = _read_record(self._buf, self._pos)
+        if result is None:
+            self._fill_record()
+            result = _read_record(self._buf, self._pos)
+        tag, self.data, end = result
+        self.tag = tag
+        self.offset = self._buf_offset + self._pos
+        self._pos = end
+        return tag
+
+    def _fill_record(self):
+        """
+        Buffer the whole next record.
+        Raises :exc:`EndOfFileError` if the record is truncated.
+        """
+        if len(self._buf) - self._pos < 4 and not self._fill(4):
+            raise exceptions.EndOfFileError
+        # invalid sizes are reported by _read_record()
+        data_size = _RECORD_HEADER_FMT.unpack_from(self._buf, self._pos)[0]
+        if not self._fill(max(data_size, 4)):
+            raise exceptions.EndOfFileError
+
+    def peek_tag(self):
+        """
+        Return tag of the record following the current one without
+        reading it, or ``None`` if there are no more records.
+        """
+        if len(self._buf) - self._pos < 4 and not self._fill(4):
+            return None
+        return _RECORD_HEADER_FMT.unpack_from(self._buf, self._pos)[1]
 
     def read_next(self):
         """Read and return next record from stream."""
-        self.current = Record.read(self.stream)
-        return self.current
+        self.advance()
+        return Record(self.tag, self.data)
+
+    @property
+    def current(self):
+        """Current record as a new :class:`Record` instance."""
+        return Record(self.tag, self.data)
+
+    @property
+    def end_offset(self):
+        """Offset of the first byte after the current record."""
+        return self._buf_offset + self._pos
+
+    def check_tag(self, tag):
+        """
+        Raise :exc:`MissingRecord` if current record has different tag.
+        """
+        if self.tag != tag:
+            raise exceptions.MissingRecord('Wanted: %s, got: %s'%(tag, _tag_name(self.tag)))
+
+    def check_size(self, size):
+        """
+        Raise :exc:`DataSizeError` if current record data size is not `size`.
+        """
+        if len(self.data) != size:
+            raise exceptions.DataSizeError(self.tag)
+
+    @property
+    def points(self):
+        """Current record data as list of points, see :attr:`Record.points`."""
+        return _to_points(self.tag, self.data)
+
+    @property
+    def times(self):
+        """Current record data as timestamps, see :attr:`Record.times`."""
+        return _to_times(self.tag, self.data)
+
+    @property
+    def acls(self):
+        """Current record data as list of ACLs, see :attr:`Record.acls`."""
+        return _to_acls(self.tag, self.data)
+
+# use the C implementation of codecs if it is available
+if _speedups is not None:
+    _PARSE_FUNCS.update({
+        types.BITARRAY: _speedups.parse_bitarray,
+        types.INT2: _speedups.parse_int2,
+        types.INT4: _speedups.parse_int4,
+        types.REAL8: _speedups.parse_real8,
+        types.ASCII: _speedups.parse_ascii
+    })
+    _PACK_FUNCS.update({
+        types.INT2: _speedups.pack_int2,
+        types.INT4: _speedups.pack_int4,
+        types.REAL8: _speedups.pack_real8
+    })
+    _read_record = _speedups.read_record
+    _scan_impl = _speedups.scan
 
 if __name__ == '__main__':
     import doctest
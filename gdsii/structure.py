@@ -25,6 +25,7 @@ This module contains class that represents a GDSII structure.
 from __future__ import absolute_import
 from . import elements, record, tags, _records
 from datetime import datetime
+import weakref
 
 _STRNAME = _records.StringRecord('name', tags.STRNAME)
 _BGNSTR = _records.TimestampsRecord('mod_time', 'acc_time', tags.BGNSTR)
@@ -35,6 +36,13 @@ class Structure(list):
     GDSII structure class. This class is derived for :class:`list` and can
     contain one or more elements from :mod:`gdsii.elements`.
 
+    Changes made through list methods or by setting header attributes
+    are tracked: :attr:`version` changes and cached data, such as
+    statistics and the location in the file the structure was loaded
+    from, are dropped. Changes to elements themselves cannot be seen
+    by the structure, call :meth:`touch` after making them, or pass
+    ``verify=True`` to :meth:`gdsii.library.Library.save`.
+
     GDS syntax for the structure:
         .. productionlist::
             structure: BGNSTR
@@ -44,6 +52,20 @@ class Structure(list):
                      : ENDSTR
     """
     _gds_objs = (_BGNSTR, _STRNAME, _STRCLASS)
+    _header_attrs = frozenset(('name', 'mod_time', 'acc_time', 'strclass'))
+
+    # modification counter, cached statistics, references, hash and source location
+    _version = 0
+    _layer_stats = None
+    _references = None
+    _local_hash = None
+    _source = None
+    # set while cached data or the version may be in use; list methods
+    # call touch() only if it is set, so a series of changes is cheap
+    _tracked = False
+    # libraries with a name index containing the structure: dictionary
+    # mapping id of library to [weak reference, number of occurrences]
+    _owners = None
 
     def __init__(self, name, mod_time=None, acc_time=None):
         """
@@ -59,26 +81,225 @@ class Structure(list):
         """Initialize optional attributes to None."""
         self.strclass = None
 
+    def __setattr__(self, name, value):
+        if name in self._header_attrs:
+            old = self.__dict__.get(name)
+            list.__setattr__(self, name, value)
+            if name == 'name' and self._owners:
+                for lib in self._libraries():
+                    lib._structure_renamed(self, old)
+            self.touch()
+        else:
+            list.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_owners', None)
+        return state
+
+    def touch(self):
+        """Mark the structure as modified."""
+        d = self.__dict__
+        d['_version'] = self._version + 1
+        d['_layer_stats'] = d['_references'] = d['_local_hash'] = d['_source'] = None
+        d['_tracked'] = False
+        if self._owners:
+            for lib in self._libraries():
+                lib._structure_changed(self)
+
+    def _libraries(self):
+        """Return list of libraries with a name index containing the structure."""
+        result = []
+        for (key, (ref, unused)) in list(self._owners.items()):
+            lib = ref()
+            if lib is None:
+                del self._owners[key]
+            else:
+                result.append(lib)
+        return result
+
+    def _add_owner(self, lib):
+        owners = self._owners
+        if owners is None:
+            owners = self.__dict__['_owners'] = {}
+        entry = owners.get(id(lib))
+        if entry is None or entry[0]() is not lib:
+            owners[id(lib)] = [weakref.ref(lib), 1]
+        else:
+            entry[1] += 1
+
+    def _remove_owner(self, lib):
+        """Return the number of remaining occurrences in `lib`."""
+        entry = self._owners[id(lib)]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._owners[id(lib)]
+        return entry[1]
+
+    def _cache(self, name, value):
+        """Store cached data `value` in attribute `name` until the next change."""
+        d = self.__dict__
+        d[name] = value
+        d['_tracked'] = True
+
+    @property
+    def version(self):
+        """
+        Modification counter. It is incremented when the structure is
+        changed after the counter was read, so it differs between two
+        reads if there were changes in between.
+        """
+        self.__dict__['_tracked'] = True
+        return self._version
+
+    @property
+    def modified(self):
+        """
+        ``False`` if the structure was loaded from a file and not changed
+        since then.
+        """
+        return self._source is None
+
+    def simplify(self, grid=None, tolerance=0., layers=None):
+        """
+        Simplify :class:`gdsii.elements.Boundary` elements in place with
+        :func:`gdsii.utils.simplify_polygons`, e.g. before saving.
+        Vertices are rounded to integers and boundaries left without area
+        are removed. Requires numpy.
+
+        :param grid: grid to snap vertices to, in database units
+        :param tolerance: maximum outline change for Douglas-Peucker
+            simplification, in database units
+        :param layers: optional collection of layers to simplify
+        :returns: number of removed vertices
+        """
+        from . import utils
+        import numpy
+        boundaries = [i for (i, elem) in enumerate(self) if elem.__class__ is elements.Boundary
+                and (layers is None or elem.layer in layers)]
+        if not boundaries:
+            return 0
+        vertices, offsets = utils.pack_polygons(self[i] for i in boundaries)
+        result, new_offsets = utils.simplify_polygons(vertices, offsets, grid, tolerance)
+        points = [tuple(point) for point in numpy.rint(result).astype(numpy.int64).tolist()]
+        new_offsets = new_offsets.tolist()
+        removed = set()
+        kept = 0
+        for (j, i) in enumerate(boundaries):
+            xy = points[new_offsets[j]:new_offsets[j + 1]]
+            if len(set(xy)) < 3:
+                removed.add(i)
+            else:
+                self[i].xy = xy
+                kept += len(xy)
+        if removed:
+            list.__setitem__(self, slice(None),
+                    [elem for (i, elem) in enumerate(self) if i not in removed])
+        self.touch()
+        return len(vertices) - kept
+
     @classmethod
-    def _load(cls, gen):
+    def _load(cls, gen, source=None, tick=None, interval=None, account=None):
+        """
+        Load structure from `gen`. If `source` is not ``None``, it is
+        stored with the location of the structure in the file. If `tick`
+        is not ``None``, it is called after every `interval` elements.
+        If `account` is not ``None``, it is called with every element
+        and its size in bytes.
+        """
         self = cls.__new__(cls)
         list.__init__(self)
         self._init_optional()
+        start_offset = gen.offset
 
         for obj in self._gds_objs:
             obj.read(self, gen)
 
-        # read elements till ENDSTR
-        while gen.current.tag != tags.ENDSTR:
-            self.append(elements._Base._load(gen))
+        append = list.append
+        load = elements._Base._load
+        if tick is None and account is None:
+            # read elements till ENDSTR
+            while gen.tag != tags.ENDSTR:
+                append(self, load(gen))
+        else:
+            count = 0
+            while gen.tag != tags.ENDSTR:
+                offset = gen.offset
+                elem = load(gen)
+                append(self, elem)
+                if account is not None:
+                    account(elem, gen.offset - offset)
+                count += 1
+                if count == interval:
+                    tick()
+                    count = 0
+
+        if source is not None:
+            self._cache('_source', (source, start_offset, gen.end_offset))
         return self
 
-    def _save(self, stream):
+    def _save(self, stream, tick=None, interval=None, account=None):
+        """
+        Save structure into `stream`. If `tick` is not ``None``, it is
+        called after every `interval` elements. If `account` is not
+        ``None``, it is called with every element and its size in bytes,
+        measured with ``stream.tell()``.
+        """
         for obj in self._gds_objs:
             obj.save(self, stream)
-        for elem in self:
-            elem._save(stream)
+        if tick is None and account is None:
+            for elem in self:
+                elem._save(stream)
+        else:
+            count = 0
+            for elem in self:
+                if account is None:
+                    elem._save(stream)
+                else:
+                    offset = stream.tell()
+                    elem._save(stream)
+                    account(elem, stream.tell() - offset)
+                count += 1
+                if count == interval:
+                    tick()
+                    count = 0
         record.Record(tags.ENDSTR).save(stream)
 
     def __repr__(self):
         return '<Structure: %s>' % self.name.decode()
+
+def _xy_object(elem):
+    return elem._xy if elem.__class__ is elements.RaithCircle else getattr(elem, 'xy', None)
+
+def _signature(struc):
+    """
+    Return hash of identities of the elements of `struc` and of their XY
+    data, used to find structures changed without :meth:`Structure.touch`.
+    """
+    return hash((tuple(map(id, struc)), tuple(map(id, map(_xy_object, struc)))))
+
+def _modifier(name):
+    """Wrap list method `name` to mark structure as modified."""
+    method = getattr(list, name)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if self._tracked:
+            self.touch()
+        return result
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+def _append(self, elem):
+    list.append(self, elem)
+    if self._tracked:
+        self.touch()
+_append.__name__ = 'append'
+_append.__doc__ = list.append.__doc__
+
+for _name in ('extend', 'insert', 'remove', 'pop', 'clear', 'sort',
+        'reverse', '__setitem__', '__delitem__', '__iadd__', '__imul__'):
+    setattr(Structure, _name, _modifier(_name))
+del _name
+# append is the most frequent change and avoids the generic wrapper
+Structure.append = _append
@@ -1,5 +1,8 @@
 
 from numpy import array, cos, sin, pi, linspace, matrix
+import numpy
+
+from .elements import Boundary, Path, RaithCircle, RaithCircleArray
 
 #
 # The vector function
@@ -17,12 +20,12 @@ try:
 except ImportError:
     print("pyclipper is not installed.  needed for boolean operations")
 
-def union(p1, p2, operation=pyclipper.CT_UNION):
+def union(p1, p2, operation=pyclipper.CT_UNION, fill_type=pyclipper.PFT_EVENODD):
     pc = pyclipper.Pyclipper()
     pc.AddPath(p1, pyclipper.PT_SUBJECT, True)
     pc.AddPath(p2, pyclipper.PT_CLIP, True)
 
-    out = pc.Execute(operation, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+    out = pc.Execute(operation, fill_type, fill_type)
     return [array(p) for p in out]
 
 from functools import partial
@@ -31,9 +34,14 @@ difference = partial(union, operation=pyclipper.CT_DIFFERENCE)
 intersection = partial(union, operation=pyclipper.CT_INTERSECTION)
 xor = partial(union, operation=pyclipper.CT_XOR)
 
-# define boolean operations that act on lists of polygons
+# define boolean operations that act on lists of polygons. Polygons are
+# filled with the even-odd rule by default; pass fill_type=NONZERO for
+# outlines that overlap themselves, like those of paths_to_polygons.
+
+EVENODD = pyclipper.PFT_EVENODD
+NONZERO = pyclipper.PFT_NONZERO
 
-def unions(p1, p2, operation=pyclipper.CT_UNION):
+def unions(p1, p2, operation=pyclipper.CT_UNION, fill_type=EVENODD):
     pc = pyclipper.Pyclipper()
     
 
@@ -46,7 +54,7 @@ def unions(p1, p2, operation=pyclipper.CT_UNION):
         pc.AddPaths(p2, pyclipper.PT_CLIP, True)
         
 
-    out = pc.Execute(operation, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+    out = pc.Execute(operation, fill_type, fill_type)
     return [array(p) for p in out]
 
 
@@ -67,47 +75,327 @@ def rect(width, height=None, centered=True):
         p = p - v(0.5, 0.5)
     return array(p * v(width, height))
 
-def circle(r, th0=0, th1=2*pi, npoints=361):
-    """returns a polygon (2d numpy array) creating a circle"""
-    np = int((th1 - th0) / (2.*pi) * npoints)
+def _curve_points(r, th0, th1, npoints, max_chord_error):
+    """
+    Number of points on an arc from `th0` to `th1` of radius `r`, from
+    `npoints` per turn or, if `max_chord_error` is given, as few as keep
+    chords within `max_chord_error` of the arc.
+    """
+    if max_chord_error is None:
+        return int(abs(th1 - th0) / (2.*pi) * npoints)
+    steps = int(_arc_steps(abs(r), th1 - th0, max_chord_error))
+    if th0 != th1 and (th0 % (2*pi)) == (th1 % (2*pi)):
+        # full turns need at least a triangle, like Raith circles
+        steps = max(steps, 3)
+    return steps + 1
+
+def circle(r, th0=0, th1=2*pi, npoints=361, max_chord_error=None):
+    """
+    returns a polygon (2d numpy array) creating a circle, or a pie slice
+    if `th0` and `th1` do not span full turns. If `max_chord_error` is
+    given, the number of points depends on the radius instead of
+    `npoints`.
+    """
+    return ellipse(r, r, th0, th1, npoints, max_chord_error)
+
+def ellipse(rx, ry, th0=0, th1=2*pi, npoints=361, max_chord_error=None):
+    """returns a polygon (2d numpy array) creating an ellipse, see :func:`circle`"""
+    np = _curve_points(max(abs(rx), abs(ry)), th0, th1, npoints, max_chord_error)
     if np  < 1:
         return array([(0, 0),])
-    #     np = 1
-    p = [(r*cos(th), r*sin(th)) for th in linspace(th0, th1, np)]
+    th = linspace(th0, th1, np)
+    p = numpy.column_stack((rx*cos(th), ry*sin(th)))
     if (th0 % (2*pi)) != (th1 % (2*pi)):
-        p += [(0, 0), p[0]]
-    return array(p)
+        p = numpy.concatenate((p, [(0, 0)], p[:1]))
+    return p
 
-def ring(r0, r1, th0=0, th1=2*pi, npoints=361):
-    """return a polygon (2d np array) creating a ring"""
-    np = int(abs(th1 - th0) / (2.*pi) * npoints)
-    p  = [(r0*cos(th), r0*sin(th)) for th in linspace(th0, th1, np)]
-    p += [(r1*cos(th), r1*sin(th)) for th in linspace(th1, th0, np)]
-    p += [p[0]]
-    return array(p)
+def ring(r0, r1, th0=0, th1=2*pi, npoints=361, max_chord_error=None):
+    """
+    return a polygon (2d np array) creating a ring, or an arc if `th0`
+    and `th1` do not span full turns. If `max_chord_error` is given, the
+    number of points depends on the outer radius instead of `npoints`.
+    """
+    np = _curve_points(max(abs(r0), abs(r1)), th0, th1, npoints, max_chord_error)
+    th = linspace(th0, th1, np)
+    p = numpy.concatenate((numpy.column_stack((r0*cos(th), r0*sin(th))),
+            numpy.column_stack((r1*cos(th[::-1]), r1*sin(th[::-1])))))
+    return numpy.concatenate((p, p[:1]))
 
 def rot(th):
     return array([(cos(th), sin(th)), (-sin(th), cos(th))])
 
 deg = degree = pi / 180.
 
-# define a circle shaped polygon that can be substituded with a RaithCircle shape
-# so circles to show up in other .gds editors
+#
+# RaithCircle conversion.
+# Polygons for many circles are returned packed: `vertices` is a (n, 2)
+# array with all points and polygon i is vertices[offsets[i]:offsets[i+1]].
+#
+
+def raith_circle_polygons(centers, radii, arcs, verts, flags, widths, max_chord_error=None):
+    """
+    Return packed polygons ``(vertices, offsets)`` approximating Raith
+    circles given as arrays with one row per circle, with the same
+    meaning as the fields of :class:`gdsii.elements.RaithCircle`:
+    `centers` and `radii` are (n, 2), `arcs` (n, 2) in radians * 10^6,
+    `verts`, `flags` and `widths` (n,).
+
+    If `max_chord_error` is given, `verts` is ignored and each circle
+    gets as few vertices as keep its chords within `max_chord_error` of
+    the (outer) curve.
+
+    Filled circles (or circles with zero width) become a closed outline,
+    or a pie slice when arced. Rings become a single polygon going out
+    along the outer edge and back along the inner one.
+    """
+    centers = numpy.asarray(centers, dtype=float).reshape(-1, 2)
+    radii = numpy.asarray(radii, dtype=float).reshape(-1, 2)
+    arcs = numpy.asarray(arcs, dtype=float).reshape(-1, 2) / 1e6
+    flags = numpy.asarray(flags, dtype=numpy.int64)
+    widths = numpy.asarray(widths, dtype=float)
+    count = len(centers)
 
-def circleold():
-    r, r0 = radius, center
+    rx = radii[:, 0]
+    ry = numpy.where(flags & 1, radii[:, 1], rx)
+    arced = (flags & 4) > 0
+    ring = ((flags & 2) == 0) & (widths > 0)
+    t0 = numpy.where(arced, arcs[:, 0], 0.)
+    t1 = numpy.where(arced, arcs[:, 1], 2*pi)
+    half = numpy.where(ring, widths / 2., 0.)
+    if max_chord_error is not None:
+        # full circles have as many vertices as chords, arcs one more
+        steps = _arc_steps(numpy.maximum(numpy.abs(rx), numpy.abs(ry)) + half,
+                t1 - t0, max_chord_error)
+        verts = numpy.where(arced, steps + 1, steps)
+    verts = numpy.maximum(numpy.asarray(verts, dtype=numpy.int64), 3)
 
-    rarc = array(arc) / 1e6
+    # full circles repeat the first point at the end of each arc
+    m_out = numpy.where(arced, verts, verts + 1)
+    m_in = numpy.where(ring, m_out, 0)
+    has_center = (arced & ~ring).astype(numpy.int64)
+    has_close = (arced | ring).astype(numpy.int64)
+    sizes = m_out + m_in + has_center + has_close
+    offsets = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(sizes, out=offsets[1:])
+    vertices = numpy.empty((offsets[-1], 2))
 
-    path  = [v((r + width/2.) * cos(theta),
-               (r + width/2.) * sin(theta)) for theta in linspace(rarc[0], rarc[1], verts)]
-    if not filled and width > 0:
-        path += [v((r - width/2.) * cos(theta),
-                   (r - width/2.) * sin(theta)) for theta in linspace(rarc[1], rarc[0], verts)]
+    def arc_points(counts, start, stop, rxs, rys, first):
+        """Place `counts` points per circle on arcs at `offsets` + `first`."""
+        idx = numpy.repeat(numpy.arange(count), counts)
+        starts = numpy.cumsum(counts) - counts
+        k = numpy.arange(len(idx)) - numpy.repeat(starts, counts)
+        frac = k / numpy.maximum(counts[idx] - 1, 1).astype(float)
+        theta = start[idx] + (stop[idx] - start[idx]) * frac
+        pos = offsets[idx] + first[idx] + k
+        vertices[pos, 0] = centers[idx, 0] + rxs[idx] * cos(theta)
+        vertices[pos, 1] = centers[idx, 1] + rys[idx] * sin(theta)
+
+    zero = numpy.zeros(count, dtype=numpy.int64)
+    arc_points(m_out, t0, t1, rx + half, ry + half, zero)
+    arc_points(m_in, t1, t0, rx - half, ry - half, m_out)
+    sel = has_center > 0
+    vertices[offsets[:-1][sel] + m_out[sel]] = centers[sel]
+    sel = has_close > 0
+    vertices[offsets[1:][sel] - 1] = vertices[offsets[:-1][sel]]
+    return vertices, offsets
+
+def _raith_circle_columns(elements):
+    """
+    Collect :class:`gdsii.elements.RaithCircle` elements and
+    :class:`gdsii.elements.RaithCircleArray` containers from `elements`
+    into arrays ``(xy, layers, data_types, widths)``.
+    """
+    xy, layers, data_types, widths = [], [], [], []
+    circles = []
+    def flush():
+        if circles:
+            xy.append(numpy.array([c._xy for c in circles], dtype=numpy.int64).reshape(-1, 8))
+            layers.append(numpy.array([c.layer for c in circles], dtype=numpy.int64))
+            data_types.append(numpy.array([c.data_type for c in circles], dtype=numpy.int64))
+            widths.append(numpy.array([c.width or 0 for c in circles], dtype=numpy.int64))
+            del circles[:]
+    for elem in elements:
+        if isinstance(elem, RaithCircle):
+            circles.append(elem)
+        elif isinstance(elem, RaithCircleArray):
+            flush()
+            xy.append(elem.xy)
+            layers.append(elem.layers)
+            data_types.append(elem.data_types)
+            widths.append(elem.widths)
+    flush()
+    if not xy:
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return numpy.zeros((0, 8), dtype=numpy.int64), empty, empty, empty
+    return (numpy.concatenate(xy), numpy.concatenate(layers),
+            numpy.concatenate(data_types), numpy.concatenate(widths))
+
+def raith_circles_to_polygons(circles, max_chord_error=None):
+    """
+    Return packed polygons ``(vertices, offsets)`` for all
+    :class:`gdsii.elements.RaithCircle` elements and
+    :class:`gdsii.elements.RaithCircleArray` containers in `circles`,
+    which can be a structure or any other iterable of elements. Other
+    elements are skipped. See :func:`raith_circle_polygons` for
+    `max_chord_error`.
+    """
+    xy, layers, data_types, widths = _raith_circle_columns(circles)
+    return raith_circle_polygons(xy[:, 0:2], xy[:, 2:4], xy[:, 4:6], xy[:, 6],
+            xy[:, 7], widths, max_chord_error)
+
+def raith_circles_to_boundaries(circles, max_chord_error=None):
+    """
+    Return a list of :class:`gdsii.elements.Boundary` elements replacing
+    the Raith circles in `circles` (see :func:`raith_circles_to_polygons`),
+    so the circles show up in other .gds editors. Layer and data type
+    are kept.
+    """
+    xy, layers, data_types, widths = _raith_circle_columns(circles)
+    vertices, offsets = raith_circle_polygons(xy[:, 0:2], xy[:, 2:4], xy[:, 4:6],
+            xy[:, 6], xy[:, 7], widths, max_chord_error)
+    vertices = numpy.rint(vertices).astype(numpy.int64)
+    return [Boundary(int(layers[i]), int(data_types[i]), vertices[offsets[i]:offsets[i+1]])
+            for i in range(len(layers))]
+
+
+#
+# FBMS paths.
+# RAITHFBMS XY data is a sequence of 4-integer vertex records, stored as
+# pairs of points: a header record of zeros, then (0, x, y, 0) for the
+# start point and (type, x, y, r) for each following point, where type
+# is 1 for a straight segment and 2 for an arc. For arcs, r is the
+# sagitta: distance from the middle of the chord to the arc. Positive
+# values bulge to the left of the direction of travel.
+#
 
-    return Boundary(layer, data_type, [p + r0 for p in path])
+def fbms_encode(vertices, offsets, sagittas=None):
+    """
+    Encode many paths as RAITHFBMS XY data at once.
 
+    :param vertices: (n, 2) array with points of all paths
+    :param offsets: (m + 1,) array, path i is vertices[offsets[i]:offsets[i+1]]
+    :param sagittas: optional (n,) array with sagitta of the segment ending
+        at each vertex (0 for straight segments, ignored for first vertices)
+    :returns: packed ``(points, point_offsets)`` where
+        points[point_offsets[i]:point_offsets[i+1]] is the XY data for
+        :class:`gdsii.elements.RaithFBMS` for path i
+    """
+    vertices = numpy.rint(numpy.asarray(vertices, dtype=float)).astype(numpy.int64).reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    npaths = len(offsets) - 1
+    if sagittas is None:
+        sagittas = numpy.zeros(len(vertices), dtype=numpy.int64)
+    else:
+        sagittas = numpy.rint(numpy.asarray(sagittas, dtype=float)).astype(numpy.int64)
+    sagittas = sagittas.copy()
+    kinds = numpy.where(sagittas != 0, 2, 1)
+    firsts = offsets[:-1][numpy.diff(offsets) > 0]
+    kinds[firsts] = 0
+    sagittas[firsts] = 0
 
+    # one header record per path, followed by one record per vertex
+    records = numpy.zeros((len(vertices) + npaths, 4), dtype=numpy.int64)
+    path_of_vertex = numpy.repeat(numpy.arange(npaths), numpy.diff(offsets))
+    rows = numpy.arange(len(vertices)) + path_of_vertex + 1
+    records[rows, 0] = kinds
+    records[rows, 1:3] = vertices
+    records[rows, 3] = sagittas
+    point_offsets = 2 * (offsets + numpy.arange(npaths + 1))
+    return records.reshape(-1, 2), point_offsets
+
+def fbms_decode(points, point_offsets=None):
+    """
+    Decode RAITHFBMS XY data into segments.
+
+    :param points: XY data of one element (list of points), or packed
+        points of many elements with `point_offsets` as returned by
+        :func:`fbms_encode`
+    :returns: ``(starts, ends, sagittas, segment_offsets)``, where the
+        segments of path i are rows segment_offsets[i]:segment_offsets[i+1]
+        of (k, 2) arrays `starts` and `ends` and (k,) array `sagittas`
+        (0 for straight segments)
+    """
+    records = numpy.asarray(points, dtype=numpy.int64).reshape(-1, 4)
+    if point_offsets is None:
+        point_offsets = [0, 2 * len(records)]
+    rec_offsets = numpy.asarray(point_offsets, dtype=numpy.int64) // 2
+    npaths = len(rec_offsets) - 1
+    counts = numpy.diff(rec_offsets)
+    # segment ends are all records except header and start of each path
+    is_end = numpy.ones(len(records), dtype=bool)
+    heads = rec_offsets[:-1][counts > 0]
+    is_end[heads] = False
+    is_end[heads[counts[counts > 0] > 1] + 1] = False
+    end_rows = numpy.nonzero(is_end)[0]
+    starts = records[end_rows - 1, 1:3]
+    ends = records[end_rows, 1:3]
+    sagittas = numpy.where(records[end_rows, 0] == 2, records[end_rows, 3], 0)
+    segment_offsets = numpy.zeros(npaths + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.maximum(counts - 2, 0), out=segment_offsets[1:])
+    return starts, ends, sagittas, segment_offsets
+
+def _arc_steps(radius, sweep, max_chord_error):
+    """Number of chords needed for arcs so chord error <= `max_chord_error`."""
+    if not max_chord_error > 0:
+        raise ValueError('max_chord_error must be positive')
+    radius = numpy.asarray(radius, dtype=float)
+    ratio = numpy.clip(1. - max_chord_error / numpy.maximum(radius, 1e-300), -1., 1.)
+    step = 2. * numpy.arccos(ratio)
+    return numpy.maximum(numpy.ceil(numpy.abs(sweep) / numpy.maximum(step, 1e-12)), 1).astype(numpy.int64)
+
+def fbms_sample(starts, ends, sagittas, segment_offsets, max_chord_error=1.):
+    """
+    Sample decoded FBMS segments (see :func:`fbms_decode`) into
+    polylines. Arcs are split so the distance between chords and the arc
+    is at most `max_chord_error`.
+
+    :returns: packed ``(vertices, offsets)`` with one polyline per path
+    """
+    starts = numpy.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = numpy.asarray(ends, dtype=float).reshape(-1, 2)
+    sag = numpy.asarray(sagittas, dtype=float)
+    segment_offsets = numpy.asarray(segment_offsets, dtype=numpy.int64)
+    npaths = len(segment_offsets) - 1
+
+    chord = ends - starts
+    c = numpy.hypot(chord[:, 0], chord[:, 1])
+    curved = (sag != 0) & (c > 0)
+    safe_sag = numpy.where(curved, sag, 1.)
+    radius = (c * c / 4. + safe_sag * safe_sag) / (2. * numpy.abs(safe_sag))
+    normal = numpy.stack([-chord[:, 1], chord[:, 0]], axis=1) / numpy.maximum(c, 1e-300)[:, None]
+    center = (starts + ends) / 2. - normal * (numpy.sign(safe_sag) * (radius - numpy.abs(safe_sag)))[:, None]
+    sweep = -numpy.sign(safe_sag) * 4. * numpy.arctan2(2. * numpy.abs(safe_sag), c)
+    a0 = numpy.arctan2(starts[:, 1] - center[:, 1], starts[:, 0] - center[:, 0])
+    steps = numpy.where(curved, _arc_steps(radius, sweep, max_chord_error), 1)
+
+    # each path starts with its first point, every segment adds `steps` points
+    seg_path = numpy.repeat(numpy.arange(npaths), numpy.diff(segment_offsets))
+    has_segments = numpy.diff(segment_offsets) > 0
+    sizes = numpy.zeros(npaths, dtype=numpy.int64)
+    if len(steps):
+        sizes[has_segments] = numpy.add.reduceat(steps, segment_offsets[:-1][has_segments]) + 1
+    offsets = numpy.zeros(npaths + 1, dtype=numpy.int64)
+    numpy.cumsum(sizes, out=offsets[1:])
+    vertices = numpy.empty((offsets[-1], 2))
+    vertices[offsets[:-1][has_segments]] = starts[segment_offsets[:-1][has_segments]]
+
+    seg = numpy.repeat(numpy.arange(len(steps)), steps)
+    seg_first = numpy.cumsum(steps) - steps
+    k = numpy.arange(len(seg)) - seg_first[seg] + 1
+    t = k / steps[seg].astype(float)
+    theta = a0[seg] + sweep[seg] * t
+    arc = center[seg] + radius[seg][:, None] * numpy.stack([cos(theta), sin(theta)], axis=1)
+    line = starts[seg] + chord[seg] * t[:, None]
+    points = numpy.where(curved[seg][:, None], arc, line)
+    # exact end points for every segment
+    last = k == steps[seg]
+    points[last] = ends[seg[last]]
+    # samples of a path follow its start point
+    path = seg_path[seg]
+    path_first = seg_first[segment_offsets[path]]
+    pos = offsets[path] + 1 + numpy.arange(len(seg)) - path_first
+    vertices[pos] = points
+    return vertices, offsets
 
 def to_fbms_path(path):
     # convert a standard path which has the format of a list of 2-vectors to
@@ -115,11 +403,408 @@ def to_fbms_path(path):
     # FBMS element allows a 3rd option which specifies a radius of curvature between to point,
     # and then wants that repacked in pairs of 2 vectors.
     # the radius is specified as the distance from between the midpoint of the vertex and the vertex previous the fbms line curves to.
-    fbms = [(0, 0), (0, 0)]
-    fbms += [(0, path[0][0]), (path[0][1], 0)]
-    for p in path[1:]:
-        if len(p) < 3 or p[2] == 0:
-            fbms += [(1, p[0]), (p[1], 0)]
-        else:
-            fbms += [(2, p[0]), (p[1], p[2])]
-    return fbms
+    vertices = numpy.array([(p[0], p[1]) for p in path], dtype=float).reshape(-1, 2)
+    sagittas = numpy.array([p[2] if len(p) > 2 else 0 for p in path], dtype=float)
+    points, unused_offsets = fbms_encode(vertices, [0, len(vertices)], sagittas)
+    return [tuple(p) for p in points.tolist()]
+
+#
+# Measures of many polygons at once.
+# Polygons are packed like the RaithCircle conversion output and may be
+# given with or without the first point repeated at the end.
+#
+
+def pack_polygons(polygons):
+    """
+    Pack polygons into ``(vertices, offsets)``. `polygons` can contain
+    point lists or elements with an `xy` attribute, such as
+    :class:`gdsii.elements.Boundary`.
+    """
+    xys = [getattr(p, 'xy', p) for p in polygons]
+    offsets = numpy.zeros(len(xys) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(xy) for xy in xys], out=offsets[1:])
+    vertices = numpy.array([tuple(p) for xy in xys for p in xy], dtype=float).reshape(-1, 2)
+    return vertices, offsets
+
+def _packed_sum(values, offsets):
+    """Sum `values` for each packed polygon, handling empty ones."""
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    sums = numpy.zeros((len(offsets) - 1,) + values.shape[1:])
+    nonempty = numpy.diff(offsets) > 0
+    if nonempty.any():
+        sums[nonempty] = numpy.add.reduceat(values, offsets[:-1][nonempty], axis=0)
+    return sums
+
+def _packed_edges(vertices, offsets):
+    """
+    Return start and end points of every edge, closing each polygon, and
+    the first vertex of each polygon. Edge points are relative to the
+    first vertex of their polygon, so that cross products do not lose
+    precision far from the origin.
+    """
+    vertices = numpy.asarray(vertices, dtype=float).reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    sizes = numpy.diff(offsets)
+    nonempty = sizes > 0
+    origins = numpy.zeros((len(sizes), 2))
+    origins[nonempty] = vertices[offsets[:-1][nonempty]]
+    local = vertices - numpy.repeat(origins, sizes, axis=0)
+    nxt = numpy.arange(1, len(vertices) + 1)
+    nxt[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+    return local, local[nxt], origins
+
+def polygon_areas(vertices, offsets):
+    """
+    Signed areas of packed polygons, positive for counterclockwise
+    polygons.
+    """
+    p, q, unused = _packed_edges(vertices, offsets)
+    cross = p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1]
+    return _packed_sum(cross, offsets) / 2.
+
+def polygon_orientations(vertices, offsets):
+    """
+    Winding of packed polygons: 1 for counterclockwise, -1 for clockwise
+    and 0 for polygons without area.
+    """
+    return numpy.sign(polygon_areas(vertices, offsets)).astype(numpy.int8)
+
+def polygon_perimeters(vertices, offsets):
+    """Perimeters of packed polygons."""
+    p, q, unused = _packed_edges(vertices, offsets)
+    d = q - p
+    return _packed_sum(numpy.hypot(d[:, 0], d[:, 1]), offsets)
+
+def polygon_centroids(vertices, offsets):
+    """
+    Centroids of packed polygons as a (m, 2) array. Polygons without
+    area get the mean of their vertices, empty polygons get NaN.
+    """
+    p, q, origins = _packed_edges(vertices, offsets)
+    cross = p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1]
+    area = _packed_sum(cross, offsets) / 2.
+    moments = _packed_sum((p + q) * cross[:, None], offsets)
+    sizes = numpy.diff(numpy.asarray(offsets, dtype=numpy.int64))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        centroids = moments / (6. * area[:, None])
+        means = _packed_sum(p, offsets) / sizes[:, None]
+    flat = area == 0
+    centroids[flat] = means[flat]
+    return centroids + origins
+
+#
+# Polygon simplification.
+# Packed polygons may repeat their first vertex at the end; the closing
+# vertex is removed before and restored after simplification.
+#
+
+def snap_to_grid(vertices, grid):
+    """Round coordinates to the nearest multiple of `grid`."""
+    return numpy.rint(numpy.asarray(vertices, dtype=float) / grid) * grid
+
+def _packed_select(vertices, offsets, keep):
+    """Return packed polygons with the vertices where `keep` is true."""
+    counts = _packed_sum(keep.astype(numpy.int64), offsets).astype(numpy.int64)
+    new_offsets = numpy.zeros(len(offsets), dtype=numpy.int64)
+    numpy.cumsum(counts, out=new_offsets[1:])
+    return vertices[keep], new_offsets
+
+def _ring_neighbours(offsets, count):
+    """Return indices of previous and next vertices within each polygon."""
+    prev = numpy.arange(-1, count - 1)
+    nxt = numpy.arange(1, count + 1)
+    nonempty = numpy.diff(offsets) > 0
+    starts = offsets[:-1][nonempty]
+    ends = offsets[1:][nonempty]
+    prev[starts] = ends - 1
+    nxt[ends - 1] = starts
+    return prev, nxt
+
+def _remove_duplicates(vertices, offsets):
+    """Keep one vertex of each run of equal consecutive vertices."""
+    prev, unused = _ring_neighbours(offsets, len(vertices))
+    same = (vertices == vertices[prev]).all(axis=1)
+    # polygons with a single distinct vertex keep their first one
+    sizes = numpy.diff(offsets)
+    single = (_packed_sum(same.astype(numpy.int64), offsets) == sizes) & (sizes > 0)
+    same[offsets[:-1][single]] = False
+    return _packed_select(vertices, offsets, ~same)
+
+def _remove_collinear(vertices, offsets):
+    """Remove vertices in the middle of straight runs."""
+    prev, nxt = _ring_neighbours(offsets, len(vertices))
+    a = vertices - vertices[prev]
+    b = vertices[nxt] - vertices
+    cross = a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+    dot = (a * b).sum(axis=1)
+    remove = (cross == 0) & (dot > 0)
+    return _packed_select(vertices, offsets, ~remove)
+
+def _douglas_peucker(vertices, offsets, tolerance):
+    """
+    Douglas-Peucker simplification of all rings at once. Each ring is
+    split at its first vertex and the vertex farthest from it, then all
+    pending ranges of all rings are refined together, one level per
+    iteration.
+    """
+    sizes = numpy.diff(offsets)
+    keep = numpy.zeros(len(vertices), dtype=bool)
+    small = numpy.repeat(sizes <= 3, sizes)
+    keep[small] = True
+    rings = numpy.nonzero(sizes > 3)[0]
+    if not len(rings):
+        return vertices, offsets
+    starts = offsets[rings]
+    ends = offsets[rings + 1]
+    counts = ends - starts
+    group = numpy.repeat(numpy.arange(len(rings)), counts)
+    pos = numpy.arange(counts.sum()) + numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts)
+    d = vertices[pos] - vertices[starts][group]
+    far, unused = _group_argmax(numpy.hypot(d[:, 0], d[:, 1]), group, counts, pos)
+    keep[starts] = True
+    keep[far] = True
+    x = numpy.ascontiguousarray(vertices[:, 0])
+    y = numpy.ascontiguousarray(vertices[:, 1])
+    # ranges: end point indices `s` and `e`, interior vertices lo .. hi-1
+    s = numpy.concatenate((starts, far))
+    e = numpy.concatenate((far, starts))
+    lo = numpy.concatenate((starts + 1, far + 1))
+    hi = numpy.concatenate((far, ends))
+    while len(s):
+        counts = hi - lo
+        sel = counts > 0
+        s, e, lo, hi, counts = s[sel], e[sel], lo[sel], hi[sel], counts[sel]
+        if not len(s):
+            break
+        group = numpy.repeat(numpy.arange(len(s)), counts)
+        pos = numpy.arange(counts.sum()) + numpy.repeat(lo - (numpy.cumsum(counts) - counts), counts)
+        # distance from the line through both end points, or from the
+        # first end point if they coincide
+        ax, ay = x[s], y[s]
+        dx, dy = x[e] - ax, y[e] - ay
+        length = numpy.hypot(dx, dy)
+        degenerate = length == 0
+        length[degenerate] = 1.
+        dx /= length
+        dy /= length
+        px = x[pos] - ax[group]
+        py = y[pos] - ay[group]
+        dist = numpy.abs(dx[group] * py - dy[group] * px)
+        if degenerate.any():
+            sel = degenerate[group]
+            dist[sel] = numpy.hypot(px[sel], py[sel])
+        m, maxima = _group_argmax(dist, group, counts, pos)
+        split = maxima > tolerance
+        m = m[split]
+        keep[m] = True
+        s, e, lo, hi = (numpy.concatenate((s[split], m)), numpy.concatenate((m, e[split])),
+                numpy.concatenate((lo[split], m + 1)), numpy.concatenate((m, hi[split])))
+    return _packed_select(vertices, offsets, keep)
+
+def _group_argmax(values, group, counts, pos):
+    """Return `pos` of the first largest of `values` in each group."""
+    maxima = numpy.maximum.reduceat(values, numpy.cumsum(counts) - counts)
+    candidates = numpy.flatnonzero(values == maxima[group])
+    groups = group[candidates]
+    first = numpy.ones(len(candidates), dtype=bool)
+    first[1:] = groups[1:] != groups[:-1]
+    return pos[candidates[first]], maxima
+
+def simplify_polygons(vertices, offsets, grid=None, tolerance=0.):
+    """
+    Simplify packed polygons: snap vertices to `grid` if given, remove
+    repeated vertices and vertices in the middle of straight edges, and,
+    if `tolerance` is positive, remove vertices with the Douglas-Peucker
+    algorithm so that the outline moves by at most `tolerance`. All
+    polygons are processed at once.
+
+    Polygons that repeat their first vertex at the end still do so in
+    the result. Polygons with less than three vertices left have no
+    area and are left for the caller to drop.
+
+    :returns: packed polygons ``(vertices, offsets)``, one per input polygon
+    """
+    vertices = numpy.asarray(vertices, dtype=float).reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    if grid is not None:
+        vertices = snap_to_grid(vertices, grid)
+    sizes = numpy.diff(offsets)
+    closed = numpy.zeros(len(sizes), dtype=bool)
+    multi = numpy.nonzero(sizes > 1)[0]
+    closed[multi] = (vertices[offsets[multi]] == vertices[offsets[multi + 1] - 1]).all(axis=1)
+    keep = numpy.ones(len(vertices), dtype=bool)
+    keep[offsets[1:][closed] - 1] = False
+    vertices, offsets = _packed_select(vertices, offsets, keep)
+
+    vertices, offsets = _remove_duplicates(vertices, offsets)
+    vertices, offsets = _remove_collinear(vertices, offsets)
+    if tolerance > 0:
+        vertices, offsets = _douglas_peucker(vertices, offsets, tolerance)
+
+    # restore closing vertices
+    sizes = numpy.diff(offsets)
+    closed &= sizes > 0
+    new_offsets = numpy.zeros(len(offsets), dtype=numpy.int64)
+    numpy.cumsum(sizes + closed, out=new_offsets[1:])
+    result = numpy.empty((new_offsets[-1], 2))
+    group = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    result[numpy.arange(len(vertices)) + (new_offsets[:-1] - offsets[:-1])[group]] = vertices
+    result[new_offsets[1:][closed] - 1] = vertices[offsets[:-1][closed]]
+    return result, new_offsets
+
+#
+# Path outlines.
+# Paths are given packed like polygons, with one width, path type and
+# pair of extensions per path. Outlines are closed polygons going
+# forward along the left side and back along the right side.
+#
+
+def unpack_polygons(vertices, offsets):
+    """Return list of (k, 2) array views of packed polygons, e.g. for :func:`unions`."""
+    return [vertices[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+
+def path_polygons(points, offsets, widths, path_types=0, bgn_extns=0, end_extns=0,
+        max_chord_error=1., miter_limit=10.):
+    """
+    Return packed outline polygons ``(vertices, offsets)`` of packed
+    paths, with the meaning of :class:`gdsii.elements.Path` fields:
+    path type 0 ends flush with the end points, 1 has round ends, 2
+    extends by half the width and 4 by `bgn_extns` and `end_extns`.
+    `widths`, `path_types` and the extensions are scalars or (m,)
+    arrays; negative widths are used as absolute widths.
+
+    Joins are mitered. Where the miter would be longer than
+    `miter_limit` half widths (turns sharper than about 170 degrees for
+    the default), the outer corner is beveled instead. Round ends are
+    sampled with chords within `max_chord_error` of the arc. Repeated
+    points are ignored; paths with less than two distinct points give
+    empty polygons. Outlines of paths that cross or reverse themselves
+    overlap themselves, so boolean operations on them must use
+    ``fill_type=NONZERO``, e.g. ``unions(polygons, [], fill_type=NONZERO)``
+    for the covered area.
+    """
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    offsets = numpy.asarray(offsets, dtype=numpy.int64)
+    count = len(offsets) - 1
+    widths = numpy.broadcast_to(numpy.abs(numpy.asarray(widths, dtype=float)), (count,))
+    path_types = numpy.broadcast_to(numpy.asarray(path_types, dtype=numpy.int64), (count,))
+    bgn_extns = numpy.broadcast_to(numpy.asarray(bgn_extns, dtype=float), (count,))
+    end_extns = numpy.broadcast_to(numpy.asarray(end_extns, dtype=float), (count,))
+
+    # drop repeated points, then paths with a single point
+    path = numpy.repeat(numpy.arange(count), numpy.diff(offsets))
+    keep = numpy.ones(len(points), dtype=bool)
+    keep[1:] = (points[1:] != points[:-1]).any(axis=1) | (path[1:] != path[:-1])
+    points, offsets = _packed_select(points, offsets, keep)
+    sizes = numpy.diff(offsets)
+    keep = numpy.repeat(sizes >= 2, sizes)
+    points, offsets = _packed_select(points, offsets, keep)
+    sizes = numpy.diff(offsets)
+    path = numpy.repeat(numpy.arange(count), sizes)
+    n = len(points)
+    half = widths / 2.
+
+    # unit direction and left normal of every segment; segment i goes
+    # from point i to point i + 1, the last point of a path has none
+    first = numpy.zeros(n, dtype=bool)
+    last = numpy.zeros(n, dtype=bool)
+    nonempty = sizes > 0
+    first[offsets[:-1][nonempty]] = True
+    last[offsets[1:][nonempty] - 1] = True
+    d = numpy.zeros((n, 2))
+    d[:-1] = points[1:] - points[:-1]
+    d[last] = 0.
+    length = numpy.hypot(d[:, 0], d[:, 1])
+    length[last] = 1.
+    u = d / length[:, None]
+    idx = numpy.arange(n)
+    nxt = numpy.where(last, idx - 1, idx)
+    prv = numpy.where(first, idx, idx - 1)
+    u_next = u[nxt]
+    u_prev = u[prv]
+    n_next = numpy.column_stack((-u_next[:, 1], u_next[:, 0]))
+    n_prev = numpy.column_stack((-u_prev[:, 1], u_prev[:, 0]))
+
+    # extensions move the end points along the path
+    types = path_types[path]
+    bgn = numpy.select([types == 2, types == 4], [half[path], bgn_extns[path]], 0.)
+    end = numpy.select([types == 2, types == 4], [half[path], end_extns[path]], 0.)
+    base = points.copy()
+    base[first] -= u_next[first] * bgn[first][:, None]
+    base[last] += u_prev[last] * end[last][:, None]
+
+    # miter (one point per side) or bevel (two points per side)
+    dot = (n_prev * n_next).sum(axis=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        miter = (n_prev + n_next) / (1. + dot)[:, None]
+    bevel = ~(numpy.hypot(miter[:, 0], miter[:, 1]) <= miter_limit)
+    emitted = 1 + bevel
+    src = numpy.repeat(idx, emitted)
+    second = numpy.zeros(len(src), dtype=bool)
+    second[1:] = src[1:] == src[:-1]
+    direction = numpy.where(bevel[src][:, None], numpy.where(second[:, None], n_next[src], n_prev[src]),
+            miter[src])
+    hw = half[path][src][:, None]
+    left = base[src] + hw * direction
+    right = base[src] - hw * direction
+
+    # round caps: arc points between the sides, without the side points
+    steps = numpy.where(nonempty & (path_types == 1), _arc_steps(half, pi, max_chord_error), 1)
+    caps = numpy.where(nonempty, steps - 1, 0)
+    side = _packed_sum(emitted.astype(numpy.int64), offsets).astype(numpy.int64)
+    poly_sizes = numpy.where(nonempty, 2 * side + 2 * caps + 1, 0)
+    poly_offsets = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(poly_sizes, out=poly_offsets[1:])
+    vertices = numpy.empty((poly_offsets[-1], 2))
+
+    epath = path[src]
+    local = numpy.arange(len(src)) - numpy.repeat(numpy.cumsum(side) - side, side)
+    vertices[poly_offsets[epath] + local] = left
+    vertices[poly_offsets[epath] + side[epath] + caps[epath] + (side[epath] - 1 - local)] = right
+    starts = poly_offsets[:-1]
+    vertices[starts[nonempty] + poly_sizes[nonempty] - 1] = vertices[starts[nonempty]]
+
+    cap_paths = numpy.nonzero(caps)[0]
+    if len(cap_paths):
+        counts = caps[cap_paths]
+        cap = numpy.repeat(numpy.arange(len(cap_paths)), counts)
+        k = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + 1
+        frac = k / steps[cap_paths][cap].astype(float)
+        radius = half[cap_paths][cap]
+        # end caps sweep from the left side to the right side, start
+        # caps from the right side to the left side
+        for (center, normal, pos) in (
+                (offsets[1:][cap_paths] - 1, n_prev, side[cap_paths]),
+                (offsets[:-1][cap_paths], -n_next, 2 * side[cap_paths] + caps[cap_paths])):
+            c = center[cap]
+            theta = numpy.arctan2(normal[c, 1], normal[c, 0]) - pi * frac
+            vertices[poly_offsets[cap_paths][cap] + pos[cap] + k - 1] = (base[c] +
+                    radius[:, None] * numpy.column_stack((cos(theta), sin(theta))))
+    return vertices, poly_offsets
+
+def paths_to_polygons(paths, max_chord_error=1.):
+    """
+    Return packed outline polygons of :class:`gdsii.elements.Path`
+    elements in `paths`, see :func:`path_polygons`. Other elements are
+    skipped. The result can be passed to :func:`unions` with
+    :func:`unpack_polygons` and ``fill_type=NONZERO``.
+    """
+    paths = [p for p in paths if isinstance(p, Path)]
+    points, offsets = pack_polygons(paths)
+    return path_polygons(points, offsets,
+            [p.width or 0 for p in paths], [p.path_type or 0 for p in paths],
+            [p.bgn_extn or 0 for p in paths], [p.end_extn or 0 for p in paths],
+            max_chord_error)
+
+def paths_to_boundaries(paths, max_chord_error=1.):
+    """
+    Return a list of :class:`gdsii.elements.Boundary` elements with the
+    outlines of the :class:`gdsii.elements.Path` elements in `paths`
+    (see :func:`paths_to_polygons`), keeping layer and data type. Paths
+    without outline are skipped.
+    """
+    paths = [p for p in paths if isinstance(p, Path)]
+    vertices, offsets = paths_to_polygons(paths, max_chord_error)
+    vertices = numpy.rint(vertices).astype(numpy.int64)
+    return [Boundary(paths[i].layer, paths[i].data_type, vertices[offsets[i]:offsets[i+1]])
+            for i in range(len(paths)) if offsets[i+1] > offsets[i]]
@@ -1,4 +1,7 @@
-from distutils.core import setup
+from distutils.core import setup, Extension
+from distutils.command.build_ext import build_ext
+from distutils.errors import CCompilerError, DistutilsExecError, \
+        DistutilsPlatformError
 
 long_desc = """
 python-gdsii is a library that can be used to read, create, modify and save
@@ -13,6 +16,24 @@ python-gdsii-raith implements a custom gdsii record for use with drawing curves
 on RAITH electron beam lithography systems.
 """
 
+class optional_build_ext(build_ext):
+    """Build C extensions, but continue without them if the build fails."""
+    def run(self):
+        try:
+            build_ext.run(self)
+        except DistutilsPlatformError as e:
+            self._warn(e)
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except (CCompilerError, DistutilsExecError, DistutilsPlatformError) as e:
+            self._warn(e)
+
+    def _warn(self, e):
+        print('WARNING: building %s failed (%s), pure Python version will be used'
+                % (', '.join(ext.name for ext in self.extensions), e))
+
 setup(
     name = 'python-gdsii-raith',
     version = '0.1.0',
@@ -20,7 +41,13 @@ setup(
     long_description = long_desc,
     url = 'https://github.com/cdoolin/python-gdsii-raith',
     packages = ['gdsii'],
+    ext_modules = [
+        Extension('gdsii._speedups', ['gdsii/_speedups.c']),
+    ],
+    cmdclass = {'build_ext': optional_build_ext},
     scripts = [
+        'scripts/gdsdiff',
+        'scripts/gdsgrep',
         'scripts/gds2txt',
         'scripts/gds2yaml',
         'scripts/txt2gds',
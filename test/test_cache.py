@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from gdsii import utils
+from gdsii.cache import Cache
+from gdsii.elements import Boundary, RaithCircleArray
+from gdsii.structure import Structure
+import numpy
+
+# arguments of computed calls, global so that it is not captured by the
+# cached functions and part of their keys
+calls = []
+
+def make_scaled(cache, k):
+    @cache.memoize
+    def scaled(x):
+        return numpy.arange(x) * k
+    return scaled
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = Cache(self.directory)
+        del calls[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_structures(self):
+        @self.cache.memoize
+        def cell(name, size):
+            calls.append(size)
+            struc = Structure(name)
+            struc.append(Boundary(1, 0, [(0, 0), (size, 0), (size, size), (0, 0)]))
+            struc.append(RaithCircleArray(2, 0, [(0, 0), (10, 0)], 3))
+            return struc
+        first = cell(b'A', 5)
+        second = cell(b'A', 5)
+        cell(b'A', size=6)
+        self.assertEqual(calls, [5, 6])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.assertEqual(second.name, b'A')
+        self.assertEqual(len(second), 3)
+        self.assertEqual(second[0].xy, first[0].xy)
+        self.assertEqual(second[2].center, (10, 0))
+
+    def test_polygons(self):
+        union = self.cache.memoize(utils.union)
+        difference = self.cache.memoize(utils.difference)
+        p1 = utils.rect(10)
+        p2 = utils.rect(4)
+        for func in (union, difference, union):
+            result = func(p1, p2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        numpy.testing.assert_array_equal(result[0], utils.union(p1, p2)[0])
+        self.assertEqual(len(difference(p1, p2)), len(utils.difference(p1, p2)))
+        self.assertEqual(self.cache.call(utils.intersection, p1, p2 + 100), [])
+        vertices, offsets = self.cache.call(utils.pack_polygons, [p1, p2])
+        self.assertEqual(offsets.tolist(), [0, 5, 10])
+
+    def test_version(self):
+        def cell(name):
+            calls.append(name)
+            return Structure(name)
+        self.cache.memoize(cell)(b'A')
+        self.cache.memoize(cell, version=2)(b'A')
+        self.cache.memoize(version=2)(cell)(b'A')
+        self.assertEqual(len(calls), 2)
+
+    def test_errors(self):
+        self.assertRaises(TypeError, self.cache.call, lambda x: 1, object())
+        self.assertRaises(TypeError, self.cache.call, lambda: 1)
+        self.assertRaises(KeyError, self.cache.get, '00')
+        def captures_self():
+            return self
+        self.assertRaises(TypeError, self.cache.call, captures_self)
+
+    def test_closures(self):
+        self.assertEqual(make_scaled(self.cache, 2)(3).tolist(), [0, 2, 4])
+        self.assertEqual(make_scaled(self.cache, 10)(3).tolist(), [0, 10, 20])
+        self.assertEqual(make_scaled(self.cache, 2)(3).tolist(), [0, 2, 4])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        def offset(x, dx=1):
+            return numpy.arange(x) + dx
+        first = self.cache.call(offset, 2)
+        offset.__defaults__ = (5,)
+        self.assertEqual(self.cache.call(offset, 2).tolist(), [5, 6])
+        self.assertEqual(first.tolist(), [1, 2])
+
+    def test_eviction(self):
+        for i in range(5):
+            self.cache.set('%02d' % i, numpy.zeros(200))
+            os.utime(os.path.join(self.directory, '%02d.npz' % i), (i, i))
+        self.cache.max_size = self.cache.size + 100
+        self.cache.get('00')
+        self.cache.set('05', numpy.zeros(200))
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+        self.assertRaises(KeyError, self.cache.get, '01')
+        self.cache.get('00')
+        self.assertEqual(Cache(self.directory).size, self.cache.size)
+        self.cache.clear()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_replace(self):
+        self.cache.set('00', numpy.zeros(200))
+        size = self.cache.size
+        self.cache.set('00', numpy.zeros(200))
+        self.assertEqual(self.cache.size, size)
+        self.assertEqual(Cache(self.directory).size, size)
+
+    def test_corrupt(self):
+        def cell(name):
+            calls.append(name)
+            struc = Structure(name)
+            struc.append(Boundary(1, 0, [(0, 0), (5, 0), (5, 5), (0, 0)]))
+            return struc
+        self.cache.call(cell, b'A')
+        self.cache.call(numpy.arange, 100)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            with open(path, 'rb') as stream:
+                data = stream.read()
+            with open(path, 'wb') as stream:
+                stream.write(data[:len(data) // 2])
+        cache = Cache(self.directory)
+        self.assertEqual(cache.call(cell, b'A')[0].xy[1], (5, 0))
+        self.assertEqual(cache.call(numpy.arange, 100).tolist(), list(range(100)))
+        self.assertEqual(calls, [b'A', b'A'])
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(Cache(self.directory).size, cache.size)
+        self.assertEqual(cache.call(cell, b'A').name, b'A')
+        self.assertEqual(cache.hits, 1)
+
+test_cases = (TestCache,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from gdsii import diff
+from gdsii.library import Library
+from gdsii.structure import Structure
+from gdsii.elements import Boundary, RaithCircle, RaithCircleArray, SRef
+
+def _square(layer, x):
+    return Boundary(layer, 0, [(x, 0), (x + 1, 0), (x + 1, 1), (x, 1), (x, 0)])
+
+def _library(*strucs):
+    lib = Library(5, b'LIB', 1e-9, 0.001)
+    lib.extend(strucs)
+    return lib
+
+def _structure(name, elems):
+    struc = Structure(name)
+    struc.extend(elems)
+    return struc
+
+class TestStructureDiff(unittest.TestCase):
+    def test_order(self):
+        old = _structure(b'A', [_square(1, 0), _square(1, 5), _square(2, 0)])
+        new = _structure(b'A', [_square(2, 0), _square(1, 0), _square(1, 5)])
+        self.assertFalse(diff.diff_structures(old, new))
+
+    def test_boundary_start(self):
+        old = _structure(b'A', [_square(1, 0)])
+        new = _structure(b'A', [Boundary(1, 0, [(1, 1), (1, 0), (0, 0), (0, 1), (1, 1)])])
+        self.assertFalse(diff.diff_structures(old, new))
+
+    def test_layers(self):
+        old = _structure(b'A', [_square(1, 0), _square(1, 0), SRef(b'B', [(0, 0)])])
+        new = _structure(b'A', [_square(1, 0), _square(2, 0), _square(2, 3)])
+        result = diff.diff_structures(old, new)
+        self.assertEqual(len(result.removed), 2)
+        self.assertEqual(result.layers(), {1: (1, 0), 2: (0, 2), None: (1, 0)})
+
+    def test_circles(self):
+        circles = RaithCircleArray(3, 0, [(0, 0), (10, 0)], 5)
+        old = _structure(b'A', [circles])
+        new = _structure(b'A', [RaithCircle(3, 0, (10, 0), 5), RaithCircle(3, 0, (20, 0), 5)])
+        result = diff.diff_structures(old, new)
+        self.assertEqual([c.center for c in result.removed], [(0, 0)])
+        self.assertEqual([c.center for c in result.added], [(20, 0)])
+
+class TestLibraryDiff(unittest.TestCase):
+    def test_diff(self):
+        old = _library(_structure(b'SAME', [_square(1, 0)]),
+                _structure(b'MOVED', [_square(1, 0), _square(2, 0)]),
+                _structure(b'EDIT', [_square(1, 0)]),
+                _structure(b'OLD', [_square(4, 0)]),
+                _structure(b'GONE', [_square(5, 0)]))
+        new = _library(_structure(b'SAME', [_square(1, 0)]),
+                _structure(b'MOVED', [_square(2, 0), _square(1, 0)]),
+                _structure(b'EDIT', [_square(1, 2)]),
+                _structure(b'NEW', [_square(4, 0)]),
+                _structure(b'EXTRA', [_square(6, 0)]))
+        result = diff.diff_libraries(old, new)
+        self.assertTrue(result)
+        self.assertEqual(result.unchanged, [b'SAME'])
+        self.assertEqual(result.reordered, [b'MOVED'])
+        self.assertEqual(list(result.changed), [b'EDIT'])
+        self.assertEqual(result.changed[b'EDIT'].layers(), {1: (1, 1)})
+        self.assertEqual(result.renamed, [(b'OLD', b'NEW')])
+        self.assertEqual(result.removed, [b'GONE'])
+        self.assertEqual(result.added, [b'EXTRA'])
+
+    def test_same(self):
+        lib = _library(_structure(b'A', [_square(1, 0)]))
+        self.assertFalse(diff.diff_libraries(lib, lib))
+
+    def test_reloaded(self):
+        import io
+        import numpy
+        from gdsii import utils
+        circle = utils.circle(1000, max_chord_error=1.) + numpy.array([1e6, 0.5])
+        generated = _library(_structure(b'A', [Boundary(numpy.int64(1), 0, circle),
+                Boundary(2, 0, numpy.array([(0, 0), (5, 0), (5, 5), (0, 0)]))]))
+        stream = io.BytesIO()
+        generated.save(stream)
+        reloaded = Library.load(io.BytesIO(stream.getvalue()))
+        self.assertFalse(diff.diff_structures(generated[0], reloaded[0]))
+        reloaded[0].append(_square(3, 0))
+        result = diff.diff_libraries(generated, reloaded)
+        self.assertEqual(result.changed[b'A'].layers(), {3: (0, 1)})
+
+test_cases = (TestStructureDiff, TestLibraryDiff)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import io
+import unittest
+from gdsii import exceptions, fracture, utils
+from gdsii.elements import Boundary, Path
+from gdsii.library import Library
+from gdsii.structure import Structure
+import numpy
+
+def _area(polygons):
+    return abs(utils.polygon_areas(*utils.pack_polygons(polygons))).sum()
+
+class TestFracturePolygon(unittest.TestCase):
+    def test_circle(self):
+        circle = numpy.rint(utils.circle(10000, npoints=1000)).astype(int)
+        pieces = fracture.fracture_polygon(circle, max_points=100)
+        self.assertGreater(len(pieces), 10)
+        for piece in pieces:
+            self.assertLessEqual(len(piece), 100)
+            self.assertEqual(piece[0].tolist(), piece[-1].tolist())
+        # points where cuts cross edges are rounded to integers
+        self.assertAlmostEqual(_area(pieces) / _area([circle]), 1., places=5)
+
+    def test_ring(self):
+        ring = numpy.rint(utils.ring(500, 1000, npoints=200)).astype(int)
+        pieces = fracture.fracture_polygon(ring, max_points=50)
+        for piece in pieces:
+            self.assertLessEqual(len(piece), 50)
+        self.assertAlmostEqual(_area(pieces) / _area([ring]), 1., places=4)
+
+class TestFractureSave(unittest.TestCase):
+    def setUp(self):
+        self.lib = Library(5, b'LIB', 1e-9, 0.001)
+        struc = Structure(b'A')
+        circle = numpy.rint(utils.circle(100000, npoints=20000)).astype(int)
+        self.big = Boundary(1, 2, [tuple(p) for p in circle.tolist()])
+        struc.append(self.big)
+        struc.append(Boundary(3, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+        self.lib.append(struc)
+
+    def test_check(self):
+        self.assertEqual(fracture.oversized_elements(self.lib[0]), [0])
+        stream = io.BytesIO()
+        self.assertRaises(exceptions.FormatError, self.lib.save, stream)
+        self.assertEqual(stream.getvalue(), b'')
+
+    def test_fracture(self):
+        stream = io.BytesIO()
+        self.lib.save(stream, fracture=True)
+        self.assertEqual(len(self.lib[0]), 2)
+        stream.seek(0)
+        struc = Library.load(stream)[0]
+        self.assertGreater(len(struc), 3)
+        self.assertEqual(set((e.layer, e.data_type) for e in struc[:-1]), set([(1, 2)]))
+        self.assertAlmostEqual(_area(struc[:-1]) / _area([self.big]), 1., places=6)
+        self.assertEqual(struc[-1].layer, 3)
+
+    def test_path(self):
+        self.lib[0].append(Path(1, 0, [(i, 0) for i in range(fracture.MAX_POINTS + 1)]))
+        stream = io.BytesIO()
+        self.assertRaises(exceptions.FormatError, self.lib.save, stream, fracture=True)
+        self.assertEqual(stream.getvalue(), b'')
+
+test_cases = (TestFracturePolygon, TestFractureSave)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from gdsii import exceptions, grep
+from gdsii.elements import ARef, Boundary, SRef, Text
+from gdsii.library import Library
+from gdsii.structure import Structure
+
+def _library():
+    lib = Library(5, b'LIB', 1e-9, 0.001)
+    pad = Structure(b'PAD')
+    pad.append(Boundary(63, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+    top = Structure(b'TOP')
+    top.append(SRef(b'PAD', [(0, 0)]))
+    top.append(ARef(b'PAD', 2, 2, [(0, 0), (20, 0), (0, 20)]))
+    top.append(SRef(b'VIA', [(5, 5)]))
+    top.append(Text(1, 0, [(100, 200)], b'ALIGN_A'))
+    top.append(Text(1, 0, [(300, 400)], b'LABEL'))
+    top.append(Boundary(63, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+    top.append(Boundary(2, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+    lib.extend((pad, top))
+    stream = io.BytesIO()
+    lib.save(stream)
+    return stream.getvalue()
+
+class TestGrep(unittest.TestCase):
+    def setUp(self):
+        self.data = _library()
+
+    def test_references(self):
+        matches = grep.grep_buffer(self.data, references=['PAD'])
+        self.assertEqual(matches, [grep.Match(None, b'TOP', grep.REFERENCE, b'PAD', 2)])
+        matches = grep.grep_buffer(self.data, references=[b'*A*'])
+        self.assertEqual(sorted(m.value for m in matches), [b'PAD', b'VIA'])
+
+    def test_texts(self):
+        matches = grep.grep_buffer(self.data, texts=['ALIGN*', 'NONE'])
+        self.assertEqual(matches, [grep.Match(None, b'TOP', grep.TEXT, b'ALIGN_A', 1, (100, 200))])
+
+    def test_layers(self):
+        matches = grep.grep_buffer(self.data, layers=[63, 2])
+        self.assertEqual([(m.structure, m.value, m.count) for m in matches],
+                [(b'PAD', 63, 1), (b'TOP', 2, 1), (b'TOP', 63, 1)])
+
+    def test_truncated(self):
+        for size in (len(self.data) - 4, len(self.data) // 2, 10):
+            self.assertRaises(exceptions.FormatError, grep.grep_buffer, self.data[:size],
+                    texts=['ALIGN*'])
+
+    def test_files(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(directory, '%d.gds' % i) for i in range(3)]
+            for path in paths:
+                with open(path, 'wb') as stream:
+                    stream.write(self.data)
+            matches = grep.grep(paths, texts=['LABEL'], workers=2)
+            self.assertEqual([m.path for m in matches], paths)
+            self.assertEqual(grep.grep(paths, texts=['LABEL'], workers=1), matches)
+
+            with open(paths[1], 'wb') as stream:
+                stream.write(self.data[:len(self.data) // 2])
+            missing = os.path.join(directory, 'missing.gds')
+            self.assertRaises(exceptions.FormatError, grep.grep, paths, texts=['LABEL'],
+                    workers=1)
+            errors = []
+            matches = grep.grep(paths + [missing], texts=['LABEL'], workers=2, errors=errors)
+            self.assertEqual([m.path for m in matches], [paths[0], paths[2]])
+            self.assertEqual([path for (path, error) in errors], [paths[1], missing])
+            self.assertIsInstance(errors[0][1], exceptions.EndOfFileError)
+            self.assertIsInstance(errors[1][1], EnvironmentError)
+        finally:
+            shutil.rmtree(directory)
+
+test_cases = (TestGrep,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
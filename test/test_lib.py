@@ -1,5 +1,8 @@
 import unittest
-from gdsii import library, elements
+from gdsii import library, elements, exceptions, instrument, structure, tags
+from io import BytesIO
+import gdsii.progress
+import math
 import os.path
 
 class TestLibraryLoad(unittest.TestCase):
@@ -47,7 +50,522 @@ class TestLibraryLoad(unittest.TestCase):
         self.assertEqual(elem.properties[0], (1, b'test property 1'))
         self.assertEqual(elem.properties[1], (2, b'test property 2'))
 
-test_cases = (TestLibraryLoad,)
+class TestIOStats(unittest.TestCase):
+    def setUp(self):
+        self.file_name = os.path.join(os.path.dirname(__file__), 'data', 'test1.gds')
+
+    def test_load(self):
+        done = []
+        stats = instrument.IOStats(callback=lambda *args: done.append(args))
+        with open(self.file_name, 'rb') as stream:
+            library.Library.load(stream, stats=stats)
+        self.assertEqual(stats.records[tags.PROPATTR], 2)
+        self.assertEqual(stats.elements, {'Boundary': 1, 'Path': 1})
+        self.assertEqual(stats.element_bytes['Boundary'], 64)
+        self.assertEqual([name for (name, seconds, size) in done], [b'test_struc1'])
+        self.assertTrue(stats.report())
+
+    def test_save(self):
+        with open(self.file_name, 'rb') as stream:
+            data = stream.read()
+        lib = library.Library.load(BytesIO(data))
+        stats = instrument.IOStats()
+        stream = BytesIO()
+        lib.save(stream, stats=stats)
+        self.assertEqual(stream.getvalue(), data)
+        self.assertEqual(stats.element_bytes['Path'], 122)
+        self.assertEqual(stats.structure_bytes[b'test_struc1'], 234)
+
+class TestRaithCircles(unittest.TestCase):
+    def make_library(self, elems):
+        lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        struc = structure.Structure(b'circles')
+        struc.extend(elems)
+        lib.append(struc)
+        stream = BytesIO()
+        lib.save(stream)
+        return stream.getvalue()
+
+    def test_roundtrip(self):
+        circle = elements.RaithCircle(1, 1000, (10, -20), 300, verts=32,
+                filled=False, width=15, arced=True, arc=(0, 3141592))
+        lib = library.Library.load(BytesIO(self.make_library([circle])))
+        loaded = lib[0][0]
+        self.assertEqual(loaded.xy, circle.xy)
+        self.assertEqual(loaded.center, (10, -20))
+        self.assertEqual(loaded.verts, 32)
+        self.assertTrue(loaded.arced)
+        self.assertFalse(loaded.filled)
+        loaded.verts = 16
+        loaded.ellipse = True
+        self.assertEqual(loaded.xy[3], (16, 5))
+
+    def test_array(self):
+        circles = [elements.RaithCircle(i, 1000 + i, (i, 2 * i), 10 + i, width=i)
+                for i in range(5)]
+        array = elements.RaithCircleArray.from_circles(circles)
+        self.assertEqual(self.make_library([array]), self.make_library(circles))
+        self.assertEqual(array[2].xy, circles[2].xy)
+        built = elements.RaithCircleArray(range(5), [1000 + i for i in range(5)],
+                [(i, 2 * i) for i in range(5)], [10 + i for i in range(5)], width=range(5))
+        self.assertEqual(self.make_library([built]), self.make_library(circles))
+
+class TestLayerStats(unittest.TestCase):
+    def setUp(self):
+        self.lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        leaf = structure.Structure(b'leaf')
+        leaf.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]))
+        path = elements.Path(2, 0, [(0, 0), (100, 0)])
+        path.width = 4
+        leaf.append(path)
+        leaf.append(elements.RaithCircle(3, 1000, (0, 0), 10, verts=16))
+        leaf.append(elements.RaithCircleArray(3, 1000, [(0, 0), (50, 0)], 10, verts=16))
+        mid = structure.Structure(b'mid')
+        sref = elements.SRef(b'leaf', [(0, 0)])
+        sref.mag = 2.0
+        mid.append(sref)
+        mid.append(elements.ARef(b'leaf', 3, 2, [(0, 0), (300, 0), (0, 200)]))
+        top = structure.Structure(b'top')
+        top.append(elements.SRef(b'mid', [(0, 0)]))
+        top.append(elements.SRef(b'mid', [(1000, 0)]))
+        top.append(elements.SRef(b'missing', [(0, 0)]))
+        top.append(elements.Boundary(1, 0, [(0, 0), (5, 0), (0, 5), (0, 0)]))
+        self.lib.extend([leaf, mid, top])
+
+    def test_leaf(self):
+        stats = self.lib.stats(b'leaf')
+        self.assertEqual(sorted(stats), [1, 2, 3])
+        self.assertEqual(stats[1].polygons, 1)
+        self.assertEqual(stats[1].vertices, 4)
+        self.assertEqual(stats[1].area, 100)
+        self.assertEqual(stats[2].paths, 1)
+        self.assertEqual(stats[2].area, 400)
+        self.assertEqual(stats[3].circles, 3)
+        self.assertEqual(stats[3].vertices, 48)
+        self.assertAlmostEqual(stats[3].area, 300 * math.pi)
+
+    def test_hierarchy(self):
+        stats = self.lib.stats('top')
+        # 2 * (1 + 6) instances of leaf, area of one of them scaled by 4
+        self.assertEqual(stats[1].polygons, 15)
+        self.assertEqual(stats[1].vertices, 14 * 4 + 3)
+        self.assertEqual(stats[1].area, 2 * (4 + 6) * 100 + 12.5)
+        self.assertEqual(stats[3].circles, 42)
+
+    def test_cache(self):
+        self.lib.stats(b'top')
+        self.lib[0].append(elements.Boundary(1, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+        self.assertEqual(self.lib.stats(b'leaf')[1].polygons, 2)
+        # changes to elements are not tracked
+        self.lib[0][0].layer = 5
+        self.assertEqual(self.lib.stats(b'leaf')[1].polygons, 2)
+        self.assertEqual(self.lib.stats(b'leaf', refresh=True)[1].polygons, 1)
+
+    def test_errors(self):
+        self.assertRaises(KeyError, self.lib.stats, b'nothing')
+        self.lib[0].append(elements.SRef(b'top', [(0, 0)]))
+        self.assertRaises(ValueError, self.lib.stats, b'top', True)
+
+class TestIncrementalSave(unittest.TestCase):
+    def setUp(self):
+        lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        for name in (b'a', b'b', b'c'):
+            struc = structure.Structure(name)
+            struc.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 10), (0, 0)]))
+            lib.append(struc)
+        stream = BytesIO()
+        lib.save(stream)
+        self.data = stream.getvalue()
+        self.lib = library.Library.load(BytesIO(self.data))
+
+    def save(self, lib, **kwargs):
+        stream = BytesIO()
+        lib.save(stream, **kwargs)
+        return stream.getvalue()
+
+    def test_tracking(self):
+        struc = self.lib[1]
+        self.assertFalse(struc.modified)
+        version = struc.version
+        struc.strclass = 2
+        self.assertTrue(struc.modified)
+        self.assertTrue(struc.version > version)
+        version = struc.version
+        struc.sort(key=lambda elem: elem.layer)
+        self.assertNotEqual(struc.version, version)
+        version = struc.version
+        del struc[:]
+        self.assertNotEqual(struc.version, version)
+        self.assertTrue(structure.Structure(b'new').modified)
+
+    def test_cached_data(self):
+        from gdsii import contenthash
+        struc = self.lib[1]
+        before = contenthash.local_hash(struc)
+        struc.append(elements.Boundary(5, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+        struc.append(elements.Boundary(6, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+        changed = contenthash.local_hash(struc)
+        self.assertNotEqual(changed, before)
+        struc.pop()
+        self.assertNotEqual(contenthash.local_hash(struc), changed)
+
+    def test_verify(self):
+        self.lib[1][0].xy = [(0, 0), (7, 0), (7, 7), (0, 0)]
+        expected = self.save(self.lib)
+        self.assertNotEqual(self.save(self.lib, source=BytesIO(self.data)), expected)
+        self.assertFalse(self.lib[1].modified)
+        self.assertEqual(self.save(self.lib, source=BytesIO(self.data), verify=True), expected)
+        self.assertTrue(self.lib[1].modified)
+        self.assertFalse(self.lib[2].modified)
+        # the first verified save compares with the file, later ones
+        # compare element and XY identities
+        self.lib[2][0].layer = 9
+        self.lib[2][0].xy = list(self.lib[2][0].xy)
+        expected = self.save(self.lib)
+        self.assertEqual(self.save(self.lib, source=BytesIO(self.data), verify=True), expected)
+        self.assertTrue(self.lib[2].modified)
+
+    def test_verify_in_place(self):
+        self.assertEqual(len(self.lib[1]._source), 3)
+        self.lib[1][0].layer = 9
+        expected = self.save(self.lib)
+        self.assertEqual(self.save(self.lib, source=BytesIO(self.data), verify=True), expected)
+        self.assertTrue(self.lib[1].modified)
+        self.assertFalse(self.lib[2].modified)
+        self.assertEqual(len(self.lib[2]._source), 4)
+
+    def test_copy(self):
+        self.lib[1][0].layer = 7
+        self.lib[1].touch()
+        self.lib.insert(0, structure.Structure(b'new', self.lib[0].mod_time, self.lib[0].acc_time))
+        expected = self.save(self.lib)
+        self.assertEqual(self.save(self.lib, source=BytesIO(self.data)), expected)
+        stats = instrument.IOStats()
+        self.assertEqual(self.save(self.lib, source=BytesIO(self.data), stats=stats), expected)
+        self.assertEqual(len(stats.structure_bytes), 4)
+
+    def test_files(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        src_name = os.path.join(directory, 'src.gds')
+        out_name = os.path.join(directory, 'out.gds')
+        try:
+            with open(src_name, 'wb') as stream:
+                stream.write(self.data)
+            with open(src_name, 'rb') as stream:
+                lib = library.Library.load(stream)
+            lib[2].append(elements.Boundary(2, 0, [(0, 0), (5, 0), (5, 5), (0, 0)]))
+            with open(src_name, 'rb') as src:
+                with open(out_name, 'wb') as out:
+                    lib.save(out, source=src)
+                self.assertRaises(ValueError, lib.save, BytesIO(), source=BytesIO(self.data[:-4]))
+                with open(src_name, 'r+b') as out:
+                    self.assertRaises(ValueError, lib.save, out, source=src)
+            with open(out_name, 'rb') as stream:
+                self.assertEqual(stream.read(), self.save(lib))
+        finally:
+            for name in (src_name, out_name):
+                if os.path.exists(name):
+                    os.remove(name)
+            os.rmdir(directory)
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        for i in range(20):
+            struc = structure.Structure(('s%d' % i).encode())
+            struc.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 10), (0, 0)]))
+            lib.append(struc)
+        self.lib = lib
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'lib.gds')
+        with open(self.path, 'wb') as stream:
+            lib.save(stream)
+        self.size = os.path.getsize(self.path)
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def test_load(self):
+        events = []
+        with open(self.path, 'rb') as stream:
+            library.Library.load(stream, progress=lambda *args: events.append(args))
+        self.assertEqual(len(events), 20)
+        self.assertEqual(events[-1], (self.size - 4, self.size, 20))
+
+    def test_cancel(self):
+        def progress(done, total, count):
+            if count == 3:
+                raise exceptions.Cancelled
+        with open(self.path, 'rb') as stream:
+            self.assertRaises(exceptions.Cancelled, library.Library.load, stream,
+                    progress=progress)
+        events = []
+        self.lib.save(BytesIO(), progress=lambda *args: events.append(args))
+        self.assertEqual(events[-1], (self.size - 4, None, 20))
+
+    def test_interval(self):
+        struc = self.lib[0]
+        struc.extend(elements.Boundary(2, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]) for i in range(9))
+        events = []
+        progress = gdsii.progress.Progress(lambda *args: events.append(args), interval=4)
+        stream = BytesIO()
+        self.lib.save(stream, progress=progress)
+        # two calls within the first structure, then one per structure
+        self.assertEqual([count for (done, total, count) in events[:4]], [0, 0, 1, 2])
+        self.assertEqual(len(events), 22)
+        events = []
+        library.Library.load(BytesIO(stream.getvalue()), progress=progress)
+        self.assertEqual(len(events), 22)
+        self.assertEqual(progress.fraction, events[-1][0] / float(events[-1][1]))
+
+        progress.cancel()
+        self.assertTrue(progress.cancelled)
+        self.assertRaises(exceptions.Cancelled, library.Library.load,
+                BytesIO(stream.getvalue()), progress=progress)
+        self.assertEqual(progress.structures_done, 0)
+
+    def test_interval_with_stats(self):
+        struc = self.lib[0]
+        struc.extend(elements.Boundary(2, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]) for i in range(9))
+        events = []
+        progress = gdsii.progress.Progress(lambda *args: events.append(args), interval=4)
+        stream = BytesIO()
+        stats = instrument.IOStats()
+        self.lib.save(stream, stats=stats, progress=progress)
+        self.assertEqual([count for (done, total, count) in events[:4]], [0, 0, 1, 2])
+        self.assertEqual(stats.elements['Boundary'], 9 + 20)
+        events = []
+        stats = instrument.IOStats()
+        library.Library.load(BytesIO(stream.getvalue()), stats=stats, progress=progress)
+        self.assertEqual(len(events), 22)
+        self.assertEqual(stats.elements['Boundary'], 9 + 20)
+
+    def test_async(self):
+        import asyncio
+        out = os.path.join(self.directory, 'out.gds')
+        events = []
+        async def convert():
+            lib = await library.Library.aload(self.path, progress=lambda *args: events.append(args))
+            lib[0].touch()
+            await lib.asave(out, source=self.path)
+        asyncio.run(convert())
+        self.assertEqual(len(events), 20)
+        with open(out, 'rb') as stream:
+            with open(self.path, 'rb') as original:
+                self.assertEqual(stream.read(), original.read())
+
+        async def cancel():
+            task = asyncio.ensure_future(self.lib.asave(out,
+                    progress=lambda *args: task.cancel()))
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+        self.assertTrue(asyncio.run(cancel()))
+
+class TestHierarchy(unittest.TestCase):
+    def setUp(self):
+        self.lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        for name, refs in ((b'leaf', []), (b'mid', [b'leaf', b'leaf']),
+                (b'top', [b'mid', b'leaf', b'gone']), (b'other', [])):
+            struc = structure.Structure(name)
+            for ref in refs:
+                struc.append(elements.SRef(ref, [(0, 0)]))
+            self.lib.append(struc)
+        self.lib[2].append(elements.ARef(b'mid', 2, 3, [(0, 0), (10, 0), (0, 10)]))
+
+    def test_lookup(self):
+        self.assertIs(self.lib.structure(b'mid'), self.lib[1])
+        self.assertIs(self.lib.structure('top'), self.lib[2])
+        self.assertRaises(KeyError, self.lib.structure, b'gone')
+        self.lib[3].name = b'gone'
+        self.assertIs(self.lib.structure(b'gone'), self.lib[3])
+        del self.lib[0]
+        self.assertRaises(KeyError, self.lib.structure, b'leaf')
+
+    def test_graph(self):
+        graph = self.lib.hierarchy()
+        self.assertEqual(graph.children(b'top'), {b'mid': 7, b'leaf': 1, b'gone': 1})
+        self.assertEqual(graph.parents('leaf'), {b'mid': 2, b'top': 1})
+        self.assertEqual(graph.top_cells(), [b'top', b'other'])
+        self.assertEqual(graph.missing, set([b'gone']))
+        self.assertEqual(graph.descendants(b'top'), set([b'mid', b'leaf', b'gone']))
+        order = graph.topological_order()
+        self.assertEqual(sorted(order), sorted([b'leaf', b'mid', b'top', b'other']))
+        self.assertTrue(order.index(b'leaf') < order.index(b'mid') < order.index(b'top'))
+
+    def test_cache(self):
+        graph = self.lib.hierarchy()
+        self.assertIs(self.lib.hierarchy(), graph)
+        self.lib[3].append(elements.SRef(b'top', [(0, 0)]))
+        graph = self.lib.hierarchy()
+        self.assertEqual(graph.top_cells(), [b'other'])
+        self.lib.append(structure.Structure(b'new'))
+        self.assertEqual(self.lib.hierarchy().top_cells(), [b'other', b'new'])
+        self.lib[0].append(elements.SRef(b'top', [(0, 0)]))
+        self.assertRaises(ValueError, self.lib.hierarchy().topological_order)
+
+    def check(self, lib):
+        from gdsii import hierarchy
+        graph = lib.hierarchy()
+        expected = hierarchy.Hierarchy(lib)
+        self.assertEqual(sorted(graph.structures), sorted(expected.structures))
+        for name in expected.structures:
+            self.assertIs(graph.structures[name], expected.structures[name])
+            self.assertIs(lib.structure(name), expected.structures[name])
+            self.assertEqual(graph.children(name), expected.children(name))
+            self.assertEqual(graph.parents(name), expected.parents(name))
+        self.assertEqual(graph.missing, expected.missing)
+        self.assertEqual(graph.top_cells(), expected.top_cells())
+
+    check_probability = 0.5
+
+    def test_updates(self):
+        import random
+        rand = random.Random(1)
+        lib = self.lib
+        graph = lib.hierarchy()
+        names = [b'leaf', b'mid', b'top', b'other', b'gone', b'new']
+        def make():
+            struc = structure.Structure(rand.choice(names))
+            for i in range(rand.randrange(3)):
+                struc.append(elements.SRef(rand.choice(names), [(0, 0)]))
+            return struc
+        operations = [
+            lambda: lib.append(make()),
+            lambda: lib.extend([make(), make()]),
+            lambda: lib.insert(rand.randrange(len(lib) + 1), make()),
+            lambda: lib.pop(rand.randrange(len(lib))) if lib else None,
+            lambda: lib.remove(lib[rand.randrange(len(lib))]) if lib else None,
+            lambda: lib.__delitem__(slice(0, 2)),
+            lambda: lib.__setitem__(rand.randrange(len(lib)), make()) if lib else None,
+            lambda: lib.__setitem__(slice(1, 3), [make()]),
+            lambda: lib.reverse(),
+            lambda: lib.sort(key=lambda struc: struc.name),
+            lambda: lib.append(lib[0]) if lib else None,
+            lambda: setattr(rand.choice(lib), 'name', rand.choice(names)) if lib else None,
+            lambda: rand.choice(lib).append(elements.SRef(rand.choice(names), [(0, 0)]))
+                    if lib else None,
+            lambda: rand.choice(lib).clear() if lib else None,
+        ]
+        for i in range(400):
+            rand.choice(operations)()
+            if rand.random() < self.check_probability:
+                self.check(lib)
+        self.check(lib)
+        self.assertIs(lib.hierarchy(), graph)
+        lib.clear()
+        self.check(lib)
+
+    def test_independent(self):
+        import copy
+        graph = self.lib.hierarchy()
+        other = library.Library(5, b'OTHER', 1e-9, 0.001)
+        other.append(self.lib[2])
+        other.hierarchy()
+        other[0].append(elements.SRef(b'other', [(0, 0)]))
+        self.assertIs(self.lib.hierarchy(), graph)
+        self.assertEqual(graph.parents(b'other'), {b'top': 1})
+        self.check(other)
+        del self.lib[2]
+        self.assertEqual(self.lib.hierarchy().top_cells(), [b'mid', b'other'])
+        other[0].name = b'renamed'
+        self.check(self.lib)
+        self.check(other)
+        clone = copy.copy(self.lib)
+        clone.append(structure.Structure(b'copied'))
+        self.check(clone)
+        self.assertRaises(KeyError, self.lib.structure, b'copied')
+
+class TestExtract(unittest.TestCase):
+    def setUp(self):
+        lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        for name, refs in ((b'leaf', []), (b'other', []), (b'mid', [b'leaf']),
+                (b'top', [b'mid', b'external']), (b'unused', [b'other'])):
+            struc = structure.Structure(name)
+            struc.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 10), (0, 0)]))
+            for ref in refs:
+                struc.append(elements.ARef(ref, 2, 2, [(0, 0), (10, 0), (0, 10)]))
+            lib.append(struc)
+        self.lib = lib
+        stream = BytesIO()
+        lib.save(stream)
+        self.data = stream.getvalue()
+
+    def extract(self, stream, names):
+        out = BytesIO()
+        extracted = library.Library.extract(stream, names, out)
+        expected = library.Library(5, b'TEST.DB', 1e-9, 0.001, self.lib.mod_time, self.lib.acc_time)
+        expected.extend(struc for struc in self.lib if struc.name in extracted)
+        expected_stream = BytesIO()
+        expected.save(expected_stream)
+        self.assertEqual(out.getvalue(), expected_stream.getvalue())
+        return extracted
+
+    def test_closure(self):
+        self.assertEqual(self.extract(BytesIO(self.data), [b'top']), [b'leaf', b'mid', b'top'])
+        self.assertEqual(self.extract(BytesIO(self.data), ['unused', 'leaf']),
+                [b'leaf', b'other', b'unused'])
+        self.assertRaises(KeyError, library.Library.extract, BytesIO(self.data),
+                [b'external'], BytesIO())
+
+    def test_file(self):
+        import tempfile
+        with tempfile.TemporaryFile() as stream:
+            stream.write(b'junk' + self.data)
+            stream.seek(4)
+            self.assertEqual(self.extract(stream, [b'mid']), [b'leaf', b'mid'])
+
+    def test_truncated(self):
+        self.assertRaises(exceptions.EndOfFileError, library.Library.extract,
+                BytesIO(self.data[:-4]), [b'top'], BytesIO())
+
+class TestContentHash(unittest.TestCase):
+    def make_library(self, leaf_layer=1):
+        lib = library.Library(5, b'TEST.DB', 1e-9, 0.001)
+        for name, refs in ((b'leaf', []), (b'mid', [b'leaf']), (b'top', [b'mid']),
+                (b'other', [])):
+            struc = structure.Structure(name)
+            struc.append(elements.Boundary(leaf_layer if name == b'leaf' else 1, 0,
+                [(0, 0), (10, 0), (10, 10), (0, 0)]))
+            for ref in refs:
+                struc.append(elements.SRef(ref, [(0, 0)]))
+            lib.append(struc)
+        return lib
+
+    def test_equal(self):
+        lib = self.make_library()
+        stream = BytesIO()
+        lib.save(stream)
+        loaded = library.Library.load(BytesIO(stream.getvalue()))
+        loaded[0].mod_time = loaded[0].mod_time.replace(year=2001)
+        for name in (b'leaf', b'mid', b'top'):
+            self.assertEqual(len(lib.content_hash(name)), 32)
+            self.assertEqual(lib.content_hash(name), loaded.content_hash(name))
+        # names of structures themselves are not hashed
+        self.assertEqual(lib.content_hash(b'other'), lib.content_hash(b'leaf'))
+
+    def test_change(self):
+        lib = self.make_library()
+        changed = self.make_library(leaf_layer=2)
+        self.assertEqual(lib.content_hash(b'other'), changed.content_hash(b'other'))
+        for name in (b'leaf', b'mid', b'top'):
+            self.assertNotEqual(lib.content_hash(name), changed.content_hash(name))
+        before = lib.content_hash(b'top')
+        lib[0][0].layer = 2
+        self.assertEqual(lib.content_hash(b'top'), before)
+        lib[0].touch()
+        self.assertEqual(lib.content_hash(b'top'), changed.content_hash(b'top'))
+        lib[1].strclass = 1
+        self.assertNotEqual(lib.content_hash(b'top'), changed.content_hash(b'top'))
+        self.assertRaises(KeyError, lib.content_hash, b'missing')
+
+test_cases = (TestLibraryLoad, TestIOStats, TestRaithCircles, TestLayerStats,
+        TestIncrementalSave, TestProgress, TestHierarchy, TestExtract, TestContentHash)
 
 def load_tests(loader, tests, pattern):
     suite = unittest.TestSuite()
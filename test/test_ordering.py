@@ -0,0 +1,77 @@
+import unittest
+from gdsii import ordering, structure
+from gdsii.elements import Boundary, RaithCircle, RaithCircleArray, SRef
+import numpy
+
+class TestKeys(unittest.TestCase):
+    def setUp(self):
+        self.points = numpy.array([(x, y) for x in range(8) for y in range(8)])
+
+    def test_hilbert(self):
+        order = ordering.spatial_order(self.points)
+        steps = numpy.abs(numpy.diff(self.points[order], axis=0)).sum(axis=1)
+        # consecutive points of a Hilbert curve are neighbours
+        self.assertEqual(set(steps.tolist()), set([1]))
+
+    def test_morton(self):
+        keys = ordering.morton_keys(self.points, bits=3)[:4]
+        self.assertEqual(keys.tolist(), [0, 2, 8, 10])
+        self.assertRaises(ValueError, ordering.spatial_order, self.points, 'peano')
+
+    def test_fields(self):
+        order = ordering.spatial_order(self.points, field_size=4)
+        fields = [(int(y) // 4, int(x) // 4) for x, y in self.points[order]]
+        self.assertEqual(fields[::16], [(0, 0), (0, 1), (1, 1), (1, 0)])
+
+class TestTwoOpt(unittest.TestCase):
+    def test_improves(self):
+        points = numpy.random.RandomState(1).rand(500, 2)
+        order = ordering.spatial_order(points)
+        improved = ordering.two_opt(points, order, window=8, passes=2)
+        self.assertEqual(sorted(improved.tolist()), list(range(500)))
+        self.assertLess(ordering.travel_length(points, improved),
+                ordering.travel_length(points, order))
+
+    def test_crossing(self):
+        points = numpy.array([(0, 0), (1, 1), (1, 0), (0, 1)])
+        self.assertEqual(ordering.two_opt(points).tolist(), [0, 2, 1, 3])
+
+    def test_blocks(self):
+        # one crossing per block, all fixed in the same sweep
+        block = [(0, 0), (1, 1), (1, 0), (0, 1)]
+        points = numpy.array([(x + 10 * i, y) for i in range(50) for (x, y) in block])
+        order = ordering.two_opt(points, window=2)
+        self.assertEqual(order.tolist(), [4 * i + j for i in range(50) for j in (0, 2, 1, 3)])
+        self.assertEqual(sorted(ordering.two_opt(points[:5], window=50).tolist()), list(range(5)))
+
+class TestReorder(unittest.TestCase):
+    def test_structure(self):
+        struc = structure.Structure(b'cell')
+        struc.strclass = 3
+        square = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+        struc.append(Boundary(1, 0, [(x + 1000, y) for x, y in square]))
+        struc.append(RaithCircle(1, 1000, (0, 1000), 10))
+        struc.append(Boundary(1, 0, square))
+        struc.append(SRef(b'other', [(1000, 1000)]))
+        struc.append(RaithCircleArray(1, 1000, [(500, 500), (0, 0), (1000, 1000)], 5))
+        numpy.testing.assert_allclose(ordering.element_positions(struc)[:4],
+                [(1005, 5), (0, 1000), (5, 5), (1000, 1000)])
+        result = ordering.reorder(struc)
+        self.assertEqual(result.name, b'cell')
+        self.assertEqual(result.strclass, 3)
+        self.assertEqual(len(result), 5)
+        self.assertIs(result[0], struc[2])
+        array = [elem for elem in result if isinstance(elem, RaithCircleArray)][0]
+        self.assertEqual(array.centers.tolist(), [[0, 0], [500, 500], [1000, 1000]])
+
+test_cases = (TestKeys, TestTwoOpt, TestReorder)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 from gdsii.record import _parse_real8, _pack_real8, _int_to_real, _real_to_int
-from gdsii import exceptions
+from gdsii.record import _parse_int2, _pack_int2, _parse_int4, _pack_int4
+from gdsii import exceptions, record, tags
+from io import BytesIO
 import struct
 
 class TestReal8(unittest.TestCase):
@@ -53,7 +55,155 @@ class TestReal8(unittest.TestCase):
         for i in range(8):
             self.assertRaises(exceptions.IncorrectDataSize, _parse_real8, b' '*i)
 
-test_cases = (TestReal8,)
+class TestCodecs(unittest.TestCase):
+    def test_int_roundtrip(self):
+        for size in (1, 2, 5, 10, 11, 300):
+            values = tuple(range(-size, size, 2))
+            self.assertEqual(_parse_int2(_pack_int2(values)), values)
+            self.assertEqual(_parse_int4(_pack_int4(values)), values)
+
+    def test_float_values(self):
+        self.assertEqual(_parse_int4(_pack_int4([1.9, -3.0])), (1, -3))
+
+    def test_cache_is_bounded(self):
+        for size in range(1, 2 * record._CODEC_CACHE_SIZE):
+            _pack_int4(range(size))
+        self.assertTrue(len(record._codec_cache) <= record._CODEC_CACHE_SIZE)
+        self.assertEqual(_parse_int4(_pack_int4(range(3))), (0, 1, 2))
+
+class TestReader(unittest.TestCase):
+    def setUp(self):
+        stream = BytesIO()
+        self.records = [
+            record.Record(tags.BOUNDARY),
+            record.Record(tags.LAYER, (1,)),
+            record.Record(tags.XY, list(range(20))),
+            record.Record(tags.STRING, b'abc'),
+            record.Record(tags.ENDEL),
+        ]
+        for rec in self.records:
+            rec.save(stream)
+        self.data = stream.getvalue()
+
+    def test_small_chunks(self):
+        for chunk_size in (1, 3, 7, 1024):
+            gen = record.Reader(BytesIO(self.data), chunk_size)
+            offset = 0
+            for rec in self.records:
+                self.assertEqual(gen.advance(), rec.tag)
+                self.assertEqual(gen.offset, offset)
+                if rec.data is not None:
+                    self.assertEqual(list(gen.data), list(rec.data))
+                offset += self._size(rec)
+            self.assertEqual(gen.peek_tag(), None)
+            self.assertRaises(exceptions.EndOfFileError, gen.advance)
+
+    def test_truncated(self):
+        gen = record.Reader(BytesIO(self.data[:-1]), 8)
+        for rec in self.records[:-1]:
+            gen.advance()
+        self.assertRaises(exceptions.EndOfFileError, gen.advance)
+
+    @staticmethod
+    def _size(rec):
+        stream = BytesIO()
+        rec.save(stream)
+        return len(stream.getvalue())
+
+@unittest.skipIf(record._speedups is None, 'C extension is not built')
+class TestSpeedups(unittest.TestCase):
+    def assertSame(self, py_func, c_func, arg):
+        try:
+            expected = py_func(arg)
+        except Exception as e:
+            self.assertRaises(type(e), c_func, arg)
+        else:
+            self.assertEqual(c_func(arg), expected)
+
+    def test_parse(self):
+        funcs = (
+            (record._parse_bitarray, record._speedups.parse_bitarray),
+            (record._parse_int2, record._speedups.parse_int2),
+            (record._parse_int4, record._speedups.parse_int4),
+            (record._parse_real8, record._speedups.parse_real8),
+            (record._parse_ascii, record._speedups.parse_ascii),
+        )
+        for size in range(0, 34):
+            data = bytes(bytearray((i * 37 + 11) % 256 for i in range(size)))
+            for py_func, c_func in funcs:
+                self.assertSame(py_func, c_func, data)
+
+    def test_pack(self):
+        values = (
+            [], [0], [1, -2, 3.7, -4.2], [32767, -32768], [32768],
+            [2**31 - 1, -2**31], [2**31], ['x'],
+        )
+        for data in values:
+            self.assertSame(record._pack_int2, record._speedups.pack_int2, data)
+            self.assertSame(record._pack_int4, record._speedups.pack_int4, data)
+
+    def test_pack_real8(self):
+        values = [0, 1, -1, 0.5, 1e-9, 1e-70, 1e-80, 123456.789, -1e75, 1e100]
+        for value in values:
+            self.assertSame(record._pack_real8, record._speedups.pack_real8, [value])
+        self.assertSame(record._pack_real8, record._speedups.pack_real8, list(TestReal8.data.values()))
+
+    def test_read_record(self):
+        stream = BytesIO()
+        record.Record(tags.XY, [1, 2, 3, 4]).save(stream)
+        record.Record(tags.STRING, b'abc').save(stream)
+        data = stream.getvalue() + b'\x00\x03\x00\x00'
+        for pos in (0, 20, 28):
+            for end in range(pos, len(data) + 1):
+                self.assertSame(lambda buf: record._py_read_record(buf, pos),
+                        lambda buf: record._speedups.read_record(buf, pos), data[:end])
+
+    def test_scan(self):
+        stream = BytesIO()
+        for tag in (tags.BGNSTR, tags.STRNAME, tags.BOUNDARY, tags.ENDEL, tags.ENDSTR, tags.ENDLIB):
+            record.Record(tag, [1] * 12 if tag == tags.BGNSTR else b'AB' if tag == tags.STRNAME else None).save(stream)
+        data = stream.getvalue() + b'garbage'
+        wanted = frozenset([tags.STRNAME, tags.ENDEL, tags.ENDLIB])
+        for start in (0, 28):
+            self.assertEqual(record._speedups.scan(data, wanted, start),
+                    record._py_scan(data, wanted, start))
+
+    def test_scan_counts(self):
+        stream = BytesIO()
+        for (tag, data) in ((tags.BGNSTR, [1] * 12), (tags.STRNAME, b'AB'),
+                (tags.LAYER, [-3]), (tags.LAYER, [7]), (tags.LAYER, [-3]), (tags.ENDSTR, None),
+                (tags.BGNSTR, [1] * 12), (tags.LAYER, [7]), (tags.ENDSTR, None), (tags.ENDLIB, None)):
+            record.Record(tag, data).save(stream)
+        data = stream.getvalue()
+        wanted = frozenset([tags.STRNAME, tags.ENDSTR])
+        found, end = record._py_scan(data, wanted, 0, tags.LAYER)
+        self.assertEqual([entry for entry in found if entry[2] == tags.LAYER],
+                [(-3, 2, tags.LAYER), (7, 1, tags.LAYER), (7, 1, tags.LAYER)])
+        self.assertEqual([entry[2] for entry in found], [tags.STRNAME, tags.LAYER,
+                tags.LAYER, tags.ENDSTR, tags.LAYER, tags.ENDSTR])
+        self.assertEqual(end, len(data))
+        self.assertEqual(record._speedups.scan(data, wanted, 0, tags.LAYER), (found, end))
+        bad = data.replace(b'\x00\x06\x0d\x02\x00\x07', b'\x00\x04\x0d\x02\x00\x04', 1)
+        for scan in (record._py_scan, record._speedups.scan):
+            self.assertRaises(exceptions.IncorrectDataSize, scan, bad, wanted, 0, tags.LAYER)
+
+class TestIterate(unittest.TestCase):
+    def test_progress(self):
+        stream = BytesIO()
+        recs = [record.Record(tags.BGNSTR, [0] * 12), record.Record(tags.ENDSTR)] * 3
+        for rec in recs + [record.Record(tags.ENDLIB)]:
+            rec.save(stream)
+        size = len(stream.getvalue())
+        events = []
+        def progress(done, total, structures):
+            events.append((done, total, structures))
+        progress.interval = 2
+        stream.seek(0)
+        self.assertEqual(len(list(record.Record.iterate(stream, progress))), 7)
+        self.assertEqual(events, [(32, size, 1), (64, size, 2), (96, size, 3),
+            (100, size, 3)])
+
+test_cases = (TestReal8, TestCodecs, TestReader, TestSpeedups, TestIterate)
 
 def load_tests(loader, tests, pattern):
     suite = unittest.TestSuite()
@@ -0,0 +1,271 @@
+import unittest
+from gdsii import utils
+from gdsii.elements import Boundary, Path, RaithCircle, RaithCircleArray
+from gdsii.structure import Structure
+import numpy
+
+class TestRaithCircles(unittest.TestCase):
+    def setUp(self):
+        self.circles = [
+            RaithCircle(0, 1000, (0, 0), 100, verts=8),
+            RaithCircle(0, 1000, (10, 0), 100, verts=4, filled=False, width=20),
+            RaithCircle(1, 900, (0, 0), 100, verts=4, arced=True, arc=(0, 1570796)),
+            RaithCircle(1, 900, (0, 0), 100, verts=3, arced=True, arc=(0, 1570796),
+                filled=False, width=10),
+        ]
+
+    def test_polygons(self):
+        vertices, offsets = utils.raith_circles_to_polygons(self.circles)
+        self.assertEqual(list(numpy.diff(offsets)), [9, 11, 6, 7])
+        for i in range(len(self.circles)):
+            poly = vertices[offsets[i]:offsets[i+1]]
+            numpy.testing.assert_allclose(poly[0], poly[-1], atol=1e-9)
+        # full circle
+        circle = vertices[offsets[0]:offsets[1]]
+        numpy.testing.assert_allclose(numpy.hypot(circle[:, 0], circle[:, 1]), 100)
+        # ring goes along outer and inner edges
+        ring = vertices[offsets[1]:offsets[2]] - (10, 0)
+        radii = numpy.round(numpy.hypot(ring[:, 0], ring[:, 1]))
+        self.assertEqual(list(radii), [110] * 5 + [90] * 5 + [110])
+        # pie slice includes center
+        numpy.testing.assert_allclose(vertices[offsets[3] - 2], (0, 0))
+
+    def test_ellipse(self):
+        circle = RaithCircle(0, 1000, (0, 0), 100, verts=4, ellipse=True)
+        circle.radii = (100, 50)
+        vertices, offsets = utils.raith_circles_to_polygons([circle])
+        numpy.testing.assert_allclose(vertices[1], (0, 50), atol=1e-9)
+
+    def test_boundaries(self):
+        boundaries = utils.raith_circles_to_boundaries(self.circles + [Boundary(0, 0, [])])
+        self.assertEqual(len(boundaries), 4)
+        self.assertEqual([b.layer for b in boundaries], [0, 0, 1, 1])
+        self.assertEqual(boundaries[2].data_type, 900)
+        self.assertEqual(tuple(boundaries[0].xy[2]), (0, 100))
+
+    def test_array(self):
+        array = RaithCircleArray.from_circles(self.circles)
+        expected = utils.raith_circles_to_polygons(self.circles)
+        vertices, offsets = utils.raith_circles_to_polygons([array])
+        numpy.testing.assert_allclose(vertices, expected[0])
+        self.assertEqual(list(offsets), list(expected[1]))
+
+class TestFBMS(unittest.TestCase):
+    def test_encode(self):
+        points, offsets = utils.fbms_encode([(0, 0), (100, 0), (100, 100), (0, 0), (50, 0)],
+                [0, 3, 5], [0, 20, 0, 0, -10])
+        self.assertEqual(list(offsets), [0, 8, 14])
+        self.assertEqual([tuple(p) for p in points[:8].tolist()],
+                [(0, 0), (0, 0), (0, 0), (0, 0), (2, 100), (0, 20), (1, 100), (100, 0)])
+        self.assertEqual([tuple(p) for p in points[:8].tolist()],
+                utils.to_fbms_path([(0, 0), (100, 0, 20), (100, 100)]))
+
+    def test_decode(self):
+        points, offsets = utils.fbms_encode([(0, 0), (100, 0), (100, 100), (0, 0), (50, 0)],
+                [0, 3, 5], [0, 20, 0, 0, -10])
+        starts, ends, sagittas, segment_offsets = utils.fbms_decode(points, offsets)
+        self.assertEqual(starts.tolist(), [[0, 0], [100, 0], [0, 0]])
+        self.assertEqual(ends.tolist(), [[100, 0], [100, 100], [50, 0]])
+        self.assertEqual(sagittas.tolist(), [20, 0, -10])
+        self.assertEqual(list(segment_offsets), [0, 2, 3])
+        # single element XY
+        starts, ends, sagittas, segment_offsets = utils.fbms_decode(points[8:])
+        self.assertEqual(sagittas.tolist(), [-10])
+
+    def test_sample(self):
+        points, offsets = utils.fbms_encode([(0, 0), (100, 0), (100, 100)], [0, 3], [0, 20, 0])
+        vertices, offsets = utils.fbms_sample(*utils.fbms_decode(points, offsets),
+                max_chord_error=0.01)
+        numpy.testing.assert_allclose(vertices[0], (0, 0))
+        numpy.testing.assert_allclose(vertices[-2:], [(100, 0), (100, 100)])
+        arc = vertices[:-1]
+        # positive sagitta bulges to the left
+        self.assertAlmostEqual(arc[:, 1].max(), 20, delta=0.01)
+        radius = (50 ** 2 + 20 ** 2) / 40.
+        center = numpy.array([50, 20 - radius])
+        numpy.testing.assert_allclose(numpy.hypot(*(arc - center).T), radius)
+        middles = (arc[1:] + arc[:-1]) / 2
+        self.assertLessEqual(radius - numpy.hypot(*(middles - center).T).min(), 0.01)
+
+class TestPolygonMeasures(unittest.TestCase):
+    def setUp(self):
+        self.vertices, self.offsets = utils.pack_polygons([
+            [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)],
+            Boundary(0, 0, [(0, 0), (0, 4), (3, 0)]),
+            [],
+            [(1, 1), (2, 2)],
+        ])
+
+    def test_pack(self):
+        self.assertEqual(list(self.offsets), [0, 5, 8, 8, 10])
+        self.assertEqual(self.vertices.shape, (10, 2))
+
+    def test_area(self):
+        numpy.testing.assert_allclose(utils.polygon_areas(self.vertices, self.offsets),
+                [100, -6, 0, 0])
+        self.assertEqual(list(utils.polygon_orientations(self.vertices, self.offsets)),
+                [1, -1, 0, 0])
+
+    def test_perimeter(self):
+        numpy.testing.assert_allclose(utils.polygon_perimeters(self.vertices, self.offsets),
+                [40, 12, 0, 2 * 2 ** 0.5])
+
+    def test_centroid(self):
+        centroids = utils.polygon_centroids(self.vertices, self.offsets)
+        numpy.testing.assert_allclose(centroids[[0, 1, 3]], [(5, 5), (1, 4 / 3.), (1.5, 1.5)])
+        self.assertTrue(numpy.isnan(centroids[2]).all())
+
+    def test_far_from_origin(self):
+        shift = numpy.array([1e9, -1e9])
+        vertices = self.vertices + shift
+        numpy.testing.assert_allclose(utils.polygon_areas(vertices, self.offsets),
+                [100, -6, 0, 0])
+        centroids = utils.polygon_centroids(vertices, self.offsets)
+        numpy.testing.assert_allclose(centroids[[0, 1, 3]] - shift,
+                [(5, 5), (1, 4 / 3.), (1.5, 1.5)], atol=1e-6)
+
+class TestChordError(unittest.TestCase):
+    def chord_error(self, points, radius):
+        middles = (points[1:] + points[:-1]) / 2.
+        return radius - numpy.hypot(middles[:, 0], middles[:, 1]).min()
+
+    def test_circle(self):
+        small = utils.circle(10, max_chord_error=0.5)
+        large = utils.circle(10000, max_chord_error=0.5)
+        self.assertLess(len(small), 15)
+        self.assertGreater(len(large), 200)
+        for (points, radius) in ((small, 10), (large, 10000)):
+            self.assertLessEqual(self.chord_error(points, radius), 0.5)
+            numpy.testing.assert_allclose(points[0], points[-1], atol=1e-9)
+        # pie slices keep the center
+        self.assertEqual(utils.circle(10, 0, 1, max_chord_error=0.5)[-2].tolist(), [0, 0])
+
+    def test_ring_ellipse(self):
+        ring = utils.ring(90, 100, 0, 2, max_chord_error=0.1)
+        half = len(ring) // 2
+        self.assertLessEqual(self.chord_error(ring[half:-1], 100), 0.1)
+        ellipse = utils.ellipse(100, 20, max_chord_error=0.1)
+        self.assertEqual(len(ellipse), len(utils.circle(100, max_chord_error=0.1)))
+
+    def test_limits(self):
+        self.assertEqual(len(utils.circle(10, max_chord_error=100)), 4)
+        self.assertEqual(len(utils.ring(5, 10, max_chord_error=100)), 9)
+        for error in (0, -1.):
+            self.assertRaises(ValueError, utils.circle, 10, max_chord_error=error)
+            self.assertRaises(ValueError, utils.raith_circles_to_polygons,
+                    [RaithCircle(0, 0, (0, 0), 10)], max_chord_error=error)
+
+    def test_raith_circles(self):
+        circles = [RaithCircle(0, 0, (0, 0), 10), RaithCircle(0, 0, (0, 0), 10000),
+                RaithCircle(0, 0, (0, 0), 1000, arced=True, arc=(0, 1570796))]
+        vertices, offsets = utils.raith_circles_to_polygons(circles, max_chord_error=1.)
+        sizes = numpy.diff(offsets)
+        self.assertLess(sizes[0], 10)
+        self.assertGreater(sizes[1], 100)
+        for i in range(2):
+            points = vertices[offsets[i]:offsets[i + 1]]
+            self.assertLessEqual(self.chord_error(points, circles[i].radii[0]), 1.)
+        arc = vertices[offsets[2]:offsets[3]]
+        self.assertLessEqual(self.chord_error(arc[:-2], 1000), 1.)
+
+class TestSimplify(unittest.TestCase):
+    def test_cleanup(self):
+        polygons = [
+            [(0, 0), (5, 0), (10, 0), (10, 0), (10, 10), (0, 10), (0, 0)],
+            [(0.2, 0.1), (10.1, -0.2), (9.8, 10.3), (0.4, 9.6)],
+            [(3, 3), (3, 3), (3, 3)],
+        ]
+        vertices, offsets = utils.simplify_polygons(*utils.pack_polygons(polygons), grid=1)
+        self.assertEqual(offsets.tolist(), [0, 5, 9, 11])
+        self.assertEqual(vertices[:5].tolist(), [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]])
+        self.assertEqual(vertices[5:9].tolist(), [[0, 0], [10, 0], [10, 10], [0, 10]])
+
+    def test_douglas_peucker(self):
+        circle = utils.circle(1000)
+        vertices, offsets = utils.pack_polygons([circle, utils.rect(10)])
+        result, new_offsets = utils.simplify_polygons(vertices, offsets, 0.001, 1.)
+        simplified = result[new_offsets[0]:new_offsets[1]]
+        self.assertLess(len(simplified), len(circle) // 2)
+        numpy.testing.assert_array_equal(simplified[0], simplified[-1])
+        # every removed vertex is within tolerance of the new outline
+        a, b = simplified[:-1], simplified[1:]
+        d = b - a
+        for point in circle:
+            p = point - a
+            t = numpy.clip((p * d).sum(axis=1) / (d * d).sum(axis=1), 0, 1)
+            dist = numpy.hypot(*(p - t[:, None] * d).T).min()
+            self.assertLessEqual(dist, 1. + 1e-9)
+        numpy.testing.assert_array_equal(result[new_offsets[1]:], utils.rect(10))
+
+    def test_structure(self):
+        struc = Structure(b'A')
+        struc.append(Boundary(1, 0, [(0, 0), (5, 0), (10, 0), (10, 10), (0, 10), (0, 0)]))
+        struc.append(Boundary(1, 0, [(0, 0), (1, 0), (2, 0), (0, 0)]))
+        struc.append(Boundary(2, 0, [(0, 0), (5, 0), (10, 0), (10, 10), (0, 10), (0, 0)]))
+        version = struc.version
+        self.assertEqual(struc.simplify(layers=[1]), 5)
+        self.assertGreater(struc.version, version)
+        self.assertEqual(len(struc), 2)
+        self.assertEqual(struc[0].xy, [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)])
+        self.assertEqual(len(struc[1].xy), 6)
+
+class TestPaths(unittest.TestCase):
+    def path(self, xy, width, path_type=None, bgn_extn=None, end_extn=None):
+        path = Path(1, 2, xy)
+        path.width = width
+        path.path_type = path_type
+        path.bgn_extn = bgn_extn
+        path.end_extn = end_extn
+        return path
+
+    def test_ends(self):
+        paths = [self.path([(0, 0), (10, 0)], 2),
+                self.path([(0, 0), (10, 0)], 2, 2),
+                self.path([(0, 0), (10, 0)], -2, 4, 1, 3),
+                self.path([(0, 0), (10, 0)], 2, 1),
+                self.path([(5, 5), (5, 5)], 2)]
+        vertices, offsets = utils.paths_to_polygons(paths, max_chord_error=0.01)
+        areas = numpy.abs(utils.polygon_areas(vertices, offsets))
+        numpy.testing.assert_allclose(areas[:3], [20, 24, 28])
+        self.assertAlmostEqual(areas[3], 20 + numpy.pi, delta=0.05)
+        self.assertEqual(offsets[-1], offsets[-2])
+        self.assertEqual(vertices[offsets[2]:offsets[3]].min(axis=0).tolist(), [-1, -1])
+
+    def test_miter(self):
+        vertices, offsets = utils.path_polygons([(0, 0), (10, 0), (10, 10)], [0, 3], 2)
+        self.assertEqual(vertices.tolist(), [[0, 1], [9, 1], [9, 10], [11, 10], [11, -1],
+                [0, -1], [0, 1]])
+        # nearly reversing joins are beveled
+        vertices, offsets = utils.path_polygons([(0, 0), (100, 0), (0, 1)], [0, 3], 2)
+        self.assertLess(vertices[:, 0].max(), 102)
+
+    def test_boolean(self):
+        paths = [self.path([(0, 0), (10, 0)], 2), self.path([(5, -5), (5, 5)], 2),
+                Boundary(1, 0, [(0, 0), (1, 0), (1, 1), (0, 0)])]
+        boundaries = utils.paths_to_boundaries(paths)
+        self.assertEqual([(b.layer, b.data_type) for b in boundaries], [(1, 2), (1, 2)])
+        polygons = utils.unpack_polygons(*utils.paths_to_polygons(paths))
+        union = utils.unions(polygons[:1], polygons[1:])
+        self.assertEqual(len(union), 1)
+        self.assertEqual(abs(utils.polygon_areas(*utils.pack_polygons(union))).sum(), 36)
+
+    def test_self_overlap(self):
+        crossing = self.path([(0, 0), (100, 0), (100, 100), (50, 100), (50, -50)], 10)
+        reversing = self.path([(0, 0), (100, 0), (50, 0)], 10)
+        for (path, area) in ((crossing, 3900), (reversing, 1000)):
+            polygons = utils.unpack_polygons(*utils.paths_to_polygons([path]))
+            union = utils.unions(polygons, [], fill_type=utils.NONZERO)
+            self.assertAlmostEqual(utils.polygon_areas(*utils.pack_polygons(union)).sum(), area)
+
+test_cases = (TestRaithCircles, TestChordError, TestFBMS, TestPolygonMeasures,
+        TestSimplify, TestPaths)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()